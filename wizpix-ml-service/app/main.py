@@ -1,23 +1,123 @@
-﻿import os
-from io import BytesIO
+﻿import asyncio
+import dataclasses
+import json
+import os
+import time
 from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
-from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
+from services.animation import (
+    ANIMATED_FORMATS,
+    ANIMATED_MIME,
+    DEFAULT_FRAME_MS,
+    AnimationError,
+    FrameSequence,
+    frame_sort_key,
+)
+
+from services.archive import (
+    ArchiveError,
+    BatchItem,
+    ZipStreamWriter,
+    is_zip_upload,
+    output_name,
+    read_zip_items,
+)
+from services.compositing import BackgroundSpec, parse_hex_color
+from services.jobs import Job, JobNotFoundError, JobQueueFullError, JobRunner, JobStore
+from services.metrics import MetricsRegistry
 from services.pipeline import (
+    AnimationResult,
+    MaskNotFoundError,
     ModelsUnavailableError,
+    RemovalOptions,
+    RemovalResult,
+    UnknownModelError,
     WarmupPendingError,
     pipeline,
 )
+from services.profiling import ProfileSettings, ProfilingUnavailableError
+from services.scheduler import DEFAULT_LANE, InferenceScheduler, QueueFullError, lane_for
+from services.timing import server_timing
+from services.uploads import (
+    MULTIPART_OVERHEAD,
+    BodySizeLimitMiddleware,
+    UploadError,
+    check_image,
+    max_pixels_for,
+    read_upload,
+)
 
 ALLOWED_MIME = {"image/png", "image/jpeg", "image/webp"}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_MAX_ZIP_BYTES = int(os.getenv("BATCH_MAX_ZIP_MB", "200")) * 1024 * 1024
+BATCH_QUEUE_RETRIES = int(os.getenv("BATCH_QUEUE_RETRIES", "30"))
+BATCH_MAX_BODY = max(BATCH_MAX_ZIP_BYTES, BATCH_MAX_FILES * MAX_FILE_SIZE)
+ANIMATION_MAX_FRAMES = int(os.getenv("ANIMATION_MAX_FRAMES", "300"))
 
 app = FastAPI(
     title="WizPix Background API",
     version="1.0.0",
-    description="Microservice FastAPI pour supprimer les arriere-plans (fast rembg ou pipeline pro)",
+    description="Microservice FastAPI pour supprimer les arriere-plans (tiers fast et pro sur ONNX Runtime)",
+)
+
+scheduler = InferenceScheduler.from_env(pipeline)
+job_store = JobStore.from_env()
+profile_settings = ProfileSettings.from_env()
+
+
+def _body_limit(path: str) -> Optional[int]:
+    if path in ("/remove-bg", "/recomposite"):
+        return MAX_FILE_SIZE + MULTIPART_OVERHEAD
+    if path in ("/remove-bg/batch", "/jobs"):
+        return BATCH_MAX_BODY + MULTIPART_OVERHEAD
+    if path == "/remove-bg/animated":
+        return max(MAX_FILE_SIZE, BATCH_MAX_ZIP_BYTES) + MULTIPART_OVERHEAD
+    return None
+
+
+# Added before the metrics middleware so that rejected uploads are still counted.
+app.add_middleware(BodySizeLimitMiddleware, limit_for=_body_limit)
+
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter(
+    "wizpix_requests_total", "Requetes HTTP par route et code de statut.", ("route", "status")
+)
+REQUEST_SECONDS = metrics.histogram(
+    "wizpix_request_duration_seconds", "Duree des requetes HTTP par route.", ("route",)
+)
+STAGE_SECONDS = metrics.histogram(
+    "wizpix_stage_duration_seconds",
+    "Duree de chaque etape du traitement d'une image.",
+    ("stage", "quality", "model"),
+)
+FALLBACKS = metrics.counter(
+    "wizpix_fallbacks_total", "Requetes pro servies par le modele fast.", ("reason",)
+)
+CACHE_RESULTS = metrics.counter(
+    "wizpix_cache_results_total", "Resultats du cache (hit, miss, bypass).", ("result",)
+)
+ERRORS = metrics.counter(
+    "wizpix_errors_total", "Echecs de traitement par route.", ("route",)
+)
+QUEUE_DEPTH = metrics.gauge(
+    "wizpix_queue_depth", "Travaux en attente par file de priorite.", ("lane",)
+)
+QUEUE_WAIT_AVG = metrics.gauge(
+    "wizpix_queue_wait_avg_seconds", "Attente moyenne en file par priorite.", ("lane",)
+)
+IN_FLIGHT = metrics.gauge("wizpix_in_flight", "Travaux en cours d'execution.")
+WORKERS = metrics.gauge("wizpix_workers", "Workers d'inference.")
+JOBS = metrics.gauge("wizpix_jobs", "Taches asynchrones par etat.", ("state",))
+MODELS_RESIDENT = metrics.gauge(
+    "wizpix_model_resident",
+    "Sessions chargees du modele (une par process d'inference).",
+    ("model",),
 )
 
 
@@ -27,63 +127,775 @@ def _str_to_bool(value: str | None, default: bool) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _process_tag(options: RemovalOptions) -> str:
+    model = f":{options.model}" if options.model and options.quality.lower() == "pro" else ""
+    return f"process:{options.quality}{model}{':preview' if options.preview else ''}"
+
+
+def _model_label(options: RemovalOptions, used_fallback: bool = False) -> str:
+    if used_fallback or options.quality.lower() == "fast":
+        return pipeline.fast_model_name
+    return options.model or pipeline.pro_canonical_name
+
+
+def _record_result(result: RemovalResult, options: RemovalOptions) -> None:
+    quality = "fast" if result.used_fallback else options.quality.lower()
+    model = _model_label(options, result.used_fallback)
+    for stage, duration_ms in result.timings.items():
+        STAGE_SECONDS.observe(duration_ms / 1000.0, stage=stage, quality=quality, model=model)
+    CACHE_RESULTS.inc(result=result.cache_status)
+    if result.used_fallback:
+        FALLBACKS.inc(reason="error")
+
+
+def _checked_model(model: Optional[str]) -> Optional[str]:
+    if not model:
+        return None
+    try:
+        return pipeline.registry.resolve(model)
+    except UnknownModelError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _queue_full(exc: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(exc),
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _pipeline_status() -> dict:
+    """Pipeline state. In process mode this process loads no model: the
+    workers of the pool report theirs and the service is ready once all are."""
+    if scheduler.kind != "process":
+        return pipeline.status_snapshot()
+    workers = scheduler.worker_snapshots()
+    statuses = {worker["status"] for worker in workers}
+    if len(workers) < scheduler.workers or "warming_up" in statuses:
+        status = "warming_up"
+    elif "degraded" in statuses:
+        status = "degraded"
+    else:
+        status = "ok"
+    return {
+        "status": status,
+        "warmup": {str(worker["pid"]): worker["warmup"] for worker in workers},
+        "workers": workers,
+    }
+
+
+def _registry_snapshots() -> List[dict]:
+    if scheduler.kind != "process":
+        return [pipeline.registry.snapshot()]
+    return [worker["registry"] for worker in scheduler.worker_snapshots()]
+
+
 @app.on_event("startup")
 async def warmup_on_startup() -> None:
+    if scheduler.kind == "process":
+        # The pool workers load and warm their own pipeline; the parent
+        # would only hold one more copy of every model.
+        scheduler.start()
+        return
     if _str_to_bool(os.getenv("WARMUP_ON_STARTUP", "true"), True):
         pipeline.start_warmup(
             blocking=_str_to_bool(os.getenv("WARMUP_BLOCKING", "false"), False)
         )
 
 
+@app.on_event("startup")
+async def start_job_runner() -> None:
+    job_runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_scheduler() -> None:
+    await job_runner.stop()
+    scheduler.shutdown(wait=False)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REQUESTS.inc(route=path, status=str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=path)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    snapshot = scheduler.snapshot()
+    for lane, stats in snapshot["lanes"].items():
+        QUEUE_DEPTH.set(stats["queue_depth"], lane=lane)
+        QUEUE_WAIT_AVG.set(stats["wait_ms"]["avg"] / 1000.0, lane=lane)
+    IN_FLIGHT.set(snapshot["in_flight"])
+    WORKERS.set(snapshot["workers"])
+    for state, count in (await asyncio.to_thread(job_store.snapshot)).items():
+        JOBS.set(count, state=state)
+    resident: Dict[str, int] = {}
+    for registry in _registry_snapshots():
+        for name, stats in registry["models"].items():
+            resident[name] = resident.get(name, 0) + (1 if stats["resident"] else 0)
+    for name, count in resident.items():
+        MODELS_RESIDENT.set(count, model=name)
+    return Response(content=metrics.render(), media_type=metrics.content_type)
+
+
 @app.get("/health")
 async def health_check():
-    return pipeline.health()
+    payload = _pipeline_status()
+    payload["scheduler"] = scheduler.snapshot()
+    payload["jobs"] = await asyncio.to_thread(job_store.snapshot)
+    return payload
+
+
+@app.get("/ready")
+async def readiness_check():
+    payload = _pipeline_status()
+    ready = payload["status"] != "warming_up"
+    body = {"ready": ready, "status": payload["status"], "warmup": payload["warmup"]}
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 
 @app.post("/remove-bg")
 async def remove_background(
     file: UploadFile = File(...),
     quality: str = Query("pro", regex="^(?i)(fast|pro)$"),
+    refine: str = Query("blur", regex="^(?i)(none|blur|guided)$"),
+    crop: Optional[bool] = Query(None),
+    output: str = Query("png", alias="format", regex="^(?i)(png|webp|webp-lossy|mask)$"),
+    effort: Optional[int] = Query(None, ge=0, le=9),
+    preview: bool = Query(False),
+    model: Optional[str] = Query(None, max_length=64),
+    deadline_ms: Optional[int] = Query(None, ge=1),
+    profile: Optional[str] = Query(None, regex="^(?i)(cpu|ort)$"),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+    debug_token: Optional[str] = Header(None, alias="X-Wizpix-Debug-Token"),
 ):
+    profile_mode = profile.lower() if profile else None
+    if profile_mode and not profile_settings.authorized(debug_token):
+        raise HTTPException(status_code=403, detail="Profilage non autorise.")
+    if profile_mode == "ort" and quality.lower() != "pro":
+        raise HTTPException(status_code=400, detail="Le profilage ORT demande quality=pro.")
     if file.content_type not in ALLOWED_MIME:
         raise HTTPException(
             status_code=415,
             detail="Format non supporte (autorise: PNG, JPEG, WEBP).",
         )
 
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Fichier vide.")
-    if len(data) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail="Fichier trop volumineux (10 MB max).",
-        )
+    read_start = time.perf_counter()
+    try:
+        data = await read_upload(file, MAX_FILE_SIZE)
+        if not data:
+            raise HTTPException(status_code=400, detail="Fichier vide.")
+        check_image(data, max_pixels_for(plan))
+    except UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+    read_s = time.perf_counter() - read_start
 
+    options = RemovalOptions(
+        quality=quality,
+        refine=refine,
+        crop=crop,
+        output=output,
+        effort=effort,
+        preview=preview,
+        model=_checked_model(model),
+    )
+    lane = lane_for(plan, priority)
+    downgraded = False
+    if deadline_ms is not None and options.quality.lower() == "pro" and not profile_mode:
+        # Switch to the fast model before queueing when the expected wait plus
+        # a pro run would already miss the deadline.
+        expected_ms = scheduler.estimate_ms(lane, _process_tag(options))
+        if expected_ms is not None and expected_ms > deadline_ms:
+            options = dataclasses.replace(options, quality="fast")
+            downgraded = True
+            FALLBACKS.inc(reason="deadline")
+    STAGE_SECONDS.observe(
+        read_s, stage="upload", quality=options.quality.lower(), model=_model_label(options)
+    )
+    trace_name: Optional[str] = None
+    run_start = time.perf_counter()
     try:
-        output_bytes, used_fallback = pipeline.remove_background(data, quality=quality)
+        if profile_mode:
+            # Profiled runs bypass the cache and stay out of the run-time estimates.
+            result, trace_name = await scheduler.run(
+                "process_profiled",
+                data,
+                options,
+                profile_mode,
+                profile_settings.directory,
+                lane=lane,
+            )
+        else:
+            result = await scheduler.run(
+                "process", data, options, lane=lane, tag=_process_tag(options)
+            )
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+    except ProfilingUnavailableError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except WarmupPendingError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
     except ModelsUnavailableError as exc:
+        ERRORS.inc(route="/remove-bg")
         raise HTTPException(status_code=503, detail=str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
+        ERRORS.inc(route="/remove-bg")
         raise HTTPException(
             status_code=500,
             detail=f"Erreur pendant le traitement de l'image: {exc}",
         ) from exc
+    total_ms = (time.perf_counter() - run_start) * 1000
+    _record_result(result, options)
 
     original_name = Path(file.filename or "image").stem or "image"
     safe_name = "".join(ch if ch.isalnum() or ch in ("-", "_") else "-" for ch in original_name)
-    output_name = f"{safe_name}-bg-removed.png"
+    suffix = "-preview" if result.preview else ""
+    response = _result_response(
+        result, f"{safe_name}-bg-removed{suffix}", total_ms=read_s * 1000 + total_ms
+    )
+    if trace_name:
+        response.headers["X-Wizpix-Profile"] = trace_name
+    if downgraded:
+        response.headers["X-Wizpix-Fallback"] = "fast"
+        response.headers["X-Wizpix-Fallback-Reason"] = "deadline"
+    return response
 
-    stream = BytesIO(output_bytes)
-    stream.seek(0)
 
-    response = StreamingResponse(
-        stream,
-        media_type="image/png",
-        headers={"Content-Disposition": f'inline; filename="{output_name}"'},
+def _result_response(
+    result: RemovalResult, stem: str, total_ms: Optional[float] = None
+) -> Response:
+    extension = "webp" if result.media_type == "image/webp" else "png"
+    # The encoded bytes are handed to the server as is; wrapping them in a
+    # StreamingResponse(BytesIO) would re-send them line by line.
+    response = Response(
+        content=result.data,
+        media_type=result.media_type,
+        headers={"Content-Disposition": f'inline; filename="{stem}.{extension}"'},
+    )
+    if result.used_fallback:
+        response.headers["X-Wizpix-Fallback"] = "fast"
+    response.headers["X-Wizpix-Cache"] = (
+        result.cache_status if result.cache_status in ("hit", "bypass") else "miss"
+    )
+    if result.timings or total_ms is not None:
+        response.headers["Server-Timing"] = server_timing(result.timings, total_ms)
+    if result.etag:
+        response.headers["ETag"] = f'"{result.etag}"'
+    if result.image_id:
+        response.headers["X-Wizpix-Image-Id"] = result.image_id
+    if result.preview:
+        response.headers["X-Wizpix-Preview"] = "1"
+    return response
+
+
+@app.post("/remove-bg/batch")
+async def remove_background_batch(
+    files: List[UploadFile] = File(...),
+    quality: str = Query("pro", regex="^(?i)(fast|pro)$"),
+    refine: str = Query("blur", regex="^(?i)(none|blur|guided)$"),
+    crop: Optional[bool] = Query(None),
+    output: str = Query("png", alias="format", regex="^(?i)(png|webp|webp-lossy|mask)$"),
+    effort: Optional[int] = Query(None, ge=0, le=9),
+    model: Optional[str] = Query(None, max_length=64),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+):
+    model = _checked_model(model)
+    items = await _batch_items(files, max_pixels_for(plan))
+    options = RemovalOptions(
+        quality=quality,
+        refine=refine,
+        crop=crop,
+        output=output,
+        effort=effort,
+        model=model,
+    )
+    return StreamingResponse(
+        _stream_batch(items, options, lane=lane_for(plan, priority)),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="wizpix-batch.zip"'},
+    )
+
+
+@app.post("/remove-bg/animated")
+async def remove_background_animated(
+    file: UploadFile = File(...),
+    quality: str = Query("pro", regex="^(?i)(fast|pro)$"),
+    refine: str = Query("blur", regex="^(?i)(none|blur|guided)$"),
+    output: str = Query("png", alias="format", regex="^(?i)(png|webp|webp-lossy|mask)$"),
+    effort: Optional[int] = Query(None, ge=0, le=9),
+    model: Optional[str] = Query(None, max_length=64),
+    frame_ms: int = Query(DEFAULT_FRAME_MS, ge=10, le=10000),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+):
+    """Animated GIF/WebP/APNG, or a ZIP of frames, to an animated PNG or WebP."""
+    model = _checked_model(model)
+    sequence = await _animation_sequence(file, frame_ms, max_pixels_for(plan))
+    options = RemovalOptions(
+        quality=quality, refine=refine, output=output, effort=effort, model=model
+    )
+    run_start = time.perf_counter()
+    try:
+        result: AnimationResult = await scheduler.run(
+            "process_animation",
+            sequence,
+            options,
+            lane=lane_for(plan, priority),
+            tag=f"animation:{options.quality.lower()}",
+        )
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+    except AnimationError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except WarmupPendingError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except ModelsUnavailableError as exc:
+        ERRORS.inc(route="/remove-bg/animated")
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        ERRORS.inc(route="/remove-bg/animated")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur pendant le traitement de l'animation: {exc}",
+        ) from exc
+    total_ms = (time.perf_counter() - run_start) * 1000
+
+    label_quality = "fast" if result.used_fallback else options.quality.lower()
+    label_model = _model_label(options, result.used_fallback)
+    for stage, duration_ms in result.timings.items():
+        STAGE_SECONDS.observe(
+            duration_ms / 1000.0, stage=stage, quality=label_quality, model=label_model
+        )
+    original_name = Path(file.filename or "animation").stem or "animation"
+    safe_name = "".join(ch if ch.isalnum() or ch in ("-", "_") else "-" for ch in original_name)
+    extension = "webp" if result.media_type == "image/webp" else "png"
+    # Streamed from disk, then deleted: the animation never sits in memory whole.
+    response = FileResponse(
+        result.path,
+        media_type=result.media_type,
+        headers={
+            "Content-Disposition": f'inline; filename="{safe_name}-bg-removed.{extension}"',
+            "Server-Timing": server_timing(result.timings, total_ms),
+            "X-Wizpix-Frames": str(result.frames),
+            "X-Wizpix-Keyframes": str(result.keyframes),
+        },
+        background=BackgroundTask(result.path.unlink, missing_ok=True),
     )
-    if used_fallback:
+    if result.used_fallback:
         response.headers["X-Wizpix-Fallback"] = "fast"
     return response
+
+
+async def _animation_sequence(
+    file: UploadFile, frame_ms: int, max_pixels: int
+) -> FrameSequence:
+    if is_zip_upload(file.filename, file.content_type):
+        try:
+            archive = await read_upload(file, BATCH_MAX_ZIP_BYTES)
+        except UploadError as exc:
+            raise HTTPException(status_code=413, detail="Archive trop volumineuse.") from exc
+        try:
+            items = read_zip_items(
+                archive, ANIMATION_MAX_FRAMES, MAX_FILE_SIZE, BATCH_MAX_ZIP_BYTES
+            )
+        except ArchiveError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        frames = []
+        for item in sorted(items, key=lambda entry: frame_sort_key(entry.name)):
+            checked = _checked_item(item, max_pixels)
+            if checked.data is None:
+                raise HTTPException(status_code=400, detail=f"{item.name}: {checked.error}")
+            frames.append(checked.data)
+        if not frames:
+            raise HTTPException(status_code=400, detail="Aucune image dans l'archive.")
+        return FrameSequence(tuple(frames), frame_ms)
+
+    if file.content_type not in ANIMATED_MIME:
+        raise HTTPException(
+            status_code=415,
+            detail="Format non supporte (autorise: GIF, PNG/APNG, WEBP ou ZIP d'images).",
+        )
+    try:
+        data = await read_upload(file, MAX_FILE_SIZE)
+        if not data:
+            raise HTTPException(status_code=400, detail="Fichier vide.")
+        check_image(data, max_pixels, ANIMATED_FORMATS)
+    except UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+    return FrameSequence((data,), frame_ms)
+
+
+async def _batch_items(files: List[UploadFile], max_pixels: int) -> List[BatchItem]:
+    if len(files) == 1 and is_zip_upload(files[0].filename, files[0].content_type):
+        try:
+            archive = await read_upload(files[0], BATCH_MAX_ZIP_BYTES)
+        except UploadError as exc:
+            raise HTTPException(status_code=413, detail="Archive trop volumineuse.") from exc
+        try:
+            items = read_zip_items(archive, BATCH_MAX_FILES, MAX_FILE_SIZE, BATCH_MAX_ZIP_BYTES)
+        except ArchiveError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        return [_checked_item(item, max_pixels) for item in items]
+
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Trop de fichiers ({len(files)} > {BATCH_MAX_FILES}).",
+        )
+    items: List[BatchItem] = []
+    for index, upload in enumerate(files):
+        name = upload.filename or f"image-{index + 1}"
+        if upload.content_type not in ALLOWED_MIME:
+            items.append(BatchItem(name, error="Format non supporte (autorise: PNG, JPEG, WEBP)."))
+            continue
+        try:
+            data = await read_upload(upload, MAX_FILE_SIZE)
+        except UploadError as exc:
+            items.append(BatchItem(name, error=str(exc)))
+            continue
+        if not data:
+            items.append(BatchItem(name, error="Fichier vide."))
+        else:
+            items.append(_checked_item(BatchItem(name, data=data), max_pixels))
+    return items
+
+
+def _checked_item(item: BatchItem, max_pixels: int) -> BatchItem:
+    if item.data is None:
+        return item
+    try:
+        check_image(item.data, max_pixels)
+    except UploadError as exc:
+        return BatchItem(item.name, error=str(exc))
+    return item
+
+
+async def _process_batch_item(data: bytes, options: RemovalOptions, lane: str) -> RemovalResult:
+    # A batch must not fail because interactive traffic filled the queue:
+    # wait for a slot instead of answering 503.
+    for attempt in range(BATCH_QUEUE_RETRIES + 1):
+        try:
+            return await scheduler.run(
+                "process", data, options, lane=lane, tag=_process_tag(options)
+            )
+        except QueueFullError as exc:
+            if attempt == BATCH_QUEUE_RETRIES:
+                raise
+            await asyncio.sleep(min(float(exc.retry_after), 1.0))
+    raise AssertionError("unreachable")
+
+
+def _batch_error(exc: Exception) -> str:
+    if isinstance(exc, (QueueFullError, WarmupPendingError, ModelsUnavailableError)):
+        return str(exc)
+    return f"Erreur pendant le traitement de l'image: {exc}"
+
+
+async def _stream_batch(
+    items: List[BatchItem],
+    options: RemovalOptions,
+    on_item: Optional[Callable[[Dict[str, object]], None]] = None,
+    lane: str = DEFAULT_LANE,
+) -> AsyncIterator[bytes]:
+    spec = options.output_spec.normalized()
+    writer = ZipStreamWriter()
+    entries: List[Dict[str, object]] = []
+    # About one image per worker in flight: the scheduler keeps every worker
+    # busy (and MaskBatcher groups them) while the results are zipped in order.
+    window = max(1, scheduler.workers)
+    pending: Dict[int, "asyncio.Future[RemovalResult]"] = {}
+
+    def submit(index: int) -> None:
+        if index < len(items) and items[index].data is not None:
+            pending[index] = asyncio.ensure_future(
+                _process_batch_item(items[index].data, options, lane)
+            )
+
+    try:
+        for index in range(window):
+            submit(index)
+        for index, item in enumerate(items):
+            submit(index + window)
+            entry: Dict[str, object] = {"index": index, "input": item.name}
+            if item.error:
+                entry.update(status="error", error=item.error)
+            else:
+                try:
+                    result = await pending.pop(index)
+                except Exception as exc:  # noqa: BLE001
+                    ERRORS.inc(route="/remove-bg/batch")
+                    entry.update(status="error", error=_batch_error(exc))
+                else:
+                    _record_result(result, options)
+                    name = writer.add(output_name(item.name, spec.extension), result.data)
+                    entry.update(
+                        status="ok",
+                        output=name,
+                        fallback=result.used_fallback,
+                        cache=result.cache_status,
+                        image_id=result.image_id,
+                        timings=result.timings,
+                    )
+                item.data = None
+            entries.append(entry)
+            if on_item is not None:
+                on_item(entry)
+            chunk = writer.drain()
+            if chunk:
+                yield chunk
+    finally:
+        for future in pending.values():
+            future.cancel()
+
+    succeeded = sum(1 for entry in entries if entry["status"] == "ok")
+    manifest = {
+        "count": len(entries),
+        "succeeded": succeeded,
+        "failed": len(entries) - succeeded,
+        "format": spec.format,
+        "items": entries,
+    }
+    writer.add("manifest.json", json.dumps(manifest, indent=2).encode("utf-8"), compress=True)
+    yield writer.close()
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    files: List[UploadFile] = File(...),
+    quality: str = Query("pro", regex="^(?i)(fast|pro)$"),
+    refine: str = Query("blur", regex="^(?i)(none|blur|guided)$"),
+    crop: Optional[bool] = Query(None),
+    output: str = Query("png", alias="format", regex="^(?i)(png|webp|webp-lossy|mask)$"),
+    effort: Optional[int] = Query(None, ge=0, le=9),
+    model: Optional[str] = Query(None, max_length=64),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+):
+    model = _checked_model(model)
+    single = len(files) == 1 and not is_zip_upload(files[0].filename, files[0].content_type)
+    items = await _batch_items(files, max_pixels_for(plan))
+    if single and items[0].error:
+        raise HTTPException(status_code=400, detail=items[0].error)
+    options = RemovalOptions(
+        quality=quality,
+        refine=refine,
+        crop=crop,
+        output=output,
+        effort=effort,
+        model=model,
+    )
+    try:
+        job = await asyncio.to_thread(
+            job_store.submit,
+            items,
+            dataclasses.asdict(options),
+            "single" if single else "batch",
+            lane_for(plan, priority),
+        )
+    except JobQueueFullError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(scheduler.retry_after)},
+        ) from exc
+    job_runner.notify()
+    return _job_payload(job)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    try:
+        return _job_payload(await asyncio.to_thread(job_store.get, job_id))
+    except JobNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    try:
+        job = await asyncio.to_thread(job_store.get, job_id)
+    except JobNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    if job.status == "failed":
+        raise HTTPException(status_code=422, detail=job.error or "Tache en echec.")
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail="Tache pas encore terminee.",
+            headers={"Retry-After": str(scheduler.retry_after)},
+        )
+    return FileResponse(
+        job_store.result_path(job),
+        media_type=job.media_type,
+        filename=job.result_name,
+    )
+
+
+@app.get("/debug/profiles/{name}")
+async def debug_profile(
+    name: str,
+    debug_token: Optional[str] = Header(None, alias="X-Wizpix-Debug-Token"),
+):
+    if not profile_settings.authorized(debug_token):
+        raise HTTPException(status_code=403, detail="Profilage non autorise.")
+    path = profile_settings.path_for(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable.")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+def _job_payload(job: Job) -> Dict[str, object]:
+    payload = job.as_dict()
+    payload["status_url"] = f"/jobs/{job.id}"
+    payload["result_url"] = f"/jobs/{job.id}/result"
+    return payload
+
+
+async def _run_job(job: Job) -> None:
+    options = RemovalOptions(**job.options)
+    items = await asyncio.to_thread(job_store.load_items, job)
+    result_path = job_store.result_path(job)
+
+    if job.mode == "single":
+        item = items[0]
+        if item.data is None:
+            raise RuntimeError(item.error or "Fichier d'entree introuvable.")
+        try:
+            result = await _process_batch_item(item.data, options, job.lane)
+        except Exception as exc:  # noqa: BLE001
+            ERRORS.inc(route="/jobs")
+            raise RuntimeError(_batch_error(exc)) from exc
+        _record_result(result, options)
+        await asyncio.to_thread(result_path.write_bytes, result.data)
+        await asyncio.to_thread(job_store.progress, job.id, done=1, failed=0)
+        extension = "webp" if result.media_type == "image/webp" else "png"
+        await asyncio.to_thread(
+            job_store.finish, job, output_name(item.name, extension), result.media_type
+        )
+        return
+
+    counts = {"done": 0, "failed": 0}
+
+    def on_item(entry: Dict[str, object]) -> None:
+        counts["done"] += 1
+        counts["failed"] += entry["status"] != "ok"
+
+    # SQLite and file writes go through threads: the loop keeps serving requests.
+    handle = await asyncio.to_thread(result_path.open, "wb")
+    try:
+        saved = dict(counts)
+        async for chunk in _stream_batch(items, options, on_item=on_item, lane=job.lane):
+            await asyncio.to_thread(handle.write, chunk)
+            if counts != saved:
+                saved = dict(counts)
+                await asyncio.to_thread(job_store.progress, job.id, **saved)
+    finally:
+        await asyncio.to_thread(handle.close)
+    if counts != saved:
+        await asyncio.to_thread(job_store.progress, job.id, **counts)
+    await asyncio.to_thread(job_store.finish, job, "wizpix-batch.zip", "application/zip")
+
+
+job_runner = JobRunner.from_env(job_store, _run_job)
+
+
+@app.post("/render")
+async def render(
+    image_id: str = Query(..., pattern="^[0-9a-f]{64}$"),
+    refine: str = Query("blur", regex="^(?i)(none|blur|guided)$"),
+    output: str = Query("png", alias="format", regex="^(?i)(png|webp|webp-lossy|mask)$"),
+    effort: Optional[int] = Query(None, ge=0, le=9),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+):
+    options = RemovalOptions(refine=refine, output=output, effort=effort)
+    try:
+        result = await scheduler.run(
+            "render", image_id, options, lane=lane_for(plan, priority)
+        )
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+    except MaskNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur pendant le rendu de l'image: {exc}",
+        ) from exc
+    return _result_response(result, f"{image_id[:12]}-bg-removed")
+
+
+@app.post("/recomposite")
+async def recomposite(
+    image_id: str = Query(..., pattern="^[0-9a-f]{64}$"),
+    background: str = Query("color"),
+    color: str = Query("#ffffff"),
+    color_end: str = Query("#000000"),
+    angle: float = Query(90.0),
+    blur_radius: int = Query(25, ge=1, le=200),
+    file: Optional[UploadFile] = File(None),
+    plan: Optional[str] = Header(None, alias="X-Wizpix-Plan"),
+    priority: Optional[str] = Header(None, alias="X-Wizpix-Priority"),
+):
+    background_bytes = None
+    if file is not None:
+        if file.content_type not in ALLOWED_MIME:
+            raise HTTPException(
+                status_code=415,
+                detail="Format non supporte (autorise: PNG, JPEG, WEBP).",
+            )
+        try:
+            background_bytes = await read_upload(file, MAX_FILE_SIZE)
+            check_image(background_bytes, max_pixels_for(plan))
+        except UploadError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+
+    try:
+        spec = BackgroundSpec(
+            kind=background.lower(),
+            color=parse_hex_color(color),
+            color_end=parse_hex_color(color_end),
+            angle=angle,
+            blur_radius=blur_radius,
+            image_bytes=background_bytes,
+        )
+        spec.validate()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    try:
+        output_bytes = await scheduler.run(
+            "recomposite", image_id, spec, lane=lane_for(plan, priority)
+        )
+    except QueueFullError as exc:
+        raise _queue_full(exc) from exc
+    except MaskNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur pendant la recomposition de l'image: {exc}",
+        ) from exc
+
+    return Response(
+        content=output_bytes,
+        media_type="image/png",
+        headers={
+            "Content-Disposition": f'inline; filename="{image_id[:12]}-{spec.kind}.png"'
+        },
+    )
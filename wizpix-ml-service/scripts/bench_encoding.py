@@ -0,0 +1,77 @@
+"""Micro-benchmark: encoding time and size of each output format and effort.
+
+    python scripts/bench_encoding.py --image photo.jpg --runs 3
+    python scripts/bench_encoding.py --width 4000 --height 3000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Tuple
+
+os.environ.setdefault("WIZPIX_SKIP_PIPELINE_INIT", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from services.decode import decode_rgb  # noqa: E402
+from services.encoding import OUTPUT_FORMATS, OutputSpec, encode_cutout  # noqa: E402
+
+
+def synthetic_cutout(width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    xs = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.stack(
+        [np.broadcast_to(xs, (height, width)), np.broadcast_to(ys, (height, width)), (xs + ys) / 2],
+        axis=-1,
+    ).astype(np.uint8)
+    rgb += np.random.default_rng(0).integers(0, 12, rgb.shape, dtype=np.uint8)
+    return rgb, _ellipse_alpha(width, height)
+
+
+def _ellipse_alpha(width: int, height: int) -> np.ndarray:
+    alpha = np.zeros((height, width), dtype=np.uint8)
+    cv2.ellipse(alpha, (width // 2, height // 2), (width // 3, height // 3), 0, 0, 360, 255, -1)
+    return cv2.GaussianBlur(alpha, (0, 0), 3).astype(np.float32) / 255.0
+
+
+def measure(fn: Callable[[], bytes], runs: int) -> Tuple[float, int]:
+    size = len(fn())  # first call allocates the per-thread RGBA buffer
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), size
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", type=Path, help="Photo to encode (default: synthetic)")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--efforts", type=int, nargs="*", default=[0, 1, 3, 6, 9])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.image:
+        rgb = decode_rgb(args.image.read_bytes())
+        alpha = _ellipse_alpha(rgb.shape[1], rgb.shape[0])
+    else:
+        rgb, alpha = synthetic_cutout(args.width, args.height)
+
+    print(f"Cut-out {rgb.shape[1]}x{rgb.shape[0]}, {args.runs} runs")
+    for name in OUTPUT_FORMATS:
+        for effort in args.efforts:
+            spec = OutputSpec(name, effort)
+            median, size = measure(lambda: encode_cutout(rgb, alpha, spec), args.runs)
+            print(f"  {name:<11} effort={effort}  {median:8.1f} ms  {size / (1024 * 1024):7.2f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,353 @@
+"""Benchmark: BackgroundRemovalPipeline end to end over a synthetic or local corpus.
+
+    python scripts/bench_pipeline.py --preset ci --output bench.json
+    python scripts/bench_pipeline.py --quality fast pro --models inspyrenet --sizes 1024 4000
+    python scripts/bench_pipeline.py --corpus photos/ --runs 10 --output after.json \\
+        --baseline before.json --max-slowdown 0.15
+
+Runs offline on CPU: models must already be in MODEL_DIR (scripts/fetch_models.py).
+Each case reports p50/p95 latency, throughput, peak RSS and the median time
+of every pipeline stage. With --baseline, the exit code is 1 when a case
+regresses beyond the thresholds.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault("WIZPIX_SKIP_PIPELINE_INIT", "1")
+os.environ.setdefault("PIPELINE_DEVICE", "cpu")
+# Measure the work, not the caches, and never hide a pro failure behind fast.
+os.environ.setdefault("RESULT_CACHE_MAX_MB", "0")
+os.environ.setdefault("RESULT_CACHE_DISK", "0")
+os.environ.setdefault("MASK_STORE_MAX_MB", "0")
+os.environ.setdefault("AUTO_FALLBACK_FAST", "0")
+os.environ.setdefault("ALLOW_REMOTE_DOWNLOAD", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+PRESETS: Dict[str, Dict[str, object]] = {
+    "ci": {
+        "quality": ["fast", "pro"],
+        "fast_model": "mock",
+        "models": ["mock"],
+        "sizes": [256, 512, 1024],
+        "runs": 3,
+    },
+    "full": {
+        "quality": ["fast", "pro"],
+        "fast_model": os.getenv("FAST_MODEL_NAME", "u2net"),
+        "models": [os.getenv("PRO_MODEL_NAME", "inspyrenet")],
+        "sizes": [256, 1024, 2048, 4000, 6000],
+        "runs": 5,
+    },
+}
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+@dataclass
+class CorpusImage:
+    name: str
+    data: bytes
+    width: int
+    height: int
+
+
+@dataclass
+class CaseResult:
+    quality: str
+    model: Optional[str]
+    image: str
+    width: int
+    height: int
+    runs: int
+    concurrency: int
+    first_ms: float
+    p50_ms: float
+    p95_ms: float
+    mean_ms: float
+    throughput_ips: float
+    peak_rss_mb: Optional[float]
+    stages_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        return f"{self.quality}:{self.model or '-'}:{self.image}"
+
+
+def synthetic_photo(long_side: int, seed: int = 0) -> CorpusImage:
+    """4:3 JPEG with a textured background and a contrasting elliptic subject."""
+    width, height = long_side, max(1, long_side * 3 // 4)
+    rng = np.random.default_rng(seed + long_side)
+    xs = np.linspace(40, 200, width, dtype=np.float32)[None, :]
+    ys = np.linspace(60, 180, height, dtype=np.float32)[:, None]
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = np.broadcast_to(xs, (height, width))
+    rgb[..., 1] = np.broadcast_to(ys, (height, width))
+    rgb[..., 2] = 120
+    rgb += rng.integers(0, 24, rgb.shape, dtype=np.uint8)
+    center = (width // 2, height // 2)
+    axes = (max(1, width // 5), max(1, height // 3))
+    cv2.ellipse(rgb, center, axes, 0, 0, 360, (30, 30, 220), -1)
+    ok, encoded = cv2.imencode(".jpg", rgb, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("Encodage JPEG impossible.")
+    return CorpusImage(f"synthetic-{long_side}", encoded.tobytes(), width, height)
+
+
+def load_corpus(directory: Path) -> List[CorpusImage]:
+    images = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if decoded is None:
+            print(f"[skip] {path.name}: image illisible", file=sys.stderr)
+            continue
+        images.append(CorpusImage(path.name, data, decoded.shape[1], decoded.shape[0]))
+    return images
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks, ``q`` in [0, 100]."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _reset_peak_rss() -> bool:
+    # Linux >= 4.0 resets VmHWM when "5" is written to clear_refs.
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(resettable: bool) -> Optional[float]:
+    if resettable:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(
+    pipeline,
+    image: CorpusImage,
+    quality: str,
+    model: Optional[str],
+    runs: int,
+    concurrency: int,
+) -> CaseResult:
+    from services.pipeline import RemovalOptions
+
+    options = RemovalOptions(quality=quality, model=model)
+    resettable = _reset_peak_rss()
+
+    start = time.perf_counter()
+    pipeline.process(image.data, options)  # loads the model, allocates buffers
+    first_ms = (time.perf_counter() - start) * 1000
+
+    def one(_index: int) -> Tuple[float, Dict[str, float]]:
+        begin = time.perf_counter()
+        result = pipeline.process(image.data, options)
+        return (time.perf_counter() - begin) * 1000, result.timings
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(runs)))
+    wall_s = time.perf_counter() - wall_start
+
+    durations = [duration for duration, _ in samples]
+    stage_names = sorted({name for _, timings in samples for name in timings})
+    stages = {
+        name: round(statistics.median(t.get(name, 0.0) for _, t in samples), 2)
+        for name in stage_names
+    }
+    return CaseResult(
+        quality=quality,
+        model=model,
+        image=image.name,
+        width=image.width,
+        height=image.height,
+        runs=runs,
+        concurrency=concurrency,
+        first_ms=round(first_ms, 2),
+        p50_ms=round(percentile(durations, 50), 2),
+        p95_ms=round(percentile(durations, 95), 2),
+        mean_ms=round(statistics.fmean(durations), 2),
+        throughput_ips=round(runs / wall_s, 3) if wall_s > 0 else 0.0,
+        peak_rss_mb=_peak_rss_mb(resettable),
+        stages_ms=stages,
+    )
+
+
+def compare(
+    current: List[dict],
+    baseline: List[dict],
+    max_slowdown: float,
+    max_rss_growth: float,
+    min_delta_ms: float,
+) -> List[str]:
+    """Regressions of ``current`` against ``baseline`` cases with the same key."""
+    previous = {case["key"]: case for case in baseline}
+    failures = []
+    for case in current:
+        before = previous.get(case["key"])
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            old, new = before[metric], case[metric]
+            if new > old * (1 + max_slowdown) and new - old > min_delta_ms:
+                failures.append(
+                    f"{case['key']} {metric}: {old:.1f} -> {new:.1f} ms "
+                    f"(+{(new / old - 1) * 100 if old else 100:.0f}%)"
+                )
+        old_rss, new_rss = before.get("peak_rss_mb"), case.get("peak_rss_mb")
+        if old_rss and new_rss and new_rss > old_rss * (1 + max_rss_growth):
+            failures.append(
+                f"{case['key']} peak_rss_mb: {old_rss:.0f} -> {new_rss:.0f} MB "
+                f"(+{(new_rss / old_rss - 1) * 100:.0f}%)"
+            )
+    return failures
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def _environment() -> Dict[str, object]:
+    import onnxruntime as ort
+
+    return {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "onnxruntime": ort.__version__,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="ci")
+    parser.add_argument("--quality", nargs="+", choices=["fast", "pro"])
+    parser.add_argument("--fast-model", help="Fast tier model (u2net, u2netp, silueta, mock)")
+    parser.add_argument("--models", nargs="+", help="Pro models (mock: no ONNX, CI-sized)")
+    parser.add_argument("--sizes", type=int, nargs="+", help="Long sides of the synthetic corpus")
+    parser.add_argument("--corpus", type=Path, help="Directory of images instead of synthetic")
+    parser.add_argument("--runs", type=int, help="Measured runs per case")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="Earlier JSON to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=0.15, help="Allowed p50/p95 growth")
+    parser.add_argument("--max-rss-growth", type=float, default=0.15, help="Allowed RSS growth")
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns below this (noise)"
+    )
+    args = parser.parse_args()
+    preset = PRESETS[args.preset]
+    for name in ("quality", "fast_model", "models", "sizes", "runs"):
+        if getattr(args, name) is None:
+            setattr(args, name, preset[name])
+    return args
+
+
+def main() -> int:
+    args = _parse_args()
+    # The first pro model becomes the default one, the others are allowed.
+    os.environ["PRO_MODEL_NAME"] = args.models[0]
+    os.environ["MODELS_ALLOWED"] = ",".join(args.models)
+    os.environ["FAST_MODEL_NAME"] = args.fast_model
+
+    from services.pipeline import BackgroundRemovalPipeline
+
+    pipeline = BackgroundRemovalPipeline()
+
+    corpus = load_corpus(args.corpus) if args.corpus else [synthetic_photo(s) for s in args.sizes]
+    if not corpus:
+        print("Corpus vide.", file=sys.stderr)
+        return 2
+    cases = [("fast", args.fast_model)] if "fast" in args.quality else []
+    if "pro" in args.quality:
+        cases += [("pro", model) for model in args.models]
+
+    results: List[CaseResult] = []
+    print(f"{'case':<44} {'size':>11} {'p50':>9} {'p95':>9} {'img/s':>7} {'rss':>7}")
+    for quality, model in cases:
+        for image in corpus:
+            result = run_case(pipeline, image, quality, model, args.runs, args.concurrency)
+            results.append(result)
+            print(
+                f"{result.key:<44} {image.width:>5}x{image.height:<5} "
+                f"{result.p50_ms:>7.1f}ms {result.p95_ms:>7.1f}ms "
+                f"{result.throughput_ips:>7.2f} {result.peak_rss_mb or 0:>5.0f}MB"
+            )
+
+    payload = {
+        "environment": _environment(),
+        "settings": {
+            "runs": args.runs,
+            "concurrency": args.concurrency,
+            "corpus": str(args.corpus) if args.corpus else "synthetic",
+        },
+        "cases": [dict(asdict(result), key=result.key) for result in results],
+    }
+    if args.output:
+        args.output.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+        print(f"Resultats ecrits dans {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        failures = compare(
+            payload["cases"],
+            baseline.get("cases", []),
+            args.max_slowdown,
+            args.max_rss_growth,
+            args.min_delta_ms,
+        )
+        if failures:
+            print(f"{len(failures)} regression(s) vs {args.baseline}:", file=sys.stderr)
+            for failure in failures:
+                print(f"  {failure}", file=sys.stderr)
+            return 1
+        print(f"Aucune regression vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
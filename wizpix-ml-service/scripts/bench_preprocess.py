@@ -0,0 +1,85 @@
+"""Micro-benchmark: legacy PIL preprocessing vs services.preprocess.Preprocessor.
+
+    python scripts/bench_preprocess.py --width 4000 --height 3000 --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Tuple
+
+os.environ.setdefault("WIZPIX_SKIP_PIPELINE_INIT", "1")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from services.preprocess import Preprocessor  # noqa: E402
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def legacy_prepare(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    """The OnnxMaskModel._prepare_input implementation before Preprocessor."""
+    pil = image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+    arr = np.asarray(pil).astype(np.float32)
+    arr = arr / max(float(np.max(arr)), 1e-6)
+    tmp = np.zeros_like(arr, dtype=np.float32)
+    for ch in range(3):
+        tmp[:, :, ch] = (arr[:, :, ch] - MEAN[ch]) / STD[ch]
+    tmp = tmp.transpose(2, 0, 1)
+    return np.expand_dims(tmp, 0).astype(np.float32)
+
+
+def measure(fn: Callable[[], np.ndarray], runs: int) -> Tuple[float, float, float]:
+    fn()  # first call allocates the per-thread buffers
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(durations), min(durations), peak / (1024 * 1024)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--size", type=int, default=1024, help="Model input side")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels, mode="RGB")
+    size = (args.size, args.size)
+    preprocessor = Preprocessor(size, MEAN, STD)
+
+    print(f"Image {args.width}x{args.height} -> 1x3x{args.size}x{args.size}, {args.runs} runs")
+    rows = (
+        ("legacy (PIL LANCZOS)", lambda: legacy_prepare(image, size)),
+        ("preprocessor (PIL in)", lambda: preprocessor(image)),
+        ("preprocessor (array in)", lambda: preprocessor(pixels)),
+    )
+    results = {}
+    for label, fn in rows:
+        median, best, peak_mb = measure(fn, args.runs)
+        results[label] = median
+        print(f"  {label:<24} median={median:7.1f} ms  min={best:7.1f} ms  alloc_peak={peak_mb:6.1f} MB")
+    legacy_ms = results[rows[0][0]]
+    for label, _ in rows[1:]:
+        print(f"  speedup {label}: x{legacy_ms / results[label]:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+"""Measure RSS per uvicorn-like worker, with and without the shared model host.
+
+    python scripts/bench_workers.py --workers 1 2 4
+    python scripts/bench_workers.py --workers 4 --modes host
+
+Each worker imports app.main (module-level pipeline included), then runs one
+pro and one fast removal. All workers of a run stay alive while RSS and PSS
+(shared pages split between processes) are read from /proc, Linux only.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from services.modelhost import ModelHostClient, ModelHostError  # noqa: E402
+
+WORKER_CODE = """
+import io, json, sys
+import numpy as np
+from PIL import Image
+from app.main import pipeline
+from services.pipeline import RemovalOptions
+buffer = io.BytesIO()
+Image.fromarray(np.full((768, 1024, 3), 128, dtype=np.uint8)).save(buffer, format="JPEG")
+for quality in ("pro", "fast"):
+    result = pipeline.process(buffer.getvalue(), RemovalOptions(quality=quality))
+    assert not result.used_fallback, quality
+print(json.dumps({"pid": __import__("os").getpid()}), flush=True)
+sys.stdin.read()
+"""
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    values: Dict[str, float] = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        key, _, rest = line.partition(":")
+        if key in ("Rss", "Pss"):
+            values[key.lower()] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def run(workers: int, mode: str, address: str) -> Dict[str, object]:
+    env = dict(os.environ, JOBS_DIR=tempfile.mkdtemp(), RESULT_CACHE_MAX_MB="0")
+    env.pop("WIZPIX_SKIP_PIPELINE_INIT", None)
+    env["AUTO_FALLBACK_FAST"] = "0"
+    host: Optional[subprocess.Popen] = None
+    if mode == "host":
+        host = subprocess.Popen(
+            [sys.executable, "-m", "services.modelhost", "--address", address],
+            cwd=ROOT_DIR,
+            env=dict(env, WEB_CONCURRENCY="1"),
+            stderr=subprocess.DEVNULL,
+        )
+        client = ModelHostClient(address, timeout_s=5.0)
+        for _ in range(600):
+            try:
+                client.ping()
+                break
+            except ModelHostError:
+                time.sleep(0.5)
+        client.close()
+        env["MODEL_HOST_ADDRESS"] = address
+    env["WEB_CONCURRENCY"] = str(workers)
+
+    processes: List[subprocess.Popen] = []
+    try:
+        for _ in range(workers):
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-c", WORKER_CODE],
+                    cwd=ROOT_DIR,
+                    env=env,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                )
+            )
+        for process in processes:
+            if not process.stdout.readline():  # type: ignore[union-attr]
+                raise RuntimeError(f"Worker en echec (mode {mode}).")
+        per_worker = [memory_mb(process.pid) for process in processes]
+        host_memory = memory_mb(host.pid) if host is not None else {"rss": 0.0, "pss": 0.0}
+    finally:
+        for process in processes:
+            process.stdin.close()  # type: ignore[union-attr]
+            process.wait(timeout=30)
+        if host is not None:
+            host.terminate()
+            host.wait(timeout=30)
+
+    worker_rss = sum(item["rss"] for item in per_worker) / workers
+    worker_pss = sum(item["pss"] for item in per_worker) / workers
+    return {
+        "mode": mode,
+        "workers": workers,
+        "worker_rss_mb": round(worker_rss, 1),
+        "worker_pss_mb": round(worker_pss, 1),
+        "host_rss_mb": host_memory["rss"],
+        "total_pss_mb": round(worker_pss * workers + host_memory["pss"], 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=["local", "host"], default=["local", "host"])
+    parser.add_argument("--output", type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    address = str(Path(tempfile.mkdtemp()) / "modelhost.sock")
+    results = []
+    print(f"{'mode':<6} {'workers':>7} {'rss/worker':>11} {'pss/worker':>11} {'host':>8} {'total':>8}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = run(workers, mode, address)
+            results.append(result)
+            print(
+                f"{mode:<6} {workers:>7} {result['worker_rss_mb']:>9.0f}MB "
+                f"{result['worker_pss_mb']:>9.0f}MB {result['host_rss_mb']:>6.0f}MB "
+                f"{result['total_pss_mb']:>6.0f}MB"
+            )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
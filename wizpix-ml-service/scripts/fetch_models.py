@@ -14,6 +14,12 @@ BIREFNET_URL = os.getenv(
     "BIREFNET_MODEL_URL",
     "https://github.com/ZhengPeng7/BiRefNet/releases/download/v1.0/BiRefNet-portrait-epoch_150.onnx",
 )
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "u2net")
+FAST_FILENAME = f"{FAST_MODEL_NAME}.onnx"
+FAST_URL = os.getenv(
+    "FAST_MODEL_URL",
+    f"https://github.com/danielgatis/rembg/releases/download/v0.0.0/{FAST_FILENAME}",
+)
 ROOT_DIR = Path(__file__).resolve().parents[1]
 MODEL_DIR = Path(
     os.getenv("MODEL_DIR")
@@ -24,6 +30,7 @@ MODEL_DIR.mkdir(parents=True, exist_ok=True)
 REQUIRED_MODELS: Iterable[Tuple[str, str]] = (
     (ISNET_FILENAME, ISNET_URL),
     (BIREFNET_FILENAME, BIREFNET_URL),
+    (FAST_FILENAME, FAST_URL),
 )
 
 
@@ -0,0 +1,245 @@
+"""Build INT8 variants of the pro models and compare them against fp32.
+
+Requires the ``onnx`` package in addition to requirements.txt (it is only
+needed by onnxruntime.quantization, not by the service itself):
+
+    pip install onnx
+    python scripts/quantize_models.py --mode dynamic --eval-dir ./samples
+    python scripts/quantize_models.py --mode static --calibration-dir ./calib
+
+The INT8 file is written next to the fp32 model in MODEL_DIR under the name
+declared by the matching ``<model>-int8`` spec, so the service picks it up
+with PRO_MODEL_VARIANT=int8.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+os.environ.setdefault("WIZPIX_SKIP_PIPELINE_INIT", "1")
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from services.pipeline import PRO_MODEL_SPECS, OnnxMaskModel, resolve_spec  # noqa: E402
+from services.settings import MODEL_DIR  # noqa: E402
+
+try:
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+except ImportError as exc:  # onnx is not part of the service image
+    QUANTIZATION_IMPORT_ERROR: Optional[ImportError] = exc
+    CalibrationDataReader = object  # type: ignore[assignment,misc]
+else:
+    QUANTIZATION_IMPORT_ERROR = None
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def list_images(directory: Optional[Path], limit: int) -> List[Path]:
+    if directory is None:
+        return []
+    paths = sorted(
+        path for path in directory.rglob("*") if path.suffix.lower() in IMAGE_SUFFIXES
+    )
+    return paths[:limit]
+
+
+def quantizable_models() -> List[str]:
+    return sorted(name for name in PRO_MODEL_SPECS if f"{name}-int8" in PRO_MODEL_SPECS)
+
+
+def load_model(name: str) -> OnnxMaskModel:
+    spec = resolve_spec(name)
+    if spec is None:
+        raise SystemExit(f"Modele inconnu: {name}")
+    model = OnnxMaskModel(name=name, spec=spec, device_request="cpu", allow_download=False)
+    model.batcher.max_batch_size = 1
+    model.ensure_loaded()
+    return model
+
+
+class FolderCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed calibration images to quantize_static."""
+
+    def __init__(self, model: OnnxMaskModel, paths: List[Path]) -> None:
+        assert model.session is not None
+        self.input_name = model.session.get_inputs()[0].name
+        self.model = model
+        self.paths = paths
+        self._iterator: Iterator[Path] = iter(paths)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        path = next(self._iterator, None)
+        if path is None:
+            return None
+        with Image.open(path) as image:
+            tensor = self.model._prepare_input(image.convert("RGB"))
+        return {self.input_name: np.array(tensor, copy=True)}
+
+    def rewind(self) -> None:
+        self._iterator = iter(self.paths)
+
+
+def quantize(
+    name: str,
+    mode: str,
+    calibration: List[Path],
+    per_channel: bool,
+) -> Path:
+    if QUANTIZATION_IMPORT_ERROR is not None:
+        raise SystemExit(
+            f"onnxruntime.quantization indisponible ({QUANTIZATION_IMPORT_ERROR}); pip install onnx"
+        )
+
+    source_spec = resolve_spec(name)
+    target_spec = resolve_spec(f"{name}-int8")
+    assert source_spec is not None and target_spec is not None
+    source = MODEL_DIR / str(source_spec["filename"])
+    target = MODEL_DIR / str(target_spec["filename"])
+    if not source.exists():
+        raise SystemExit(f"{source} introuvable: lancez scripts/fetch_models.py")
+
+    prepared = target.with_name(f"{target.stem}.prep.onnx")
+    try:
+        quant_pre_process(str(source), str(prepared), skip_symbolic_shape=True)
+        model_input = prepared
+    except Exception as exc:  # noqa: BLE001
+        print(f"[warn] pre-process ignore pour {name}: {exc}")
+        model_input = source
+
+    print(f"[quantize] {name} ({mode}) -> {target}")
+    try:
+        if mode == "dynamic":
+            # ORT's CPU ConvInteger kernel only exists for uint8 weights.
+            quantize_dynamic(
+                str(model_input),
+                str(target),
+                weight_type=QuantType.QUInt8,
+                per_channel=per_channel,
+            )
+        else:
+            if not calibration:
+                raise SystemExit("--calibration-dir est requis en mode static")
+            quantize_static(
+                str(model_input),
+                str(target),
+                FolderCalibrationReader(load_model(name), calibration),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=per_channel,
+            )
+    finally:
+        prepared.unlink(missing_ok=True)
+    return target
+
+
+def mask_metrics(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    ref_bin = reference >= 0.5
+    cand_bin = candidate >= 0.5
+    union = np.logical_or(ref_bin, cand_bin).sum()
+    inter = np.logical_and(ref_bin, cand_bin).sum()
+    return {
+        "iou": float(inter / union) if union else 1.0,
+        "mae": float(np.mean(np.abs(reference - candidate))),
+    }
+
+
+def timed_predict(model: OnnxMaskModel, image: Image.Image, runs: int) -> tuple:
+    durations = []
+    mask = None
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        mask = model.predict_mask(image)
+        durations.append((time.perf_counter() - start) * 1000)
+    return mask, statistics.median(durations)
+
+
+def evaluate(name: str, images: List[Path], runs: int) -> Dict[str, object]:
+    reference = load_model(name)
+    candidate = load_model(f"{name}-int8")
+    rows = []
+    for path in images:
+        with Image.open(path) as opened:
+            image = opened.convert("RGB")
+        ref_mask, ref_ms = timed_predict(reference, image, runs)
+        int8_mask, int8_ms = timed_predict(candidate, image, runs)
+        row = {"image": path.name, "fp32_ms": round(ref_ms, 1), "int8_ms": round(int8_ms, 1)}
+        row.update({key: round(value, 4) for key, value in mask_metrics(ref_mask, int8_mask).items()})
+        rows.append(row)
+        print(
+            f"  {path.name:<32} iou={row['iou']:.4f} mae={row['mae']:.4f} "
+            f"fp32={ref_ms:.0f}ms int8={int8_ms:.0f}ms"
+        )
+    if not rows:
+        return {"images": []}
+    fp32_ms = statistics.median(row["fp32_ms"] for row in rows)
+    int8_ms = statistics.median(row["int8_ms"] for row in rows)
+    return {
+        "images": rows,
+        "mean_iou": round(statistics.fmean(row["iou"] for row in rows), 4),
+        "min_iou": round(min(row["iou"] for row in rows), 4),
+        "mean_mae": round(statistics.fmean(row["mae"] for row in rows), 4),
+        "median_fp32_ms": round(fp32_ms, 1),
+        "median_int8_ms": round(int8_ms, 1),
+        "speedup": round(fp32_ms / int8_ms, 2) if int8_ms else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Quantize WizPix pro models to INT8")
+    parser.add_argument(
+        "--models",
+        nargs="*",
+        default=quantizable_models(),
+        help="Models to quantize (default: %(default)s)",
+    )
+    parser.add_argument("--mode", choices=("dynamic", "static"), default="dynamic")
+    parser.add_argument("--calibration-dir", type=Path, help="Images for static calibration")
+    parser.add_argument("--eval-dir", type=Path, help="Images for the fp32/int8 comparison")
+    parser.add_argument("--max-images", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--per-channel", action="store_true")
+    parser.add_argument("--skip-quantize", action="store_true", help="Only compare")
+    parser.add_argument("--report", type=Path, help="Write the comparison as JSON")
+    args = parser.parse_args()
+
+    calibration = list_images(args.calibration_dir, args.max_images)
+    evaluation = list_images(args.eval_dir or args.calibration_dir, args.max_images)
+    report: Dict[str, object] = {"mode": args.mode, "models": {}}
+
+    for name in args.models:
+        if f"{name}-int8" not in PRO_MODEL_SPECS:
+            print(f"[skip] {name}: aucune variante int8 declaree")
+            continue
+        if not args.skip_quantize:
+            quantize(name, args.mode, calibration, args.per_channel)
+        if evaluation:
+            print(f"[compare] {name} sur {len(evaluation)} images")
+            report["models"][name] = evaluate(name, evaluation, args.runs)  # type: ignore[index]
+        else:
+            print("[info] pas de --eval-dir: comparaison qualite ignoree")
+
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[ok] rapport ecrit dans {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
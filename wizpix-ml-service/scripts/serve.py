@@ -0,0 +1,102 @@
+"""Start the shared model host, then uvicorn with several workers using it.
+
+    python scripts/serve.py --workers 4 --port 8000
+
+The host process owns the ORT sessions (one copy of the weights per node);
+each uvicorn worker decodes, preprocesses and encodes, and sends its input
+tensors to the host through shared memory. See docs/ml-service-multiworker.md.
+"""
+
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from services.modelhost import DEFAULT_ADDRESS, ModelHostClient, ModelHostError  # noqa: E402
+from services.scheduler import available_cpus  # noqa: E402
+
+
+def wait_for_host(address: str, process: subprocess.Popen, timeout_s: float) -> None:
+    client = ModelHostClient(address, timeout_s=5.0)
+    deadline = time.monotonic() + timeout_s
+    try:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Le model host s'est arrete (code {process.returncode}).")
+            try:
+                client.ping()
+                return
+            except ModelHostError:
+                time.sleep(0.5)
+    finally:
+        client.close()
+    raise RuntimeError(f"Model host pas pret apres {timeout_s:.0f} s.")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--address", default=os.getenv("MODEL_HOST_ADDRESS") or DEFAULT_ADDRESS)
+    parser.add_argument("--preload", nargs="*", help="Modeles du host (defaut: pro et fast)")
+    parser.add_argument("--start-timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    host_command = [sys.executable, "-m", "services.modelhost", "--address", args.address]
+    if args.preload is not None:
+        host_command += ["--preload", *args.preload]
+    # A fresh secret per launch, shared by the host, the workers and this
+    # process (wait_for_host): the host unpickles what its clients send.
+    os.environ["MODEL_HOST_AUTHKEY"] = (
+        os.getenv("MODEL_HOST_AUTHKEY") or secrets.token_bytes(32).hex()
+    )
+    # Only the host runs ORT: it gets every core (unless set explicitly).
+    host_env = dict(os.environ, WEB_CONCURRENCY="1")
+    host_env.setdefault("ORT_INTRA_OP_THREADS", str(available_cpus()))
+    host = subprocess.Popen(host_command, cwd=ROOT_DIR, env=host_env)
+    server = None
+    signal.signal(signal.SIGTERM, lambda *_args: sys.exit(0))
+    try:
+        wait_for_host(args.address, host, args.start_timeout)
+        worker_env = dict(
+            os.environ, MODEL_HOST_ADDRESS=args.address, WEB_CONCURRENCY=str(args.workers)
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                args.host,
+                "--port",
+                str(args.port),
+                "--workers",
+                str(args.workers),
+            ],
+            cwd=ROOT_DIR,
+            env=worker_env,
+        )
+        while server.poll() is None and host.poll() is None:
+            time.sleep(1.0)
+        return server.returncode or host.returncode or 0
+    finally:
+        for process in (server, host):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
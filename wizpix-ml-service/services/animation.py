@@ -0,0 +1,400 @@
+import re
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import UnidentifiedImageError
+
+from .decode import open_image
+from .encoding import OutputSpec, encode_cutout
+from .preprocess import as_rgb_array
+from .settings import env_bool, env_float, env_int
+from .timing import StageTimings
+
+# Formats, as reported by Pillow, accepted as animated input (APNG is PNG).
+ANIMATED_FORMATS = {"GIF", "PNG", "WEBP"}
+ANIMATED_MIME = {"image/gif", "image/png", "image/apng", "image/webp"}
+DEFAULT_FRAME_MS = 100
+# Loop count written to acTL / ANIM for a single play (0 loops forever).
+PLAY_ONCE = 1
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+Shift = Tuple[float, float]
+PredictMasks = Callable[[List[np.ndarray]], List[np.ndarray]]
+RefineMask = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+class AnimationError(ValueError):
+    """Raised when an input cannot be played as an animation."""
+
+
+def frame_sort_key(name: str) -> List[object]:
+    """Natural order of frame file names: ``frame2`` before ``frame10``."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+@dataclass(frozen=True)
+class SequenceInfo:
+    size: Tuple[int, int]
+    frame_count: int
+    loop: int
+
+
+@dataclass(frozen=True)
+class FrameSequence:
+    """Frames to process: one animated image, or still images played in order.
+
+    Only the encoded inputs are kept; frames are decoded one at a time.
+    """
+
+    images: Tuple[bytes, ...]
+    frame_ms: int = DEFAULT_FRAME_MS
+
+    def probe(self, max_frames: int) -> SequenceInfo:
+        """Canvas size, frame count and loop count, checked against ``max_frames``."""
+        if not self.images:
+            raise AnimationError("Aucune image dans la sequence.")
+        size: Optional[Tuple[int, int]] = None
+        count = 0
+        loop = 0
+        for data in self.images:
+            try:
+                with open_image(data) as image:
+                    if size is None:
+                        size = image.size
+                        if len(self.images) == 1 and "loop" not in image.info:
+                            # A GIF without a NETSCAPE loop extension plays once;
+                            # 0 (the default of still sequences) loops forever.
+                            loop = PLAY_ONCE
+                        else:
+                            loop = int(image.info.get("loop", 0) or 0)
+                    elif image.size != size:
+                        raise AnimationError(
+                            "Toutes les images de la sequence doivent avoir la meme taille."
+                        )
+                    count += getattr(image, "n_frames", 1) if len(self.images) == 1 else 1
+            except (UnidentifiedImageError, OSError, SyntaxError) as exc:
+                raise AnimationError("Image illisible ou corrompue.") from exc
+            if count > max_frames:
+                raise AnimationError(f"Trop d'images dans l'animation (max {max_frames}).")
+        assert size is not None
+        return SequenceInfo(size, count, loop)
+
+    def frames(self) -> Iterator[Tuple[np.ndarray, int]]:
+        """Yield ``(rgb, duration_ms)`` for every frame, decoding lazily."""
+        for data in self.images:
+            with open_image(data) as image:
+                count = getattr(image, "n_frames", 1) if len(self.images) == 1 else 1
+                for index in range(count):
+                    image.seek(index)
+                    duration = image.info.get("duration") if count > 1 else None
+                    yield as_rgb_array(image), int(duration or self.frame_ms)
+
+
+class KeyframeTracker:
+    """Decides which frames need the model and which reuse the last keyframe's mask.
+
+    Frames are compared to the last keyframe on a small grayscale thumbnail.
+    Below ``threshold`` (mean absolute difference, 0-255) the mask is reused
+    as is; otherwise, with ``warp``, a global translation found by phase
+    correlation is tried, and the mask is shifted if that explains the
+    change. ``max_reuse`` bounds how long a keyframe is reused.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 2.0,
+        max_reuse: int = 12,
+        warp: bool = True,
+        side: int = 96,
+    ) -> None:
+        self.threshold = max(0.0, threshold)
+        self.max_reuse = max(0, max_reuse)
+        self.warp = warp
+        self.side = max(16, side)
+        self._key: Optional[np.ndarray] = None
+        self._reused = 0
+
+    @classmethod
+    def from_env(cls) -> "KeyframeTracker":
+        return cls(
+            threshold=env_float("ANIMATION_REUSE_DIFF", 2.0),
+            max_reuse=env_int("ANIMATION_MAX_REUSE", 12) or 0,
+            warp=env_bool("ANIMATION_WARP", True),
+        )
+
+    def plan(self, rgb: np.ndarray) -> Optional[Shift]:
+        """None when ``rgb`` must become a keyframe, else the shift to apply to its mask."""
+        height, width = rgb.shape[:2]
+        scale = max(width, height) / self.side
+        size = (max(1, round(width / scale)), max(1, round(height / scale)))
+        thumb = cv2.resize(
+            cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), size, interpolation=cv2.INTER_AREA
+        ).astype(np.float32)
+
+        shift = self._match(thumb, scale)
+        if shift is None:
+            self._key = thumb
+            self._reused = 0
+        else:
+            self._reused += 1
+        return shift
+
+    def _match(self, thumb: np.ndarray, scale: float) -> Optional[Shift]:
+        key = self._key
+        if key is None or key.shape != thumb.shape or self._reused >= self.max_reuse:
+            return None
+        if float(np.mean(np.abs(thumb - key))) <= self.threshold:
+            return (0.0, 0.0)
+        if not self.warp:
+            return None
+        (dx, dy), _ = cv2.phaseCorrelate(key, thumb)
+        height, width = thumb.shape
+        # Compare only the area both thumbnails still cover after the shift.
+        moved = cv2.warpAffine(key, np.float32([[1, 0, dx], [0, 1, dy]]), (width, height))
+        x0, x1 = max(0, int(np.ceil(dx))), min(width, width + int(np.floor(dx)))
+        y0, y1 = max(0, int(np.ceil(dy))), min(height, height + int(np.floor(dy)))
+        if x1 - x0 < width // 2 or y1 - y0 < height // 2:
+            return None
+        diff = float(np.mean(np.abs(thumb[y0:y1, x0:x1] - moved[y0:y1, x0:x1])))
+        if diff > self.threshold:
+            return None
+        return (dx * scale, dy * scale)
+
+
+def warp_mask(mask: np.ndarray, shift: Shift) -> np.ndarray:
+    """Translate ``mask`` by ``shift`` pixels, repeating its border."""
+    dx, dy = shift
+    if abs(dx) < 0.5 and abs(dy) < 0.5:
+        return mask
+    height, width = mask.shape[:2]
+    return cv2.warpAffine(
+        mask,
+        np.float32([[1, 0, dx], [0, 1, dy]]),
+        (width, height),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+def _chunk(kind: bytes, payload: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(payload))
+        + kind
+        + payload
+        + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF)
+    )
+
+
+def _png_chunks(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("PNG invalide")
+    offset = len(PNG_SIGNATURE)
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        kind = data[offset + 4 : offset + 8]
+        yield kind, data[offset + 8 : offset + 8 + length]
+        offset += 12 + length
+
+
+class ApngWriter:
+    """Writes an APNG frame by frame from still PNG encodings of each frame.
+
+    The frame count goes into the ``acTL`` header, so it must be known
+    upfront; every frame replaces the previous one (no blending).
+    """
+
+    media_type = "image/png"
+    extension = "png"
+
+    def __init__(self, sink: BinaryIO, size: Tuple[int, int], frame_count: int, loop: int) -> None:
+        self.sink = sink
+        self.size = size
+        self.frame_count = frame_count
+        self.loop = loop
+        self._frames = 0
+        self._sequence = 0
+
+    def add(self, encoded: bytes, duration_ms: int) -> None:
+        chunks = list(_png_chunks(encoded))
+        if self._frames == 0:
+            header = next(payload for kind, payload in chunks if kind == b"IHDR")
+            self.sink.write(PNG_SIGNATURE)
+            self.sink.write(_chunk(b"IHDR", header))
+            self.sink.write(_chunk(b"acTL", struct.pack(">II", self.frame_count, self.loop)))
+        width, height = self.size
+        delay = int(np.clip(duration_ms, 0, 0xFFFF))
+        self.sink.write(
+            _chunk(
+                b"fcTL",
+                struct.pack(">IIIIIHHBB", self._sequence, width, height, 0, 0, delay, 1000, 0, 0),
+            )
+        )
+        self._sequence += 1
+        for kind, payload in chunks:
+            if kind != b"IDAT":
+                continue
+            if self._frames == 0:
+                self.sink.write(_chunk(b"IDAT", payload))
+            else:
+                self.sink.write(_chunk(b"fdAT", struct.pack(">I", self._sequence) + payload))
+                self._sequence += 1
+        self._frames += 1
+
+    def close(self) -> None:
+        if self._frames != self.frame_count:
+            raise RuntimeError(
+                f"APNG incomplet ({self._frames}/{self.frame_count} images)."
+            )
+        self.sink.write(_chunk(b"IEND", b""))
+
+
+def _riff_chunk(kind: bytes, payload: bytes) -> bytes:
+    padding = b"\x00" if len(payload) % 2 else b""
+    return kind + struct.pack("<I", len(payload)) + payload + padding
+
+
+def _webp_chunks(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    if data[:4] != b"RIFF" or data[8:12] != b"WEBP":
+        raise ValueError("WebP invalide")
+    offset = 12
+    while offset + 8 <= len(data):
+        kind = data[offset : offset + 4]
+        (length,) = struct.unpack("<I", data[offset + 4 : offset + 8])
+        yield kind, data[offset + 8 : offset + 8 + length]
+        offset += 8 + length + (length % 2)
+
+
+class WebpAnimWriter:
+    """Writes an animated WebP frame by frame from still WebP encodings.
+
+    The RIFF header holds the total file size, so ``sink`` must be seekable:
+    it is patched in ``close``.
+    """
+
+    media_type = "image/webp"
+    extension = "webp"
+
+    def __init__(self, sink: BinaryIO, size: Tuple[int, int], frame_count: int, loop: int) -> None:
+        self.sink = sink
+        self.size = size
+        self.frame_count = frame_count
+        self._start = sink.tell()
+        width, height = size
+        canvas = struct.pack("<I", width - 1)[:3] + struct.pack("<I", height - 1)[:3]
+        # VP8X flags: animation (0x02) and alpha (0x10).
+        self.sink.write(b"RIFF\x00\x00\x00\x00WEBP")
+        self.sink.write(_riff_chunk(b"VP8X", bytes([0x12, 0, 0, 0]) + canvas))
+        self.sink.write(_riff_chunk(b"ANIM", struct.pack("<IH", 0, min(loop, 0xFFFF))))
+
+    def add(self, encoded: bytes, duration_ms: int) -> None:
+        width, height = self.size
+        header = (
+            b"\x00\x00\x00\x00\x00\x00"
+            + struct.pack("<I", width - 1)[:3]
+            + struct.pack("<I", height - 1)[:3]
+            + struct.pack("<I", int(np.clip(duration_ms, 0, 0xFFFFFF)))[:3]
+            # No blending: every frame replaces the previous one.
+            + b"\x02"
+        )
+        frame = b"".join(
+            _riff_chunk(kind, payload)
+            for kind, payload in _webp_chunks(encoded)
+            if kind in (b"ALPH", b"VP8 ", b"VP8L")
+        )
+        self.sink.write(_riff_chunk(b"ANMF", header + frame))
+
+    def close(self) -> None:
+        end = self.sink.tell()
+        self.sink.seek(self._start + 4)
+        self.sink.write(struct.pack("<I", end - self._start - 8))
+        self.sink.seek(end)
+
+
+def writer_for(spec: OutputSpec) -> type:
+    """Writer class for ``spec``: APNG for png/mask, animated WebP otherwise."""
+    return WebpAnimWriter if spec.normalized().format.startswith("webp") else ApngWriter
+
+
+@dataclass
+class AnimationStats:
+    frames: int = 0
+    keyframes: int = 0
+    warped: int = 0
+
+
+def render_animation(
+    sequence: FrameSequence,
+    info: SequenceInfo,
+    sink: BinaryIO,
+    spec: OutputSpec,
+    predict: PredictMasks,
+    refine: RefineMask,
+    tracker: Optional[KeyframeTracker] = None,
+    window: int = 8,
+    timings: Optional[StageTimings] = None,
+) -> AnimationStats:
+    """Cut out every frame of ``sequence`` and write the animation to ``sink``.
+
+    Frames are handled ``window`` at a time: the keyframes of a window go
+    through ``predict`` in one call (so the model can batch them), the other
+    frames reuse or warp the last keyframe's refined mask. Each frame is
+    encoded and written as soon as its mask exists; only one window of
+    decoded frames is alive at a time.
+    """
+    tracker = tracker or KeyframeTracker()
+    timings = timings or StageTimings()
+    spec = spec.normalized()
+    writer = writer_for(spec)(sink, info.size, info.frame_count, info.loop)
+    stats = AnimationStats()
+    key_mask: Optional[np.ndarray] = None
+    frames = sequence.frames()
+    while True:
+        with timings.stage("decode"):
+            group = [item for _, item in zip(range(max(1, window)), frames)]
+        if not group:
+            break
+        with timings.stage("keyframes"):
+            shifts = [tracker.plan(rgb) for rgb, _ in group]
+        keyframes = [rgb for (rgb, _), shift in zip(group, shifts) if shift is None]
+        masks = iter(predict(keyframes) if keyframes else [])
+        for (rgb, duration), shift in zip(group, shifts):
+            if shift is None:
+                with timings.stage("refine"):
+                    key_mask = refine(rgb, next(masks))
+                mask = key_mask
+                stats.keyframes += 1
+            else:
+                assert key_mask is not None
+                with timings.stage("warp"):
+                    mask = warp_mask(key_mask, shift)
+                if shift != (0.0, 0.0):
+                    stats.warped += 1
+            with timings.stage("encode"):
+                writer.add(encode_cutout(rgb, mask, spec), duration)
+            stats.frames += 1
+        del group, keyframes
+    writer.close()
+    return stats
+
+
+__all__ = [
+    "ANIMATED_FORMATS",
+    "ANIMATED_MIME",
+    "AnimationError",
+    "AnimationStats",
+    "ApngWriter",
+    "DEFAULT_FRAME_MS",
+    "FrameSequence",
+    "KeyframeTracker",
+    "PLAY_ONCE",
+    "SequenceInfo",
+    "WebpAnimWriter",
+    "frame_sort_key",
+    "render_animation",
+    "warp_mask",
+    "writer_for",
+]
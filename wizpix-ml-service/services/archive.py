@@ -0,0 +1,145 @@
+import zipfile
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import List, Optional, Set
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+ZIP_MIME = {"application/zip", "application/x-zip-compressed", "multipart/x-zip"}
+
+
+class ArchiveError(ValueError):
+    """Raised when an uploaded ZIP cannot be used as a batch."""
+
+
+@dataclass
+class BatchItem:
+    """One input image of a batch; ``error`` is set when it was rejected upfront."""
+
+    name: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+def is_zip_upload(filename: Optional[str], content_type: Optional[str]) -> bool:
+    return (content_type or "").lower() in ZIP_MIME or (filename or "").lower().endswith(".zip")
+
+
+def read_zip_items(
+    data: bytes,
+    max_files: int,
+    max_file_bytes: int,
+    max_total_bytes: int,
+) -> List[BatchItem]:
+    """List the images of a ZIP, checking declared sizes before inflating anything."""
+    try:
+        archive = zipfile.ZipFile(BytesIO(data))
+    except zipfile.BadZipFile as exc:
+        raise ArchiveError("Archive ZIP invalide.") from exc
+
+    items: List[BatchItem] = []
+    with archive:
+        entries = [
+            info
+            for info in archive.infolist()
+            if not info.is_dir()
+            and not PurePosixPath(info.filename).name.startswith(".")
+            and not info.filename.startswith("__MACOSX/")
+        ]
+        if len(entries) > max_files:
+            raise ArchiveError(
+                f"Trop de fichiers dans l'archive ({len(entries)} > {max_files})."
+            )
+        total = sum(info.file_size for info in entries)
+        if total > max_total_bytes:
+            raise ArchiveError("Archive trop volumineuse une fois decompressee.")
+
+        for info in entries:
+            name = info.filename
+            if PurePosixPath(name).suffix.lower() not in IMAGE_EXTENSIONS:
+                items.append(
+                    BatchItem(name, error="Format non supporte (autorise: PNG, JPEG, WEBP).")
+                )
+            elif info.file_size > max_file_bytes:
+                items.append(BatchItem(name, error="Fichier trop volumineux."))
+            else:
+                items.append(BatchItem(name, data=archive.read(info)))
+    return items
+
+
+class _Chunks:
+    """Write-only sink collecting what ZipFile writes until it is drained."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        return None
+
+    def drain(self) -> bytes:
+        chunk = b"".join(self._parts)
+        self._parts.clear()
+        return chunk
+
+
+class ZipStreamWriter:
+    """Builds a ZIP entry by entry; ``drain()`` returns the bytes produced so far.
+
+    The sink is not seekable, so ZipFile writes data descriptors and only the
+    current entry is ever buffered. Images are stored, not deflated.
+    """
+
+    def __init__(self) -> None:
+        self._sink = _Chunks()
+        self._zip = zipfile.ZipFile(
+            self._sink,  # type: ignore[arg-type]
+            mode="w",
+            compression=zipfile.ZIP_STORED,
+        )
+        self._names: Set[str] = set()
+
+    def unique_name(self, name: str) -> str:
+        path = PurePosixPath(name)
+        candidate, counter = name, 1
+        while candidate in self._names:
+            counter += 1
+            candidate = str(path.with_name(f"{path.stem}-{counter}{path.suffix}"))
+        self._names.add(candidate)
+        return candidate
+
+    def add(self, name: str, data: bytes, compress: bool = False) -> str:
+        name = self.unique_name(name)
+        self._zip.writestr(
+            name,
+            data,
+            compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+        )
+        return name
+
+    def drain(self) -> bytes:
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+def output_name(input_name: str, extension: str) -> str:
+    stem = PurePosixPath(input_name).stem or "image"
+    safe = "".join(ch if ch.isalnum() or ch in ("-", "_") else "-" for ch in stem)
+    return f"{safe}-bg-removed.{extension}"
+
+
+__all__ = [
+    "ArchiveError",
+    "BatchItem",
+    "IMAGE_EXTENSIONS",
+    "ZipStreamWriter",
+    "is_zip_upload",
+    "output_name",
+    "read_zip_items",
+]
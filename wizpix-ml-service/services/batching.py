@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .settings import env_float, env_int
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _PendingInput:
+    __slots__ = ("tensor", "done", "result", "error")
+
+    def __init__(self, tensor: np.ndarray) -> None:
+        self.tensor = tensor
+        self.done = False
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class MaskBatcher:
+    """Groups concurrent single-image inputs into one batched ORT call.
+
+    There is no dispatcher thread: the first caller that finds nobody
+    collecting becomes the leader, waits until ``max_batch_size`` inputs are
+    queued (or ``max_wait_ms`` elapsed) and runs the batch for everyone. The
+    leader only waits for callers that reserved a slot, so a lone request is
+    never delayed.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 15.0,
+    ) -> None:
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.static = False
+
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._queue: List[_PendingInput] = []
+        self._collecting = False
+        self._reserved = 0
+        self._batches = 0
+        self._items = 0
+        self._histogram: Dict[int, int] = {}
+
+    @classmethod
+    def from_env(cls, run_batch: Callable[[np.ndarray], np.ndarray]) -> "MaskBatcher":
+        return cls(
+            run_batch,
+            max_batch_size=env_int("BATCH_MAX_SIZE", 4) or 1,
+            max_wait_ms=env_float("BATCH_MAX_WAIT_MS", 15.0),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and not self.static
+
+    @contextmanager
+    def reserve(self) -> Iterator[None]:
+        """Announce an upcoming ``run`` call so the leader can wait for it."""
+        with self._cond:
+            self._reserved += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved -= 1
+                self._cond.notify_all()
+
+    def run(self, tensor: np.ndarray) -> np.ndarray:
+        """Run a ``1xCxHxW`` tensor, possibly batched with concurrent callers."""
+        if not self.enabled:
+            return self._run_single(tensor)
+
+        item = _PendingInput(tensor)
+        with self._cond:
+            self._queue.append(item)
+            self._cond.notify_all()
+            while not item.done:
+                if self._collecting:
+                    self._cond.wait()
+                    continue
+                batch = self._collect()
+                self._cond.release()
+                try:
+                    self._execute(batch)
+                finally:
+                    self._cond.acquire()
+                self._cond.notify_all()
+
+        if item.error is not None:
+            raise item.error
+        assert item.result is not None
+        return item.result
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "static_batch": self.static,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self._batches,
+                "items": self._items,
+                "histogram": {
+                    str(size): count for size, count in sorted(self._histogram.items())
+                },
+            }
+
+    def _collect(self) -> List[_PendingInput]:
+        # Called with the lock held.
+        self._collecting = True
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while True:
+            target = min(self.max_batch_size, max(self._reserved, 1))
+            if len(self._queue) >= target:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        batch = self._queue[: self.max_batch_size]
+        del self._queue[: self.max_batch_size]
+        self._collecting = False
+        self._cond.notify_all()
+        return batch
+
+    def _execute(self, batch: List[_PendingInput]) -> None:
+        try:
+            if len(batch) == 1:
+                outputs = [self._run_single(batch[0].tensor)]
+            else:
+                outputs = self._run_grouped(batch)
+        except BaseException as exc:  # noqa: BLE001
+            for item in batch:
+                item.error = exc
+                item.done = True
+            return
+        for item, output in zip(batch, outputs):
+            item.result = output
+            item.done = True
+
+    def _stack(self, batch: List[_PendingInput]) -> np.ndarray:
+        # Each leader thread reuses one max-size batch buffer.
+        sample = batch[0].tensor
+        shape = (self.max_batch_size,) + sample.shape[1:]
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape != shape or buffer.dtype != sample.dtype:
+            buffer = np.empty(shape, dtype=sample.dtype)
+            self._local.buffer = buffer
+        for index, item in enumerate(batch):
+            buffer[index] = item.tensor[0]
+        return buffer[: len(batch)]
+
+    def _run_grouped(self, batch: List[_PendingInput]) -> List[np.ndarray]:
+        stacked = self._stack(batch)
+        try:
+            values = self._run_batch(stacked)
+        except Exception:  # noqa: BLE001
+            if self.static:
+                raise
+            LOGGER.warning(
+                "Execution batch (%d) refusee par le modele; bascule en batch statique.",
+                len(batch),
+                exc_info=True,
+            )
+            self.static = True
+            return [self._run_single(item.tensor) for item in batch]
+        self._record(len(batch))
+        return [values[index : index + 1] for index in range(len(batch))]
+
+    def _run_single(self, tensor: np.ndarray) -> np.ndarray:
+        values = self._run_batch(tensor)
+        self._record(1)
+        return values
+
+    def _record(self, size: int) -> None:
+        with self._cond:
+            self._batches += 1
+            self._items += size
+            self._histogram[size] = self._histogram.get(size, 0) + 1
+
+
+__all__ = ["MaskBatcher"]
@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .settings import CACHE_DIR, env_bool, env_int
+
+LOGGER = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+_HEX_KEY = re.compile(r"[0-9a-f]{2,128}")
+
+
+def content_key(data: bytes, *parts: str) -> str:
+    """Hash the payload together with every option that changes the output."""
+    digest = hashlib.sha256(data)
+    for part in parts:
+        digest.update(b"\x00")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ByteLRU:
+    """Thread-safe LRU mapping bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = len) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= self._sizeof(previous)
+            self._entries[key] = value
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= self._sizeof(evicted)
+                self.evictions += 1
+
+
+class DiskCache:
+    """On-disk tier: one file per key, oldest files evicted above ``max_bytes``.
+
+    Several processes may share the directory. Each one only sees its own
+    writes between scans, so the index is rebuilt from the directory (mtime
+    order, reads touch their file) every ``max_bytes / 16`` bytes written:
+    the cap holds for all of them together, give or take one such step each.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max(0, max_bytes)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self.size_bytes = 0
+        self.evictions = 0
+        self._rescan_bytes = max(1, self.max_bytes // 16)
+        self._unscanned = 0
+        self._load_index()
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            path = self._path(key)
+            data = path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            LOGGER.warning("Ecriture du cache disque impossible: %s", path, exc_info=True)
+            return
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous
+            self._index[key] = len(value)
+            self.size_bytes += len(value)
+            self._unscanned += len(value)
+            if self._unscanned >= self._rescan_bytes:
+                self._load_index()
+            while self.size_bytes > self.max_bytes and self._index:
+                evicted_key, evicted_size = self._index.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+                try:
+                    self._path(evicted_key).unlink()
+                except OSError:
+                    pass
+
+    def _path(self, key: str) -> Path:
+        # Keys are hex digests; anything else could point outside the directory.
+        if not _HEX_KEY.fullmatch(key):
+            raise ValueError(f"Cle de cache invalide: {key!r}")
+        return self.directory / key[:2] / f"{key}.bin"
+
+    def _load_index(self) -> None:
+        self._index.clear()
+        self.size_bytes = 0
+        self._unscanned = 0
+        entries = []
+        for path in self.directory.glob("*/*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.size_bytes += size
+
+
+class ResultCache:
+    """Content-addressed cache of encoded results (memory LRU + optional disk)."""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self.memory = ByteLRU(max_bytes)
+        self.disk = (
+            DiskCache(disk_dir, disk_max_bytes)
+            if disk_dir is not None and disk_max_bytes > 0
+            else None
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        disk_dir = CACHE_DIR / "results" if env_bool("RESULT_CACHE_DISK", False) else None
+        return cls(
+            max_bytes=(env_int("RESULT_CACHE_MAX_MB", 256) or 0) * MB,
+            disk_dir=disk_dir,
+            disk_max_bytes=(env_int("RESULT_CACHE_DISK_MAX_MB", 2048) or 0) * MB,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory.max_bytes > 0 or self.disk is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        payload = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": {
+                "entries": len(self.memory),
+                "bytes": self.memory.size_bytes,
+                "max_bytes": self.memory.max_bytes,
+                "evictions": self.memory.evictions,
+            },
+            "disk": None,
+        }
+        if self.disk is not None:
+            payload["disk"] = {
+                "path": str(self.disk.directory),
+                "bytes": self.disk.size_bytes,
+                "max_bytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+        return payload
+
+
+__all__ = ["MB", "ByteLRU", "DiskCache", "ResultCache", "content_key"]
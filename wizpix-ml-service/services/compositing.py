@@ -0,0 +1,134 @@
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+SUPPORTED_BACKGROUNDS = {"transparent", "color", "gradient", "image", "blur"}
+
+Color = Tuple[int, int, int]
+
+
+def parse_hex_color(value: str) -> Color:
+    raw = (value or "").strip().lstrip("#")
+    if len(raw) == 3:
+        raw = "".join(ch * 2 for ch in raw)
+    if len(raw) != 6:
+        raise ValueError(f"Couleur invalide: {value!r} (attendu #RRGGBB)")
+    try:
+        return (int(raw[0:2], 16), int(raw[2:4], 16), int(raw[4:6], 16))
+    except ValueError as exc:
+        raise ValueError(f"Couleur invalide: {value!r} (attendu #RRGGBB)") from exc
+
+
+@dataclass(frozen=True)
+class BackgroundSpec:
+    """Describes the background a stored cut-out is composited over."""
+
+    kind: str = "transparent"
+    color: Color = (255, 255, 255)
+    color_end: Color = (0, 0, 0)
+    angle: float = 90.0
+    blur_radius: int = 25
+    image_bytes: Optional[bytes] = None
+
+    def validate(self) -> None:
+        if self.kind not in SUPPORTED_BACKGROUNDS:
+            raise ValueError(
+                f"Fond inconnu: {self.kind} "
+                f"(options: {', '.join(sorted(SUPPORTED_BACKGROUNDS))})"
+            )
+        if self.kind == "image" and not self.image_bytes:
+            raise ValueError("Une image de fond est requise pour background=image.")
+        if self.blur_radius < 1:
+            raise ValueError("blur_radius doit etre >= 1.")
+
+
+def render_background(spec: BackgroundSpec, rgb: np.ndarray) -> np.ndarray:
+    """Return an ``HxWx3`` uint8 background matching ``rgb``'s size."""
+    height, width = rgb.shape[:2]
+    if spec.kind == "color":
+        return np.full((height, width, 3), spec.color, dtype=np.uint8)
+    if spec.kind == "gradient":
+        return _linear_gradient(width, height, spec.color, spec.color_end, spec.angle)
+    if spec.kind == "image":
+        assert spec.image_bytes is not None
+        return _cover_image(spec.image_bytes, width, height)
+    if spec.kind == "blur":
+        return _fast_blur(rgb, spec.blur_radius)
+    raise ValueError(f"Fond sans rendu: {spec.kind}")
+
+
+def blend_over(rgb: np.ndarray, alpha: np.ndarray, background: np.ndarray) -> np.ndarray:
+    """Alpha-blend ``rgb`` over ``background``; ``alpha`` is uint8 or float in [0, 1]."""
+    if alpha.dtype == np.uint8:
+        weights = alpha.astype(np.float32)
+        weights *= 1.0 / 255.0
+    else:
+        weights = np.clip(alpha, 0.0, 1.0).astype(np.float32, copy=False)
+    inverse = 1.0 - weights
+    return cv2.blendLinear(rgb, background, weights, inverse)
+
+
+def _linear_gradient(
+    width: int,
+    height: int,
+    start: Color,
+    end: Color,
+    angle: float,
+) -> np.ndarray:
+    # A linear ramp survives bilinear upscaling, so build it small and resize.
+    scale = min(1.0, 256.0 / max(width, height))
+    small_w = max(2, int(round(width * scale)))
+    small_h = max(2, int(round(height * scale)))
+    theta = math.radians(angle)
+    xs = np.linspace(-0.5, 0.5, small_w, dtype=np.float32) * math.sin(theta)
+    ys = np.linspace(-0.5, 0.5, small_h, dtype=np.float32) * -math.cos(theta)
+    t = xs[None, :] + ys[:, None]
+    span = float(t.max() - t.min())
+    t = (t - t.min()) / span if span > 1e-6 else np.zeros_like(t)
+    start_arr = np.asarray(start, dtype=np.float32)
+    delta = np.asarray(end, dtype=np.float32) - start_arr
+    small = (start_arr + t[..., None] * delta).astype(np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def _cover_image(image_bytes: bytes, width: int, height: int) -> np.ndarray:
+    with Image.open(BytesIO(image_bytes)) as image:
+        image.draft("RGB", (width, height))
+        source = np.asarray(image.convert("RGB"))
+    src_h, src_w = source.shape[:2]
+    scale = max(width / src_w, height / src_h)
+    crop_w = min(src_w, int(math.ceil(width / scale)))
+    crop_h = min(src_h, int(math.ceil(height / scale)))
+    x0 = (src_w - crop_w) // 2
+    y0 = (src_h - crop_h) // 2
+    cropped = source[y0 : y0 + crop_h, x0 : x0 + crop_w]
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(cropped, (width, height), interpolation=interpolation)
+
+
+def _fast_blur(rgb: np.ndarray, radius: int) -> np.ndarray:
+    # Blur a downscaled copy: a large Gaussian at full resolution is the slow part.
+    height, width = rgb.shape[:2]
+    factor = max(1, radius // 8)
+    small = cv2.resize(
+        rgb,
+        (max(1, width // factor), max(1, height // factor)),
+        interpolation=cv2.INTER_AREA,
+    )
+    sigma = max(0.5, radius / factor / 2.0)
+    small = cv2.GaussianBlur(small, (0, 0), sigma)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+__all__ = [
+    "BackgroundSpec",
+    "SUPPORTED_BACKGROUNDS",
+    "blend_over",
+    "parse_hex_color",
+    "render_background",
+]
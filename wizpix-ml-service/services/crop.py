@@ -0,0 +1,92 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .settings import env_float, env_int
+
+
+@dataclass(frozen=True)
+class CropBox:
+    """Pixel rectangle ``[left, right) x [top, bottom)``."""
+
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def slices(self) -> Tuple[slice, slice]:
+        return slice(self.top, self.bottom), slice(self.left, self.right)
+
+    def as_list(self) -> list:
+        return [self.left, self.top, self.right, self.bottom]
+
+
+def subject_bbox(mask: np.ndarray, threshold: float) -> Optional[CropBox]:
+    """Bounding box of the pixels of ``mask`` at or above ``threshold``."""
+    rows = np.flatnonzero((mask >= threshold).any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero((mask[rows[0] : rows[-1] + 1] >= threshold).any(axis=0))
+    return CropBox(int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+@dataclass(frozen=True)
+class CropPolicy:
+    """When and how to crop around the subject before the pro model runs.
+
+    The subject is located on a ``thumbnail`` px image with the fast model
+    (``localizer="fast"``) or the pro model itself (``"pro"``). ``padding``
+    is added on every side as a fraction of the subject box; crops covering
+    more than ``max_area`` of the frame are not worth it and the whole image
+    is used instead.
+    """
+
+    thumbnail: int = 320
+    threshold: float = 0.1
+    padding: float = 0.15
+    max_area: float = 0.6
+    localizer: str = "fast"
+
+    @classmethod
+    def from_env(cls) -> "CropPolicy":
+        return cls(
+            thumbnail=env_int("CROP_THUMBNAIL", 320) or 320,
+            threshold=env_float("CROP_THRESHOLD", 0.1),
+            padding=env_float("CROP_PADDING", 0.15),
+            max_area=env_float("CROP_MAX_AREA", 0.6),
+            localizer=os.getenv("CROP_LOCALIZER", "fast").strip().lower(),
+        )
+
+    def plan(self, thumb_mask: np.ndarray, full_size: Tuple[int, int]) -> Optional[CropBox]:
+        """Map the subject box of ``thumb_mask`` to a padded ``full_size`` crop."""
+        box = subject_bbox(thumb_mask, self.threshold)
+        if box is None:
+            return None
+        full_w, full_h = full_size
+        scale_x = full_w / float(thumb_mask.shape[1])
+        scale_y = full_h / float(thumb_mask.shape[0])
+        pad_x = box.width * self.padding
+        pad_y = box.height * self.padding
+        crop = CropBox(
+            left=max(0, int(np.floor((box.left - pad_x) * scale_x))),
+            top=max(0, int(np.floor((box.top - pad_y) * scale_y))),
+            right=min(full_w, int(np.ceil((box.right + pad_x) * scale_x))),
+            bottom=min(full_h, int(np.ceil((box.bottom + pad_y) * scale_y))),
+        )
+        if crop.width * crop.height > self.max_area * full_w * full_h:
+            return None
+        return crop
+
+
+__all__ = ["CropBox", "CropPolicy", "subject_bbox"]
@@ -0,0 +1,95 @@
+import io
+import mmap
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .preprocess import as_rgb_array
+from .settings import env_bool
+
+ImageSource = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# Formats whose decoder honours Image.draft() (libjpeg DCT scaling).
+DRAFT_FORMATS = {"JPEG", "MPO"}
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file over a buffer, without copying it."""
+
+    def __init__(self, source: ImageSource) -> None:
+        self._view = memoryview(source).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore[override]
+        chunk = self._view[self._pos : self._pos + len(buffer)]
+        buffer[: len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """``Image.open`` over ``source``; each call gets its own file position."""
+    if isinstance(source, bytes):
+        return Image.open(io.BytesIO(source))  # BytesIO shares immutable bytes
+    return Image.open(io.BufferedReader(_BufferReader(source)))
+
+
+@dataclass(frozen=True)
+class ImageHeader:
+    format: Optional[str]
+    width: int
+    height: int
+
+
+def read_header(source: ImageSource) -> ImageHeader:
+    """Format and full-resolution size, read without decoding pixels."""
+    with open_image(source) as image:
+        return ImageHeader(image.format, image.width, image.height)
+
+
+def decode_rgb(
+    source: ImageSource,
+    draft_size: Optional[Tuple[int, int]] = None,
+) -> np.ndarray:
+    """Decode ``source`` to a read-only ``HxWx3`` uint8 array.
+
+    With ``draft_size``, JPEGs are decoded at the smallest DCT scale (1/2,
+    1/4, 1/8) that still covers it; other formats decode at full size.
+    """
+    with open_image(source) as image:
+        if (
+            draft_size is not None
+            and image.format in DRAFT_FORMATS
+            and env_bool("DECODE_DRAFT", True)
+        ):
+            image.draft("RGB", draft_size)
+        return as_rgb_array(image)
+
+
+__all__ = [
+    "DRAFT_FORMATS",
+    "ImageHeader",
+    "ImageSource",
+    "decode_rgb",
+    "open_image",
+    "read_header",
+]
@@ -0,0 +1,140 @@
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .settings import env_int
+
+OUTPUT_FORMATS: Dict[str, str] = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "webp-lossy": "image/webp",
+    "mask": "image/png",
+}
+EXTENSIONS = {"png": "png", "webp": "webp", "webp-lossy": "webp", "mask": "png"}
+
+MAX_EFFORT = 9
+# Effort 0-9 is the zlib level for PNG; at or below this level the zlib
+# RLE strategy replaces the default one (faster, slightly larger files).
+PNG_FAST_EFFORT = 1
+
+# Largest per-thread RGBA buffer kept between requests (64 MB: 16 MP);
+# bigger images get a temporary one so a rare huge upload is not pinned.
+RETAINED_BUFFER_BYTES = max(0, env_int("OUTPUT_BUFFER_MAX_MB", 64) or 0) * 1024 * 1024
+
+_local = threading.local()
+
+
+def default_effort() -> int:
+    return int(np.clip(env_int("OUTPUT_EFFORT", 6) or 0, 0, MAX_EFFORT))
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """Output format plus an effort knob shared by all formats (0 fastest, 9 smallest)."""
+
+    format: str = "png"
+    effort: Optional[int] = None
+
+    def normalized(self) -> "OutputSpec":
+        name = (self.format or "png").lower()
+        if name not in OUTPUT_FORMATS:
+            name = "png"
+        effort = default_effort() if self.effort is None else int(self.effort)
+        return OutputSpec(name, int(np.clip(effort, 0, MAX_EFFORT)))
+
+    @property
+    def media_type(self) -> str:
+        return OUTPUT_FORMATS[self.format]
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.format]
+
+
+def _rgba_buffer(height: int, width: int) -> np.ndarray:
+    # Grow-only per-thread buffer: no new 4-channel image per request.
+    needed = height * width * 4
+    if needed > RETAINED_BUFFER_BYTES:
+        return np.empty((height, width, 4), dtype=np.uint8)
+    buffer = getattr(_local, "rgba", None)
+    if buffer is None or buffer.size < needed:
+        buffer = np.empty(needed, dtype=np.uint8)
+        _local.rgba = buffer
+    return buffer[:needed].reshape(height, width, 4)
+
+
+def alpha_to_uint8(alpha: np.ndarray) -> np.ndarray:
+    """Clip a float mask to [0, 1] and scale it to uint8 (truncating)."""
+    if alpha.dtype == np.uint8:
+        return alpha
+    scaled = np.clip(alpha, 0.0, 1.0, dtype=np.float32)
+    scaled *= 255.0
+    return scaled.astype(np.uint8)
+
+
+def _png_params(effort: int) -> list:
+    params = [cv2.IMWRITE_PNG_COMPRESSION, effort]
+    if effort <= PNG_FAST_EFFORT:
+        params += [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE]
+    return params
+
+
+def _imencode(image: np.ndarray, params: list) -> bytes:
+    ok, encoded = cv2.imencode(".png", image, params)
+    if not ok:
+        raise RuntimeError("Encodage PNG impossible")
+    return encoded.tobytes()
+
+
+def encode_cutout(rgb: np.ndarray, alpha: np.ndarray, spec: OutputSpec = OutputSpec()) -> bytes:
+    """Encode ``rgb`` with straight ``alpha`` (float in [0, 1] or uint8)."""
+    spec = spec.normalized()
+    assert spec.effort is not None
+    alpha_u8 = alpha_to_uint8(alpha)
+    if spec.format == "mask":
+        return _imencode(alpha_u8, _png_params(spec.effort))
+
+    height, width = rgb.shape[:2]
+    buffer = _rgba_buffer(height, width)
+    if spec.format == "png":
+        cv2.cvtColor(rgb, cv2.COLOR_RGB2BGRA, dst=buffer)
+        buffer[..., 3] = alpha_u8
+        return _imencode(buffer, _png_params(spec.effort))
+
+    cv2.cvtColor(rgb, cv2.COLOR_RGB2RGBA, dst=buffer)
+    buffer[..., 3] = alpha_u8
+    image = Image.frombuffer("RGBA", (width, height), buffer, "raw", "RGBA", 0, 1)
+    method = round(spec.effort * 6 / MAX_EFFORT)
+    output = BytesIO()
+    if spec.format == "webp":
+        # For lossless WebP, "quality" is the compression effort.
+        image.save(
+            output,
+            format="WEBP",
+            lossless=True,
+            quality=spec.effort * 80 // MAX_EFFORT,
+            method=method,
+        )
+    else:
+        image.save(
+            output,
+            format="WEBP",
+            quality=env_int("WEBP_LOSSY_QUALITY", 90) or 90,
+            method=method,
+        )
+    return output.getvalue()
+
+
+__all__ = [
+    "OUTPUT_FORMATS",
+    "OutputSpec",
+    "RETAINED_BUFFER_BYTES",
+    "alpha_to_uint8",
+    "default_effort",
+    "encode_cutout",
+]
@@ -0,0 +1,439 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .archive import BatchItem
+from .scheduler import DEFAULT_LANE, LANES
+from .settings import JOBS_DIR, env_float, env_int
+
+LOGGER = logging.getLogger(__name__)
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    options TEXT NOT NULL,
+    items TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    error TEXT,
+    result_name TEXT,
+    media_type TEXT,
+    lane TEXT NOT NULL DEFAULT 'normal',
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+# Databases created before priority lanes (or leases) existed lack the columns.
+_MIGRATIONS = {
+    "lane": "ALTER TABLE jobs ADD COLUMN lane TEXT NOT NULL DEFAULT 'normal'",
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE jobs ADD COLUMN lease_until REAL",
+}
+_LANE_ORDER = " ".join(f"WHEN '{lane}' THEN {rank}" for rank, lane in enumerate(LANES))
+
+
+class JobNotFoundError(LookupError):
+    """Raised when a job id is unknown or its result has expired."""
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting."""
+
+
+@dataclass
+class Job:
+    """One submitted removal: a single image or a batch producing a ZIP."""
+
+    id: str
+    mode: str
+    status: str
+    options: Dict[str, Any]
+    items: List[Dict[str, Optional[str]]]
+    total: int
+    done: int = 0
+    failed: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    expires_at: Optional[float] = None
+    error: Optional[str] = None
+    result_name: Optional[str] = None
+    media_type: Optional[str] = None
+    lane: str = DEFAULT_LANE
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "lane": self.lane,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "progress": round(self.done / self.total, 3) if self.total else 1.0,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "expires_at": self.expires_at,
+            "error": self.error,
+        }
+
+
+class JobStore:
+    """SQLite-backed job queue; inputs and results live next to the database.
+
+    Inputs are written before the job is queued, so queued jobs (and jobs
+    interrupted while running) are picked up again after a restart. Results
+    are kept ``ttl_s`` seconds after the job ends, then garbage-collected.
+
+    Several processes (uvicorn workers) may share the database: a claim is
+    a single UPDATE, and a running job holds a lease of ``lease_s`` seconds
+    that its owner renews. Only jobs whose lease expired are requeued.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttl_s: float = 3600.0,
+        max_queued: int = 100,
+        lease_s: float = 60.0,
+    ) -> None:
+        self.directory = directory
+        self.ttl_s = max(0.0, ttl_s)
+        self.max_queued = max(1, max_queued)
+        self.lease_s = max(1.0, lease_s)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(directory / "jobs.sqlite3"), check_same_thread=False, isolation_level=None
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._db.execute(statement)
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        return cls(
+            directory=JOBS_DIR,
+            ttl_s=env_float("JOBS_TTL_S", 3600.0),
+            max_queued=env_int("JOBS_MAX_QUEUED", 100) or 100,
+            lease_s=env_float("JOBS_LEASE_S", 60.0),
+        )
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.directory / job_id
+
+    def input_path(self, job: Job, index: int) -> Path:
+        return self.job_dir(job.id) / f"input-{index}"
+
+    def result_path(self, job: Job) -> Path:
+        return self.job_dir(job.id) / "result"
+
+    def submit(
+        self,
+        items: List[BatchItem],
+        options: Dict[str, Any],
+        mode: str,
+        lane: str = DEFAULT_LANE,
+    ) -> Job:
+        if self.count("queued") >= self.max_queued:
+            raise JobQueueFullError("Trop de taches en attente, reessayez plus tard.")
+        job = Job(
+            id=uuid.uuid4().hex,
+            mode=mode,
+            status="queued",
+            options=options,
+            items=[{"name": item.name, "error": item.error} for item in items],
+            total=len(items),
+            lane=lane if lane in LANES else DEFAULT_LANE,
+        )
+        job_dir = self.job_dir(job.id)
+        job_dir.mkdir(parents=True)
+        for index, item in enumerate(items):
+            if item.data is not None:
+                self.input_path(job, index).write_bytes(item.data)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs"
+                " (id, mode, status, options, items, total, created_at, updated_at, lane)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.mode,
+                    job.status,
+                    json.dumps(job.options),
+                    json.dumps(job.items),
+                    job.total,
+                    job.created_at,
+                    job.updated_at,
+                    job.lane,
+                ),
+            )
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            raise JobNotFoundError("Tache inconnue ou expiree.")
+        return _job_from_row(row)
+
+    def load_items(self, job: Job) -> List[BatchItem]:
+        items = []
+        for index, entry in enumerate(job.items):
+            name, error = entry["name"] or f"image-{index + 1}", entry["error"]
+            if error:
+                items.append(BatchItem(name, error=error))
+                continue
+            try:
+                items.append(BatchItem(name, data=self.input_path(job, index).read_bytes()))
+            except OSError:
+                items.append(BatchItem(name, error="Fichier d'entree introuvable."))
+        return items
+
+    def claim(self) -> Optional[Job]:
+        """Mark the oldest queued job of the highest lane as running and return it."""
+        now = time.time()
+        # One statement, so two processes can never claim the same job.
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated_at = ?"
+                " WHERE status = 'queued' AND id = ("
+                "SELECT id FROM jobs WHERE status = 'queued'"
+                f" ORDER BY CASE lane {_LANE_ORDER} ELSE {len(LANES)} END, created_at LIMIT 1"
+                ") RETURNING *",
+                (self.owner, now + self.lease_s, now),
+            ).fetchone()
+        return None if row is None else _job_from_row(row)
+
+    def progress(self, job_id: str, done: int, failed: int) -> None:
+        self._update(job_id, done=done, failed=failed, lease_until=time.time() + self.lease_s)
+
+    def renew_leases(self) -> int:
+        """Extend the lease of every job this store is running."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (now + self.lease_s, self.owner),
+            )
+        return cursor.rowcount
+
+    def finish(self, job: Job, result_name: str, media_type: str) -> None:
+        self._end(job, "done", result_name=result_name, media_type=media_type)
+
+    def fail(self, job: Job, error: str) -> None:
+        self._end(job, "failed", error=error)
+
+    def requeue_interrupted(self, now: Optional[float] = None) -> int:
+        """Running jobs whose lease expired (their process stopped) start over."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', done = 0, failed = 0, owner = NULL,"
+                " lease_until = NULL, updated_at = ?"
+                " WHERE status = 'running' AND (lease_until IS NULL OR lease_until <= ?)",
+                (now, now),
+            )
+        return cursor.rowcount
+
+    def collect_garbage(self, now: Optional[float] = None) -> int:
+        """Delete expired jobs and orphan directories; returns the jobs removed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [
+                row["id"]
+                for row in self._db.execute(
+                    "SELECT id FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+                )
+            ]
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+            known = {row["id"] for row in self._db.execute("SELECT id FROM jobs")}
+        for job_id in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        for path in self.directory.iterdir():
+            # Left over by a crash between writing the inputs and the INSERT.
+            if path.is_dir() and path.name not in known:
+                try:
+                    stale = path.stat().st_mtime + self.ttl_s <= now
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(path, ignore_errors=True)
+        return len(expired)
+
+    def count(self, status: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+            ).fetchone()
+        return int(row[0])
+
+    def snapshot(self) -> Dict[str, int]:
+        return {status: self.count(status) for status in JOB_STATES}
+
+    def _end(self, job: Job, status: str, **values: Any) -> None:
+        self._update(
+            job.id, status=status, expires_at=time.time() + self.ttl_s, lease_until=None, **values
+        )
+        # Inputs are no longer needed once the job has ended.
+        for index in range(job.total):
+            try:
+                self.input_path(job, index).unlink()
+            except OSError:
+                pass
+
+    def _update(self, job_id: str, **values: Any) -> None:
+        values["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in values)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", (*values.values(), job_id)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _job_from_row(row: sqlite3.Row) -> Job:
+    return Job(
+        id=row["id"],
+        mode=row["mode"],
+        status=row["status"],
+        options=json.loads(row["options"]),
+        items=json.loads(row["items"]),
+        total=row["total"],
+        done=row["done"],
+        failed=row["failed"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        expires_at=row["expires_at"],
+        error=row["error"],
+        result_name=row["result_name"],
+        media_type=row["media_type"],
+        lane=row["lane"],
+    )
+
+
+class JobRunner:
+    """Runs queued jobs on the event loop and garbage-collects expired ones.
+
+    ``handler`` does the actual work (through the inference scheduler) and
+    must call ``store.finish``; an exception marks the job as failed. Store
+    calls run in threads so SQLite and file I/O never block the loop.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Job], Awaitable[None]],
+        concurrency: int = 1,
+        gc_interval_s: float = 60.0,
+    ) -> None:
+        self.store = store
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.gc_interval_s = max(0.1, gc_interval_s)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    @classmethod
+    def from_env(cls, store: JobStore, handler: Callable[[Job], Awaitable[None]]) -> "JobRunner":
+        return cls(
+            store,
+            handler,
+            concurrency=env_int("JOBS_CONCURRENCY", 1) or 1,
+            gc_interval_s=env_float("JOBS_GC_INTERVAL_S", 60.0),
+        )
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._collect()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.gc_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.warning("Tache %s en echec", job.id, exc_info=True)
+                await asyncio.to_thread(self.store.fail, job, str(exc) or type(exc).__name__)
+
+    async def _collect(self) -> None:
+        while True:
+            try:
+                # Also picks up the jobs of a sibling worker that died.
+                requeued = await asyncio.to_thread(self.store.requeue_interrupted)
+                if requeued:
+                    LOGGER.info("%d tache(s) interrompue(s) remise(s) en file.", requeued)
+                    self.notify()
+                removed = await asyncio.to_thread(self.store.collect_garbage)
+                if removed:
+                    LOGGER.info("%d tache(s) expiree(s) supprimee(s).", removed)
+            except Exception:  # noqa: BLE001
+                LOGGER.warning("Nettoyage des taches impossible", exc_info=True)
+            await asyncio.sleep(self.gc_interval_s)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease_s / 3)
+            try:
+                await asyncio.to_thread(self.store.renew_leases)
+            except Exception:  # noqa: BLE001
+                LOGGER.warning("Renouvellement des baux impossible", exc_info=True)
+
+
+__all__ = [
+    "JOB_STATES",
+    "Job",
+    "JobNotFoundError",
+    "JobQueueFullError",
+    "JobRunner",
+    "JobStore",
+]
@@ -0,0 +1,187 @@
+import json
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from .cache import MB, ByteLRU, DiskCache
+from .settings import CACHE_DIR, env_bool, env_int
+
+# Header length prefix of a mask serialized for the disk tier.
+_HEADER = struct.Struct("<I")
+
+
+class MaskNotFoundError(LookupError):
+    """Raised when an image id is unknown or its mask has been evicted."""
+
+
+@dataclass(frozen=True)
+class StoredMask:
+    """Original upload plus its alpha mask, PNG-compressed as uint8.
+
+    A ``coarse`` mask comes from a preview: it is smaller than the image and
+    still has to be upscaled and refined before a full-resolution render.
+    """
+
+    image_bytes: bytes
+    mask_png: bytes
+    width: int
+    height: int
+    coarse: bool = False
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.image_bytes) + len(self.mask_png)
+
+    def decode_mask(self) -> np.ndarray:
+        mask = cv2.imdecode(np.frombuffer(self.mask_png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if mask is None:
+            raise MaskNotFoundError("Masque stocke illisible.")
+        return mask
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps(
+            {
+                "width": self.width,
+                "height": self.height,
+                "coarse": self.coarse,
+                "image_bytes": len(self.image_bytes),
+            }
+        ).encode("utf-8")
+        return b"".join((_HEADER.pack(len(header)), header, self.image_bytes, self.mask_png))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "StoredMask":
+        try:
+            (length,) = _HEADER.unpack_from(data)
+            start = _HEADER.size + length
+            header = json.loads(data[_HEADER.size : start])
+            end = start + header["image_bytes"]
+            return cls(
+                image_bytes=data[start:end],
+                mask_png=data[end:],
+                width=header["width"],
+                height=header["height"],
+                coarse=header["coarse"],
+            )
+        except (struct.error, ValueError, KeyError) as exc:
+            raise MaskNotFoundError("Masque stocke illisible.") from exc
+
+
+def _shared_by_default() -> bool:
+    """Several processes serve the API: masks must be visible to all of them."""
+    if os.getenv("WORKER_POOL_KIND", "thread").strip().lower() == "process":
+        return True
+    return (env_int("WEB_CONCURRENCY", 1) or 1) > 1
+
+
+def _to_uint8(mask: np.ndarray) -> np.ndarray:
+    if mask.dtype == np.uint8:
+        return mask
+    scaled = np.clip(mask, 0.0, 1.0) * 255.0
+    return scaled.astype(np.uint8)
+
+
+class MaskStore:
+    """Keeps computed alpha masks so backgrounds can be swapped without inference.
+
+    The optional disk tier under ``CACHE_DIR/masks`` is shared by every
+    process (process worker pool, several uvicorn workers): a mask computed
+    by one of them can be rendered by another.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self._entries = ByteLRU(max_bytes, sizeof=lambda entry: entry.size_bytes)
+        self.disk = (
+            DiskCache(disk_dir, disk_max_bytes)
+            if disk_dir is not None and disk_max_bytes > 0
+            else None
+        )
+
+    @classmethod
+    def from_env(cls) -> "MaskStore":
+        shared = env_bool("MASK_STORE_DISK", _shared_by_default())
+        return cls(
+            max_bytes=(env_int("MASK_STORE_MAX_MB", 256) or 0) * MB,
+            disk_dir=CACHE_DIR / "masks" if shared else None,
+            disk_max_bytes=(env_int("MASK_STORE_DISK_MAX_MB", 1024) or 0) * MB,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._entries.max_bytes > 0 or self.disk is not None
+
+    def __contains__(self, image_id: str) -> bool:
+        return self.peek(image_id) is not None
+
+    def peek(self, image_id: str) -> Optional[StoredMask]:
+        entry: Optional[StoredMask] = self._entries.get(image_id)
+        if entry is None and self.disk is not None:
+            data = self.disk.get(image_id)
+            if data is not None:
+                try:
+                    entry = StoredMask.from_bytes(data)
+                except MaskNotFoundError:
+                    return None
+                self._entries.put(image_id, entry)
+        return entry
+
+    def put(
+        self,
+        image_id: str,
+        image_bytes: bytes,
+        mask: np.ndarray,
+        coarse: bool = False,
+    ) -> None:
+        if not self.enabled:
+            return
+        mask_u8 = _to_uint8(mask)
+        ok, encoded = cv2.imencode(".png", mask_u8, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            return
+        entry = StoredMask(
+            image_bytes=image_bytes,
+            mask_png=encoded.tobytes(),
+            width=mask_u8.shape[1],
+            height=mask_u8.shape[0],
+            coarse=coarse,
+        )
+        self._entries.put(image_id, entry)
+        if self.disk is not None:
+            self.disk.put(image_id, entry.to_bytes())
+
+    def get(self, image_id: str) -> StoredMask:
+        entry = self.peek(image_id)
+        if entry is None:
+            raise MaskNotFoundError(f"Image inconnue ou expiree: {image_id}")
+        return entry
+
+    def snapshot(self) -> dict:
+        payload = {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._entries.size_bytes,
+            "max_bytes": self._entries.max_bytes,
+            "evictions": self._entries.evictions,
+            "disk": None,
+        }
+        if self.disk is not None:
+            payload["disk"] = {
+                "path": str(self.disk.directory),
+                "bytes": self.disk.size_bytes,
+                "max_bytes": self.disk.max_bytes,
+                "evictions": self.disk.evictions,
+            }
+        return payload
+
+
+__all__ = ["MaskNotFoundError", "MaskStore", "StoredMask"]
@@ -0,0 +1,384 @@
+import argparse
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .settings import CACHE_DIR, env_float, env_int
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = str(CACHE_DIR / "modelhost.sock")
+# Shared blocks grow in 1 MB steps so a 1024 px tensor does not reallocate.
+_BLOCK_STEP = 1024 * 1024
+# Blocks created by clients of this process (the host may run in-process in tests).
+_CREATED_BLOCKS = set()
+
+
+class ModelHostError(RuntimeError):
+    """Raised when the model host cannot be reached or fails a request."""
+
+
+def _authkey() -> bytes:
+    # The host unpickles what its clients send: only a secret key keeps
+    # whoever can reach the socket from running code in it.
+    key = os.getenv("MODEL_HOST_AUTHKEY", "").strip()
+    if not key:
+        raise ModelHostError(
+            "MODEL_HOST_AUTHKEY non defini: cle secrete partagee par le host et les workers."
+        )
+    return key.encode("utf-8")
+
+
+def _attach(name: str) -> SharedMemory:
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    block = SharedMemory(name=name)
+    # Before 3.13 attaching registers the block with this process's resource
+    # tracker, which would unlink the worker's block when the host exits.
+    if name not in _CREATED_BLOCKS:
+        resource_tracker.unregister(block._name, "shared_memory")  # type: ignore[attr-defined]
+    return block
+
+
+class RemoteSession:
+    """Stands in for ``ort.InferenceSession`` in a worker; ``run`` goes to the host."""
+
+    def __init__(self, client: "ModelHostClient", model: str, info: Dict[str, Any]) -> None:
+        self._client = client
+        self.model = model
+        self.device = info.get("device")
+        self._inputs = [SimpleNamespace(name=info["input_name"], shape=info["input_shape"])]
+
+    def get_inputs(self) -> List[SimpleNamespace]:
+        return self._inputs
+
+    def run(self, _output_names: Any, feeds: Dict[str, np.ndarray]) -> List[np.ndarray]:
+        return [self._client.run(self.model, next(iter(feeds.values())))]
+
+
+class ModelHostClient:
+    """Worker side of the model host: one connection and one shared block per thread.
+
+    Input tensors are copied into the thread's shared memory block and the
+    host writes the predictions back into it, so only a few header bytes
+    cross the socket.
+    """
+
+    def __init__(self, address: str, timeout_s: float = 120.0) -> None:
+        self.address = address
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[Connection] = []
+        self._blocks: List[SharedMemory] = []
+        self.requests = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelHostClient"]:
+        address = os.getenv("MODEL_HOST_ADDRESS", "").strip()
+        if not address:
+            return None
+        return cls(address, timeout_s=env_float("MODEL_HOST_TIMEOUT_S", 120.0))
+
+    def load(self, model: str) -> Dict[str, Any]:
+        """Load ``model`` in the host and describe its input."""
+        return self._request(("load", model))[1]
+
+    def ping(self) -> Dict[str, Any]:
+        return self._request(("ping",))[1]
+
+    def session(self, model: str) -> RemoteSession:
+        return RemoteSession(self, model, self.load(model))
+
+    def run(self, model: str, tensor: np.ndarray) -> np.ndarray:
+        block = self._block(tensor.nbytes)
+        np.ndarray(tensor.shape, tensor.dtype, buffer=block.buf)[...] = tensor
+        reply = self._request(("run", model, block.name, tuple(tensor.shape), tensor.dtype.str))
+        _, kind, shape, dtype = reply[:4]
+        if kind == "shm":
+            # The block is reused by the next call of this thread.
+            return np.ndarray(shape, np.dtype(dtype), buffer=block.buf).copy()
+        return np.frombuffer(reply[4], dtype=np.dtype(dtype)).reshape(shape)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "address": self.address,
+                "connections": len(self._connections),
+                "shared_mb": round(sum(block.size for block in self._blocks) / _BLOCK_STEP, 1),
+                "requests": self.requests,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+            blocks, self._blocks = self._blocks, []
+        for connection in connections:
+            connection.close()
+        for block in blocks:
+            _CREATED_BLOCKS.discard(block.name)
+            block.close()
+            block.unlink()
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            try:
+                connection = Client(self.address, family="AF_UNIX", authkey=_authkey())
+            except (OSError, EOFError, AuthenticationError) as exc:
+                raise ModelHostError(f"Model host injoignable ({self.address}): {exc}") from exc
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _block(self, nbytes: int) -> SharedMemory:
+        block: Optional[SharedMemory] = getattr(self._local, "block", None)
+        if block is not None and block.size >= nbytes:
+            return block
+        size = -(-max(nbytes, 1) // _BLOCK_STEP) * _BLOCK_STEP
+        grown = SharedMemory(create=True, size=size)
+        _CREATED_BLOCKS.add(grown.name)
+        self._local.block = grown
+        with self._lock:
+            self._blocks.append(grown)
+        if block is not None:
+            self._release(block)
+        return grown
+
+    def _release(self, block: SharedMemory) -> None:
+        with self._lock:
+            self._blocks = [owned for owned in self._blocks if owned is not block]
+        _CREATED_BLOCKS.discard(block.name)
+        block.close()
+        block.unlink()
+
+    def _request(self, message: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        connection = self._connection()
+        try:
+            connection.send(message)
+            if not connection.poll(self.timeout_s):
+                raise TimeoutError(f"pas de reponse en {self.timeout_s:.0f} s")
+            reply = connection.recv()
+        except (OSError, EOFError, TimeoutError) as exc:
+            self._drop(connection)
+            raise ModelHostError(f"Model host en echec ({self.address}): {exc}") from exc
+        with self._lock:
+            self.requests += 1
+        if reply[0] == "error":
+            raise ModelHostError(reply[1])
+        return reply
+
+    def _drop(self, connection: Connection) -> None:
+        connection.close()
+        self._local.connection = None
+        with self._lock:
+            self._connections = [owned for owned in self._connections if owned is not connection]
+
+
+_SHARED_CLIENT: Optional[ModelHostClient] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_client() -> Optional[ModelHostClient]:
+    """This process's client when MODEL_HOST_ADDRESS is set, else None."""
+    global _SHARED_CLIENT
+    with _SHARED_LOCK:
+        if _SHARED_CLIENT is None:
+            _SHARED_CLIENT = ModelHostClient.from_env()
+            if _SHARED_CLIENT is not None:
+                atexit.register(_SHARED_CLIENT.close)
+        return _SHARED_CLIENT
+
+
+class ModelHost:
+    """Owns the ORT sessions for every worker process of the node.
+
+    Each client connection is served by its own thread. Single-image
+    requests go through the model's MaskBatcher, so requests of different
+    workers that reach the host while a batch runs are grouped into the next.
+    """
+
+    def __init__(self, registry: Any, address: str) -> None:
+        self.registry = registry
+        self.address = address
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._runs = 0
+
+    def serve_forever(self) -> None:
+        path = Path(self.address)
+        if path.exists():
+            path.unlink()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with Listener(self.address, family="AF_UNIX", authkey=_authkey()) as listener:
+            LOGGER.info("Model host a l'ecoute sur %s", self.address)
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    LOGGER.warning("Connexion au model host refusee.", exc_info=True)
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self.started, 1),
+                "connections": self._connections,
+                "runs": self._runs,
+                "registry": self.registry.snapshot(),
+            }
+
+    def _serve(self, connection: Connection) -> None:
+        blocks: Dict[str, SharedMemory] = {}
+        with self._lock:
+            self._connections += 1
+        try:
+            while True:
+                try:
+                    request = connection.recv()
+                except (OSError, EOFError):
+                    return
+                try:
+                    reply = self._handle(request, blocks)
+                except Exception as exc:  # noqa: BLE001
+                    LOGGER.exception("Requete model host en echec")
+                    reply = ("error", f"{type(exc).__name__}: {exc}")
+                connection.send(reply)
+        finally:
+            with self._lock:
+                self._connections -= 1
+            for block in blocks.values():
+                block.close()
+            connection.close()
+
+    def _handle(self, request: Tuple[Any, ...], blocks: Dict[str, SharedMemory]) -> Tuple:
+        operation = request[0]
+        if operation == "ping":
+            return ("ok", self.snapshot())
+        if operation == "load":
+            model = self.registry.load(request[1])
+            inputs = model.session.get_inputs()[0]
+            return (
+                "ok",
+                {
+                    "input_name": inputs.name,
+                    "input_shape": list(inputs.shape),
+                    "device": model.status.device,
+                    "load_ms": model.status.load_ms,
+                },
+            )
+        if operation == "run":
+            _, name, block_name, shape, dtype = request
+            block = blocks.get(block_name)
+            if block is None:
+                # A client grows its block by replacing it.
+                for stale in blocks.values():
+                    stale.close()
+                blocks.clear()
+                block = blocks[block_name] = _attach(block_name)
+            tensor = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            with self.registry.use(name) as model:
+                values = np.ascontiguousarray(self._run(model, tensor))
+            with self._lock:
+                self._runs += 1
+            if values.nbytes <= block.size:
+                np.ndarray(values.shape, values.dtype, buffer=block.buf)[...] = values
+                return ("ok", "shm", values.shape, values.dtype.str)
+            return ("ok", "bytes", values.shape, values.dtype.str, values.tobytes())
+        raise ValueError(f"Requete inconnue: {operation}")
+
+    @staticmethod
+    def _run(model: Any, tensor: np.ndarray) -> np.ndarray:
+        if tensor.shape[0] == 1 and model.batcher.enabled:
+            with model.batcher.reserve():
+                return model.batcher.run(tensor)
+        return model.run_batch(tensor)
+
+
+def build_host(address: str, preload: Sequence[str], warmup_runs: int) -> ModelHost:
+    """Host whose registry builds local OnnxMaskModel sessions on demand."""
+    from .cache import MB
+    from .pipeline import PRO_MODEL_SPECS, OnnxMaskModel, resolve_spec
+    from .registry import ModelRegistry
+    from .settings import env_bool
+    from .timing import StageTimings
+
+    def canonical(name: str) -> str:
+        alias = PRO_MODEL_SPECS.get(name, {}).get("alias")
+        return alias if isinstance(alias, str) else name
+
+    def factory(name: str) -> OnnxMaskModel:
+        spec = resolve_spec(name)
+        if spec is None or spec.get("mock"):
+            raise ValueError(f"Modele non servi par le model host: {name}")
+        return OnnxMaskModel(
+            name=name,
+            spec=spec,
+            device_request=(os.getenv("PIPELINE_DEVICE") or "auto").lower(),
+            allow_download=env_bool("ALLOW_REMOTE_DOWNLOAD", False),
+        )
+
+    names = [canonical(name) for name in preload]
+    registry = ModelRegistry(
+        resolve=canonical,
+        factory=factory,
+        default=names[0] if names else "",
+        budget_bytes=(env_int("MODEL_RAM_BUDGET_MB", 0) or 0) * MB,
+        pinned=set(names),
+    )
+    for name in names:
+        model = registry.load(name)
+        if warmup_runs:
+            model.warmup(warmup_runs, StageTimings())
+    return ModelHost(registry, address)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Model host partage par les workers uvicorn")
+    parser.add_argument("--address", default=os.getenv("MODEL_HOST_ADDRESS") or DEFAULT_ADDRESS)
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        default=[
+            os.getenv("PRO_MODEL_NAME", "inspyrenet"),
+            os.getenv("FAST_MODEL_NAME", "u2net"),
+        ],
+        help="Modeles charges (et rechauffes) au demarrage",
+    )
+    args = parser.parse_args(argv)
+    os.environ.setdefault("WIZPIX_SKIP_PIPELINE_INIT", "1")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    _authkey()  # Refuse to start (and load models) without a key.
+    host = build_host(args.address, args.preload, max(0, env_int("WARMUP_RUNS", 2) or 0))
+    host.serve_forever()
+    return 0
+
+
+__all__ = [
+    "DEFAULT_ADDRESS",
+    "ModelHost",
+    "ModelHostClient",
+    "ModelHostError",
+    "RemoteSession",
+    "build_host",
+    "shared_client",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
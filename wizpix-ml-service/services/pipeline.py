@@ -1,24 +1,49 @@
+import cProfile
 import logging
 import os
+import tempfile
 import threading
 import time
-from dataclasses import dataclass
+from contextlib import nullcontext
+from dataclasses import dataclass, field, fields, replace
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import cv2
 import numpy as np
 import onnxruntime as ort
 import requests
 from PIL import Image
-from rembg import new_session, remove as rembg_remove
 
-from .settings import MODEL_DIR
+try:  # Optional compatibility backend for the fast tier, see FAST_ENGINE.
+    from rembg import new_session, remove as rembg_remove
+except ImportError:
+    new_session = None
+    rembg_remove = None
+
+from .animation import FrameSequence, KeyframeTracker, render_animation, writer_for
+from .batching import MaskBatcher
+from .cache import MB, ResultCache, content_key
+from .crop import CropBox, CropPolicy
+from .compositing import BackgroundSpec, blend_over, render_background
+from .decode import decode_rgb, read_header
+from .encoding import OUTPUT_FORMATS, OutputSpec, alpha_to_uint8, encode_cutout
+from .masks import MaskNotFoundError, MaskStore, StoredMask
+from .modelhost import ModelHostClient, shared_client
+from .preprocess import ImageLike, Preprocessor, as_rgb_array, resize_interpolation
+from .profiling import ProfilingUnavailableError, profile_stem, write_cpu_profile
+from .refine import DEFAULT_REFINE, REFINE_MODES, EdgeRefiner, refine_mask
+from .registry import DEFAULT_RAM_FACTOR, ModelRegistry, UnknownModelError
+from .runtime import SessionTuning
+from .settings import MODEL_DIR, env_float, env_int
+from .tiling import TileGrid, TilePolicy, feather_weights
+from .timing import StageTimings
 
 LOGGER = logging.getLogger(__name__)
 
 SUPPORTED_QUALITY = {"fast", "pro"}
+FAST_ENGINES = {"native", "rembg"}
 
 
 def _env_bool(name: str, default: bool) -> bool:
@@ -32,6 +57,8 @@ def _normalize_name(name: str) -> str:
     return name.replace("_", "-").replace(" ", "-").lower()
 
 
+# Each spec may carry a "session" dict of SessionTuning fields (threads, graph
+# optimisation, execution mode, arena); env vars override it, see runtime.py.
 PRO_MODEL_SPECS: Dict[str, Dict[str, object]] = {
     "inspyrenet": {
         "filename": os.getenv("INSPYRENET_MODEL_FILE", "isnet-general-use.onnx"),
@@ -57,6 +84,45 @@ PRO_MODEL_SPECS: Dict[str, Dict[str, object]] = {
     },
     "birefnet_portrait": {"alias": "birefnet-portrait"},
     "birefnet": {"alias": "birefnet-portrait"},
+    # INT8 variants are produced locally by scripts/quantize_models.py and
+    # inherit preprocessing from their "base" spec.
+    "inspyrenet-int8": {
+        "base": "inspyrenet",
+        "filename": os.getenv("INSPYRENET_INT8_MODEL_FILE", "isnet-general-use.int8.onnx"),
+        "friendly_name": "InSPyReNet (isnet-general-use, INT8)",
+    },
+    "birefnet-portrait-int8": {
+        "base": "birefnet-portrait",
+        "filename": os.getenv(
+            "BIREFNET_INT8_MODEL_FILE", "BiRefNet-portrait-epoch_150.int8.onnx"
+        ),
+        "friendly_name": "BiRefNet Portrait (INT8)",
+    },
+    # Fast tier (FAST_MODEL_NAME): rembg's salient-object models, run by the
+    # same OnnxMaskModel engine. Same filenames as rembg's U2NET_HOME cache.
+    "u2net": {
+        "tier": "fast",
+        "filename": os.getenv("U2NET_MODEL_FILE", "u2net.onnx"),
+        "url": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2net.onnx",
+        "mean": (0.485, 0.456, 0.406),
+        "std": (0.229, 0.224, 0.225),
+        "size": (320, 320),
+        "activation": "linear",
+        "tiling": False,
+        "friendly_name": "U2Net",
+    },
+    "u2netp": {
+        "base": "u2net",
+        "filename": os.getenv("U2NETP_MODEL_FILE", "u2netp.onnx"),
+        "url": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/u2netp.onnx",
+        "friendly_name": "U2Net (lite)",
+    },
+    "silueta": {
+        "base": "u2net",
+        "filename": os.getenv("SILUETA_MODEL_FILE", "silueta.onnx"),
+        "url": "https://github.com/danielgatis/rembg/releases/download/v0.0.0/silueta.onnx",
+        "friendly_name": "Silueta",
+    },
     "mock": {
         "mock": True,
         "friendly_name": "Mock model (tests only)",
@@ -64,6 +130,20 @@ PRO_MODEL_SPECS: Dict[str, Dict[str, object]] = {
 }
 
 
+def resolve_spec(name: str) -> Optional[Dict[str, object]]:
+    """Return the spec of a canonical model name, merged with its base spec."""
+    spec = PRO_MODEL_SPECS.get(name)
+    if spec is None:
+        return None
+    base_name = spec.get("base")
+    if not isinstance(base_name, str):
+        return spec
+    merged = dict(PRO_MODEL_SPECS[base_name])
+    merged.pop("url", None)
+    merged.update({key: value for key, value in spec.items() if key != "base"})
+    return merged
+
+
 def _select_providers(device_request: str) -> Tuple[str, ...]:
     available = ort.get_available_providers()
     device_request = device_request.lower()
@@ -98,6 +178,72 @@ class ModelStatus:
     message: Optional[str] = None
     path: Optional[str] = None
     device: Optional[str] = None
+    load_ms: Optional[Dict[str, float]] = None
+
+
+@dataclass(frozen=True)
+class RemovalOptions:
+    """Per-request options; every field is part of the result cache key."""
+
+    quality: str = "pro"
+    refine: str = DEFAULT_REFINE
+    crop: Optional[bool] = None
+    output: str = "png"
+    effort: Optional[int] = None
+    preview: bool = False
+    # Pro model name; None selects PRO_MODEL_NAME.
+    model: Optional[str] = None
+
+    def normalized(self) -> "RemovalOptions":
+        quality = (self.quality or "pro").lower()
+        if quality not in SUPPORTED_QUALITY:
+            quality = "pro"
+        refine = (self.refine or DEFAULT_REFINE).lower()
+        if refine not in REFINE_MODES:
+            refine = DEFAULT_REFINE
+        crop = _env_bool("TWO_PASS_CROP", False) if self.crop is None else bool(self.crop)
+        output = OutputSpec(self.output, self.effort).normalized()
+        return replace(
+            self,
+            quality=quality,
+            refine=refine,
+            crop=crop,
+            output=output.format,
+            effort=output.effort,
+            preview=bool(self.preview),
+        )
+
+    @property
+    def output_spec(self) -> OutputSpec:
+        return OutputSpec(self.output, self.effort)
+
+    def cache_token(self) -> str:
+        return "|".join(f"{f.name}={getattr(self, f.name)}" for f in fields(self))
+
+
+@dataclass
+class RemovalResult:
+    data: bytes
+    used_fallback: bool = False
+    cache_status: str = "miss"
+    etag: Optional[str] = None
+    image_id: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    media_type: str = "image/png"
+    preview: bool = False
+
+
+@dataclass
+class AnimationResult:
+    """An encoded animation, written to ``path`` (the caller deletes it)."""
+
+    path: Path
+    media_type: str
+    frames: int
+    keyframes: int
+    warped: int = 0
+    used_fallback: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
 
 
 class OnnxMaskModel:
@@ -109,11 +255,14 @@ class OnnxMaskModel:
         spec: Dict[str, object],
         device_request: str,
         allow_download: bool,
+        host: Optional[ModelHostClient] = None,
     ) -> None:
         self.name = name
         self.spec = spec
         self.device_request = device_request
         self.allow_download = allow_download
+        # When set, the session lives in the shared model host process.
+        self.host = host
         filename_value = spec.get("filename")
         if filename_value is None:
             raise ValueError(f"No filename provided for model '{name}'")
@@ -127,6 +276,13 @@ class OnnxMaskModel:
             self.model_path = MODEL_DIR / filename_str
         self.session: Optional[ort.InferenceSession] = None
         self.providers: Tuple[str, ...] = ()
+        self.batcher = MaskBatcher.from_env(self.run_batch)
+        self.preprocessor = Preprocessor(
+            size=spec.get("size", (1024, 1024)),  # type: ignore[arg-type]
+            mean=spec.get("mean", (0.5, 0.5, 0.5)),  # type: ignore[arg-type]
+            std=spec.get("std", (1.0, 1.0, 1.0)),  # type: ignore[arg-type]
+        )
+        self.tiling = TilePolicy.from_env()
         self.status = ModelStatus(
             state="idle",
             ready=False,
@@ -137,7 +293,12 @@ class OnnxMaskModel:
     def ensure_loaded(self) -> None:
         if self.session is not None:
             return
+        if self.host is not None:
+            self._attach_host(self.host)
+            return
 
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
         if not self.model_path.exists():
             if not self.allow_download:
                 raise FileNotFoundError(
@@ -145,41 +306,313 @@ class OnnxMaskModel:
                     "Lancez scripts/fetch_models.py pour le telecharger."
                 )
             self._download_model()
+            timings["download"] = (time.perf_counter() - start) * 1000
 
         self.status.state = "loading"
         self.status.warming = True
         providers = _select_providers(self.device_request)
-        options = ort.SessionOptions()
+        tuning = SessionTuning.resolve(self.name, self.spec)
         try:
-            self.session = ort.InferenceSession(
-                str(self.model_path),
-                sess_options=options,
-                providers=list(providers),
-            )
+            session_start = time.perf_counter()
+            self.session, source = self._create_session(tuning, providers)
+            timings["session"] = (time.perf_counter() - session_start) * 1000
         finally:
             self.status.warming = False
+        timings["total"] = (time.perf_counter() - start) * 1000
+        self.status.load_ms = {key: round(value, 1) for key, value in timings.items()}
+        LOGGER.info(
+            "Modele %s charge en %.0f ms (%s; %s)",
+            self.name,
+            timings["total"],
+            source,
+            ", ".join(f"{key}={value:.0f}ms" for key, value in timings.items()),
+            extra={"model": self.name, "load_ms": self.status.load_ms, "source": source},
+        )
         self.providers = providers
         self.status.device = providers[0]
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim == 1:
+            LOGGER.info("Modele %s exporte en batch statique: batching desactive.", self.name)
+            self.batcher.static = True
+        self.status.state = "ready"
+        self.status.ready = True
+
+    def _attach_host(self, host: ModelHostClient) -> None:
+        self.status.state = "loading"
+        start = time.perf_counter()
+        self.session = host.session(self.name)  # type: ignore[assignment]
+        load_ms = round((time.perf_counter() - start) * 1000, 1)
+        # The host batches requests of every worker; batching here would only
+        # add a wait before the round trip.
+        self.batcher.max_batch_size = 1
+        self.providers = ("model-host",)
+        self.status.device = f"model-host:{self.session.device}"
+        self.status.load_ms = {"host": load_ms}
         self.status.state = "ready"
         self.status.ready = True
+        LOGGER.info(
+            "Modele %s servi par le model host %s (%.0f ms)",
+            self.name,
+            host.address,
+            load_ms,
+            extra={"model": self.name, "load_ms": self.status.load_ms, "source": "model-host"},
+        )
 
-    def predict_mask(self, image: Image.Image) -> np.ndarray:
+    def _create_session(
+        self,
+        tuning: SessionTuning,
+        providers: Tuple[str, ...],
+    ) -> Tuple[ort.InferenceSession, str]:
+        optimized_path = tuning.optimized_path(self.model_path, providers[0])
+        # Levels above the persisted one still run when the file is loaded.
+        remaining = tuning.persisted_level != tuning.graph_optimization
+        if (
+            optimized_path is not None
+            and optimized_path.exists()
+            and optimized_path.stat().st_mtime >= self.model_path.stat().st_mtime
+        ):
+            try:
+                session = ort.InferenceSession(
+                    str(optimized_path),
+                    sess_options=tuning.build_options(optimize=remaining),
+                    providers=list(providers),
+                )
+                return session, f"graphe optimise {optimized_path.name}"
+            except Exception:  # noqa: BLE001
+                LOGGER.warning(
+                    "Graphe optimise %s illisible; regeneration.", optimized_path, exc_info=True
+                )
+                optimized_path.unlink(missing_ok=True)
+
+        if optimized_path is None:
+            session = ort.InferenceSession(
+                str(self.model_path),
+                sess_options=tuning.build_options(),
+                providers=list(providers),
+            )
+            return session, f"optimisation {tuning.graph_optimization}"
+
+        options = tuning.build_options(level=tuning.persisted_level)
+        tmp_path = optimized_path.with_name(f"{optimized_path.name}.{os.getpid()}.tmp")
+        options.optimized_model_filepath = str(tmp_path)
+        session = ort.InferenceSession(
+            str(self.model_path),
+            sess_options=options,
+            providers=list(providers),
+        )
+        source_path = optimized_path
+        try:
+            os.replace(tmp_path, optimized_path)
+        except OSError:
+            LOGGER.warning("Impossible de persister %s", optimized_path, exc_info=True)
+            tmp_path.unlink(missing_ok=True)
+            source_path = self.model_path
+        if not remaining:
+            return session, f"optimisation {tuning.graph_optimization}"
+        # First start: the portable graph is saved, now apply every level.
+        del session
+        session = ort.InferenceSession(
+            str(source_path),
+            sess_options=tuning.build_options(),
+            providers=list(providers),
+        )
+        return session, f"optimisation {tuning.graph_optimization}"
+
+    def profiled_copy(self, prefix: str) -> "OnnxMaskModel":
+        """Same model on a private, unbatched session with ORT profiling on.
+
+        The trace is written by ``session.end_profiling()`` under ``prefix``.
+        """
+        if self.host is not None:
+            raise ProfilingUnavailableError(
+                "Profilage ORT indisponible: le modele est servi par le model host."
+            )
+        clone = OnnxMaskModel(self.name, self.spec, self.device_request, allow_download=False)
+        clone.batcher.max_batch_size = 1
+        options = SessionTuning.resolve(self.name, self.spec).build_options()
+        options.enable_profiling = True
+        options.profile_file_prefix = prefix
+        clone.session = ort.InferenceSession(
+            str(self.model_path),
+            sess_options=options,
+            providers=list(self.providers or _select_providers(self.device_request)),
+        )
+        return clone
+
+    def unload(self) -> None:
+        """Drop the session; the next ensure_loaded() rebuilds it."""
+        self.session = None
+        self.status.state = "evicted"
+        self.status.ready = False
+
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        return self.preprocessor.width, self.preprocessor.height
+
+    def tile_plan(self, size: Tuple[int, int]) -> Optional[TileGrid]:
+        width, height = self.input_size
+        if width != height or self.spec.get("tiling") is False:
+            return None
+        return self.tiling.plan(size, width)
+
+    def draft_size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """Smallest decode size that loses nothing for an image of ``size``."""
+        grid = self.tile_plan(size)
+        return grid.work_size if grid is not None else self.input_size
+
+    def predict_mask(
+        self,
+        image: ImageLike,
+        output_size: Optional[Tuple[int, int]] = None,
+        timings: Optional[StageTimings] = None,
+    ) -> np.ndarray:
+        """Predict a float mask at ``output_size`` (default: the image size).
+
+        ``timings`` receives the preprocess, ort (batch wait included) and
+        postprocess stages.
+        """
+        if self.session is None:
+            raise RuntimeError("Model not loaded")
+
+        timings = timings or StageTimings()
+        rgb = as_rgb_array(image)
+        size = output_size or (rgb.shape[1], rgb.shape[0])
+        grid = self.tile_plan((rgb.shape[1], rgb.shape[0]))
+        if grid is not None:
+            return self._predict_tiled(rgb, grid, size, timings)
+        with self.batcher.reserve():
+            with timings.stage("preprocess"):
+                inputs = self._prepare_input(rgb)
+            with timings.stage("ort"):
+                values = self.batcher.run(inputs)
+        with timings.stage("postprocess"):
+            return self._postprocess(values, size)
+
+    def predict_masks(
+        self,
+        images: List[np.ndarray],
+        timings: Optional[StageTimings] = None,
+    ) -> List[np.ndarray]:
+        """Masks for several RGB images (each at its own size), in ORT batches.
+
+        Tiled images go one by one through ``predict_mask``.
+        """
         if self.session is None:
             raise RuntimeError("Model not loaded")
+        timings = timings or StageTimings()
+        if any(self.tile_plan((rgb.shape[1], rgb.shape[0])) is not None for rgb in images):
+            return [self.predict_mask(rgb, timings=timings) for rgb in images]
+
+        width, height = self.input_size
+        chunk = 1 if self.batcher.static else self.batcher.max_batch_size
+        batch = np.empty((min(chunk, len(images)), 3, height, width), dtype=np.float32)
+        masks: List[np.ndarray] = []
+        for start in range(0, len(images), chunk):
+            group = images[start : start + chunk]
+            with timings.stage("preprocess"):
+                for index, rgb in enumerate(group):
+                    batch[index] = self._prepare_input(rgb)[0]
+            with timings.stage("ort"):
+                raw = self.run_batch(batch[: len(group)])
+            with timings.stage("postprocess"):
+                masks.extend(
+                    self._postprocess(raw[index], (rgb.shape[1], rgb.shape[0]))
+                    for index, rgb in enumerate(group)
+                )
+        return masks
 
-        inputs = self._prepare_input(image)
+    def run_batch(self, inputs: np.ndarray) -> np.ndarray:
+        """Run an ``NxCxHxW`` tensor and return the ``NxHxW`` raw predictions."""
+        if self.session is None:
+            raise RuntimeError("Model not loaded")
         input_name = self.session.get_inputs()[0].name
         ort_outs = self.session.run(None, {input_name: inputs})
 
         values = ort_outs[0]
         if values.ndim == 4:
             values = values[:, 0, :, :]
+        return values
 
+    def _predict_tiled(
+        self,
+        rgb: np.ndarray,
+        grid: TileGrid,
+        size: Tuple[int, int],
+        timings: StageTimings,
+    ) -> np.ndarray:
+        """Run overlapping tiles in ORT batches and feather-blend their masks.
+
+        Only one batch of tile tensors exists at a time; the blended mask is
+        accumulated at the grid's working resolution.
+        """
+        tile = grid.tile
+        source_size = (rgb.shape[1], rgb.shape[0])
+        with timings.stage("preprocess"):
+            if source_size == grid.work_size:
+                work = rgb
+            else:
+                work = cv2.resize(
+                    rgb,
+                    grid.work_size,
+                    interpolation=resize_interpolation(source_size, grid.work_size),
+                )
+            peak = int(work.max())
+        weights = feather_weights(tile, round(tile * self.tiling.overlap))
+        blended = np.zeros((grid.work_size[1], grid.work_size[0]), dtype=np.float32)
+        total = np.zeros_like(blended)
+
+        chunk = 1 if self.batcher.static else self.batcher.max_batch_size
+        positions = list(grid)
+        batch = np.empty((min(chunk, len(positions)), 3, tile, tile), dtype=np.float32)
+        for start in range(0, len(positions), chunk):
+            group = positions[start : start + chunk]
+            with timings.stage("preprocess"):
+                for index, (x, y) in enumerate(group):
+                    batch[index] = self.preprocessor(work[y : y + tile, x : x + tile], peak)[0]
+            with timings.stage("ort"):
+                raw = self.run_batch(batch[: len(group)])
+            with timings.stage("postprocess"):
+                values = self._activate(raw)
+                for index, (x, y) in enumerate(group):
+                    prediction = values[index]
+                    if prediction.shape != (tile, tile):
+                        prediction = cv2.resize(
+                            prediction, (tile, tile), interpolation=cv2.INTER_LINEAR
+                        )
+                    blended[y : y + tile, x : x + tile] += prediction * weights
+                    total[y : y + tile, x : x + tile] += weights
+        with timings.stage("postprocess"):
+            np.divide(blended, total, out=blended)
+            return self._finish(blended, size)
+
+    def warmup_batch_sizes(self) -> List[int]:
+        """Batch sizes the batcher can send, largest first so the arena grows once."""
+        if not self.batcher.enabled:
+            return [1]
+        return list(range(self.batcher.max_batch_size, 0, -1))
+
+    def warmup(self, runs: int, timings: StageTimings, prefix: str = "pro") -> None:
+        """Dummy inferences so ORT allocates and picks kernels before real traffic."""
+        width, height = self.input_size
+        for size in self.warmup_batch_sizes():
+            tensor = np.zeros((size, 3, height, width), dtype=np.float32)
+            with timings.stage(f"{prefix}_batch_{size}"):
+                for _ in range(runs):
+                    self.run_batch(tensor)
+        with timings.stage(f"{prefix}_predict"):
+            self.predict_mask(np.zeros((height, width, 3), dtype=np.uint8))
+
+    def _activate(self, values: np.ndarray) -> np.ndarray:
         activation = self.spec.get("activation", "linear")
         values = values.astype(np.float32)
         if activation == "sigmoid":
             values = 1.0 / (1.0 + np.exp(-values))
+        return values
 
+    def _postprocess(self, values: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        return self._finish(self._activate(values), size)
+
+    def _finish(self, values: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
         ma = float(np.max(values))
         mi = float(np.min(values))
         denom = ma - mi
@@ -191,25 +624,14 @@ class OnnxMaskModel:
         mask = np.squeeze(values).astype(np.float32)
         mask = cv2.resize(
             mask,
-            (image.width, image.height),
+            size,
             interpolation=cv2.INTER_CUBIC,
         )
         return np.clip(mask, 0.0, 1.0)
 
-    def _prepare_input(self, image: Image.Image) -> np.ndarray:
-        mean = self.spec.get("mean", (0.5, 0.5, 0.5))
-        std = self.spec.get("std", (1.0, 1.0, 1.0))
-        size = self.spec.get("size", (1024, 1024))
-
-        pil = image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
-        arr = np.asarray(pil).astype(np.float32)
-        arr = arr / max(float(np.max(arr)), 1e-6)
-
-        tmp = np.zeros_like(arr, dtype=np.float32)
-        for ch in range(3):
-            tmp[:, :, ch] = (arr[:, :, ch] - mean[ch]) / std[ch]
-        tmp = tmp.transpose(2, 0, 1)
-        return np.expand_dims(tmp, 0).astype(np.float32)
+    def _prepare_input(self, image: ImageLike) -> np.ndarray:
+        # Returns this thread's reusable input buffer, see Preprocessor.
+        return self.preprocessor(image)
 
     def _download_model(self) -> None:
         url = self.spec.get("url")
@@ -235,19 +657,49 @@ class OnnxMaskModel:
 class MockMaskModel:
     """Small helper used in unit tests – always returns a centered square."""
 
+    input_size = (1024, 1024)
+
     def __init__(self) -> None:
         self.status = ModelStatus(state="ready", ready=True, path="mock", device="cpu")
 
     def ensure_loaded(self) -> None:
         return
 
-    def predict_mask(self, image: Image.Image) -> np.ndarray:
-        arr = np.zeros((image.height, image.width), dtype=np.float32)
-        h_slice = slice(image.height // 4, image.height - image.height // 4)
-        w_slice = slice(image.width // 4, image.width - image.width // 4)
+    def unload(self) -> None:
+        return
+
+    def draft_size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        return self.input_size
+
+    def warmup(self, runs: int, timings: StageTimings, prefix: str = "pro") -> None:
+        return
+
+    def predict_mask(
+        self,
+        image: ImageLike,
+        output_size: Optional[Tuple[int, int]] = None,
+        timings: Optional[StageTimings] = None,
+    ) -> np.ndarray:
+        if output_size is not None:
+            width, height = output_size
+        else:
+            height, width = as_rgb_array(image).shape[:2]
+        arr = np.zeros((height, width), dtype=np.float32)
+        h_slice = slice(height // 4, height - height // 4)
+        w_slice = slice(width // 4, width - width // 4)
         arr[h_slice, w_slice] = 1.0
         return arr
 
+    def predict_masks(
+        self,
+        images: List[np.ndarray],
+        timings: Optional[StageTimings] = None,
+    ) -> List[np.ndarray]:
+        return [self.predict_mask(rgb) for rgb in images]
+
+
+MaskModel = Union[OnnxMaskModel, MockMaskModel]
+
 
 def cast_str(value: object, default: str) -> str:
     return value if isinstance(value, str) else default
@@ -261,18 +713,72 @@ class ModelsUnavailableError(RuntimeError):
     """Raised when mandatory models are missing and no fallback is allowed."""
 
 
-def composite_straight_alpha(rgb: np.ndarray, alpha: np.ndarray) -> bytes:
-    alpha_clamped = np.clip(alpha, 0.0, 1.0)
-    alpha_uint8 = (alpha_clamped * 255).astype(np.uint8)
-    rgba = np.dstack((rgb.astype(np.uint8), alpha_uint8))
+def composite_straight_alpha(
+    rgb: np.ndarray,
+    alpha: np.ndarray,
+    output: Optional[OutputSpec] = None,
+) -> bytes:
+    return encode_cutout(rgb, alpha, output or OutputSpec())
+
+
+def composite_over_background(
+    rgb: np.ndarray,
+    alpha: np.ndarray,
+    background: BackgroundSpec,
+) -> bytes:
+    """Composite a cut-out over ``background``; ``alpha`` is a uint8 mask."""
+    if background.kind == "transparent":
+        return composite_straight_alpha(rgb, alpha)
+    blended = blend_over(rgb, alpha, render_background(background, rgb))
     buffer = BytesIO()
-    Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG")
-    buffer.seek(0)
+    Image.fromarray(blended, mode="RGB").save(buffer, format="PNG")
     return buffer.getvalue()
 
 
+def _alpha_from_output(data: bytes) -> Optional[np.ndarray]:
+    """Alpha channel of an encoded cut-out (PNG/WebP RGBA or a mask PNG)."""
+    decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if decoded is None:
+        return None
+    if decoded.ndim == 2:
+        return decoded
+    if decoded.shape[2] != 4:
+        return None
+    return decoded[:, :, 3]
+
+
+def preview_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """``size`` shrunk to fit ``max_side``; smaller images keep their natural size."""
+    width, height = size
+    scale = max_side / float(max(width, height))
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _reencode_cutout(
+    data: bytes,
+    output: OutputSpec,
+    max_side: Optional[int] = None,
+) -> bytes:
+    """Convert an RGBA PNG (rembg backend) to another output format and/or preview size."""
+    bgra = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if bgra is None or bgra.ndim != 3 or bgra.shape[2] != 4:
+        return data
+    if max_side is not None:
+        size = preview_size((bgra.shape[1], bgra.shape[0]), max_side)
+        bgra = cv2.resize(bgra, size, interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB)
+    return encode_cutout(rgb, bgra[:, :, 3], output)
+
+
 class BackgroundRemovalPipeline:
-    """Background removal pipeline with rembg fast mode and ONNX-based pro mode."""
+    """Background removal pipeline: ONNX fast and pro tiers sharing one engine.
+
+    The fast tier runs FAST_MODEL_NAME (u2net, u2netp, silueta) through the
+    same decode, preprocess, batching, refine and encode stages as pro.
+    FAST_ENGINE=rembg keeps rembg's bytes-in/bytes-out ``remove`` instead.
+    """
 
     def __init__(self, device: Optional[str] = None) -> None:
         MODEL_DIR.mkdir(parents=True, exist_ok=True)
@@ -281,38 +787,104 @@ class BackgroundRemovalPipeline:
         self.device_request = (device or os.getenv("PIPELINE_DEVICE") or "auto").lower()
         self.auto_fallback = _env_bool("AUTO_FALLBACK_FAST", True)
         self.allow_remote_download = _env_bool("ALLOW_REMOTE_DOWNLOAD", False)
+        # MODEL_HOST_ADDRESS: ORT sessions live in one process shared by all
+        # uvicorn workers (python -m services.modelhost), see modelhost.py.
+        self.model_host = shared_client()
 
-        fast_model_name = os.getenv("FAST_MODEL_NAME", "u2net")
+        fast_model_name = _normalize_name(os.getenv("FAST_MODEL_NAME", "u2net"))
         self.fast_model_name = fast_model_name
-        self.rembg_fast_session = new_session(fast_model_name)
+        self.fast_engine = os.getenv("FAST_ENGINE", "native").strip().lower()
+        if self.fast_engine not in FAST_ENGINES:
+            self.fast_engine = "native"
+        if self.fast_engine == "rembg" and new_session is None:
+            LOGGER.warning("FAST_ENGINE=rembg mais rembg n'est pas installe: moteur natif.")
+            self.fast_engine = "native"
+        # Created on first use, like the ONNX sessions: building the pipeline
+        # loads no model (process-pool parents never run one).
+        self.rembg_fast_session = None
+        self.fast_model: Optional["MaskModel"] = None
+        if self.fast_engine != "rembg":
+            self.fast_model = self._build_model(fast_model_name)
+        self._fast_lock = threading.Lock()
 
         pro_name_raw = os.getenv("PRO_MODEL_NAME", "inspyrenet")
         pro_name = _normalize_name(pro_name_raw)
         resolved = self._resolve_pro_name(pro_name)
+        variant = _normalize_name(os.getenv("PRO_MODEL_VARIANT", "fp32"))
+        if variant and variant != "fp32":
+            resolved = self._resolve_pro_name(f"{resolved}-{variant}")
         self.pro_requested_name = pro_name_raw
         self.pro_canonical_name = resolved
         self.pro_label = _default_description(resolved)
-        spec = PRO_MODEL_SPECS.get(resolved)
-        if spec is None:
-            raise ModelsUnavailableError(f"Modele pro inconnu: {pro_name}")
-
-        if spec.get("mock"):
-            self.pro_model = MockMaskModel()
-        else:
-            self.pro_model = OnnxMaskModel(
-                name=resolved,
-                spec=spec,
-                device_request=self.device_request,
-                allow_download=self.allow_remote_download,
-            )
+        self.pro_model = self._build_model(resolved)
+        self.registry = ModelRegistry(
+            resolve=lambda name: self._resolve_pro_name(_normalize_name(name)),
+            factory=self._build_model,
+            default=resolved,
+            allowed=self._allowed_models(),
+            # With a model host the budget is enforced there, not per worker.
+            budget_bytes=0 if self.model_host else (env_int("MODEL_RAM_BUDGET_MB", 0) or 0) * MB,
+            ram_factor=env_float("MODEL_RAM_FACTOR", DEFAULT_RAM_FACTOR),
+            pinned={resolved},
+        )
+        self.registry.register(resolved, self.pro_model)
         self.pro_status = (
             self.pro_model.status
             if hasattr(self.pro_model, "status")
             else ModelStatus(state="ready", ready=True)
         )
 
+        self.result_cache = ResultCache.from_env()
+        self.mask_store = MaskStore.from_env()
+        self.edge_refiner = EdgeRefiner.from_env()
+        self.edge_refiner.model_side = max(self.pro_model.input_size)
+        # The guided-filter radius follows the upscale of the fast model's mask.
+        self.fast_edge_refiner = EdgeRefiner.from_env()
+        if self.fast_model is not None:
+            self.fast_edge_refiner.model_side = max(self.fast_model.input_size)
+        self.crop_policy = CropPolicy.from_env()
+        self.preview_max_side = env_int("PREVIEW_MAX_SIDE", 512) or 512
+        self.animation_max_frames = max(1, env_int("ANIMATION_MAX_FRAMES", 300) or 1)
+        # Frames decoded at once; their keyframes share one model call.
+        self.animation_window = max(1, env_int("ANIMATION_WINDOW", 8) or 1)
+
         self._warmup_thread: Optional[threading.Thread] = None
         self._warmup_running = False
+        self.warmup_runs = max(0, env_int("WARMUP_RUNS", 2) or 0)
+        # idle -> running -> done | failed; readiness waits for the end.
+        self.warmup_state = "idle"
+        self.warmup_ms: Dict[str, float] = {}
+
+    def _build_model(self, name: str) -> "MaskModel":
+        spec = resolve_spec(name)
+        if spec is None:
+            raise ModelsUnavailableError(f"Modele pro inconnu: {name}")
+        if spec.get("mock"):
+            return MockMaskModel()
+        return OnnxMaskModel(
+            name=name,
+            spec=spec,
+            device_request=self.device_request,
+            allow_download=self.allow_remote_download,
+            host=self.model_host,
+        )
+
+    def _allowed_models(self) -> Optional[Set[str]]:
+        """MODELS_ALLOWED (comma-separated names); unset serves every known spec."""
+        raw = os.getenv("MODELS_ALLOWED", "").strip()
+        if not raw:
+            return {
+                name
+                for name, spec in PRO_MODEL_SPECS.items()
+                if "alias" not in spec
+                and not spec.get("mock")
+                and resolve_spec(name).get("tier") != "fast"  # type: ignore[union-attr]
+            }
+        return {
+            self._resolve_pro_name(_normalize_name(name.strip()))
+            for name in raw.split(",")
+            if name.strip()
+        }
 
     def _resolve_pro_name(self, name: str) -> str:
         spec = PRO_MODEL_SPECS.get(name)
@@ -334,51 +906,116 @@ class BackgroundRemovalPipeline:
             LOGGER.info("Demarrage du warmup des modeles pro.")
             self._warmup_running = True
             self.pro_status.warming = True
+            timings = StageTimings()
             try:
-                self._ensure_pro_ready()
+                with timings.stage("load"):
+                    self._ensure_pro_ready()
+                self._warm_up(timings)
+                self.warmup_state = "done"
             except Exception:  # noqa: BLE001
                 LOGGER.exception("Warmup pro echoue")
+                self.warmup_state = "failed"
             finally:
+                self.warmup_ms = timings.as_dict()
                 self.pro_status.warming = False
                 self._warmup_running = False
+            LOGGER.info(
+                "Warmup termine (%s) en %.0f ms",
+                self.warmup_state,
+                timings.total_ms,
+                extra={"warmup_ms": self.warmup_ms},
+            )
 
-        if blocking:
-            _run()
+        if self._warmup_thread and self._warmup_thread.is_alive():
             return
 
-        if self._warmup_thread and self._warmup_thread.is_alive():
+        self.warmup_state = "running"
+        if blocking:
+            _run()
             return
 
         thread = threading.Thread(target=_run, daemon=True)
         thread.start()
         self._warmup_thread = thread
 
-    def _ensure_pro_ready(self) -> None:
-        if isinstance(self.pro_model, MockMaskModel):
-            self.pro_status.state = "ready"
-            self.pro_status.ready = True
+    def _warm_up(self, timings: StageTimings) -> None:
+        """Run every hot path once: pro inference, fast session, codecs."""
+        if self.warmup_runs:
+            self.pro_model.warmup(self.warmup_runs, timings)
+
+        rgb = np.full((64, 64, 3), 127, dtype=np.uint8)
+        alpha = np.zeros((64, 64), dtype=np.float32)
+        alpha[16:48, 16:48] = 1.0
+        if _env_bool("WARMUP_FAST", True):
+            with timings.stage("fast"):
+                self._warm_up_fast(rgb, alpha, timings)
+        if _env_bool("WARMUP_CODECS", True):
+            buffer = BytesIO()
+            Image.fromarray(rgb).save(buffer, format="JPEG")
+            with timings.stage("decode"):
+                decode_rgb(buffer.getvalue())
+            for name in OUTPUT_FORMATS:
+                with timings.stage(f"encode_{name}"):
+                    encode_cutout(rgb, alpha, OutputSpec(name))
+
+    def _warm_up_fast(self, rgb: np.ndarray, alpha: np.ndarray, timings: StageTimings) -> None:
+        if self.fast_model is None:
+            self._remove_fast(encode_cutout(rgb, alpha))
+            return
+        try:
+            self._ensure_fast_ready()
+        except ModelsUnavailableError as exc:
+            # Pro readiness does not depend on the fast tier.
+            LOGGER.warning("Warmup fast ignore: %s", exc)
+            return
+        self.fast_model.warmup(max(1, self.warmup_runs), timings, prefix="fast")
+
+    def _ensure_fast_ready(self) -> "MaskModel":
+        model = self.fast_model
+        if model is None:
+            raise ModelsUnavailableError("Moteur fast natif desactive (FAST_ENGINE=rembg).")
+        with self._fast_lock:
+            try:
+                model.ensure_loaded()
+            except FileNotFoundError as exc:
+                model.status.state = "missing"
+                model.status.message = str(exc)
+                raise ModelsUnavailableError(str(exc)) from exc
+            except Exception as exc:  # noqa: BLE001
+                model.status.state = "error"
+                model.status.message = str(exc)
+                raise ModelsUnavailableError(f"Echec chargement modele fast: {exc}") from exc
+        return model
+
+    def _ensure_pro_ready(self, name: Optional[str] = None) -> None:
+        model = self.registry.model(name)
+        status = model.status
+        if isinstance(model, MockMaskModel):
+            status.state = "ready"
+            status.ready = True
+            self.registry.load(name)
             return
 
-        if getattr(self.pro_model, "session", None) is not None:
-            self.pro_status.state = "ready"
-            self.pro_status.ready = True
+        if getattr(model, "session", None) is not None:
+            status.state = "ready"
+            status.ready = True
             return
 
-        if self.pro_status.state == "loading":
+        if status.state == "loading":
             raise WarmupPendingError("Le modele pro est en cours de chargement.")
 
         try:
-            self.pro_model.ensure_loaded()
+            self.registry.load(name)
         except FileNotFoundError as exc:
             message = str(exc)
-            self.pro_status.state = "missing"
-            self.pro_status.ready = False
-            self.pro_status.message = message
+            status.state = "missing"
+            status.ready = False
+            status.message = message
             raise ModelsUnavailableError(message) from exc
         except Exception as exc:  # noqa: BLE001
-            self.pro_status.state = "error"
-            self.pro_status.ready = False
-            self.pro_status.message = str(exc)
+            status.state = "error"
+            status.ready = False
+            status.message = str(exc)
             raise ModelsUnavailableError(
                 f"Echec chargement modele pro: {exc}"
             ) from exc
@@ -386,7 +1023,9 @@ class BackgroundRemovalPipeline:
     def status_snapshot(self) -> dict:
         pro_ready = bool(self.pro_status.ready)
         state = self.pro_status.state or "idle"
-        if pro_ready:
+        if pro_ready and self.warmup_state == "running":
+            status = "warming_up"
+        elif pro_ready:
             status = "ok"
         elif state in {"loading", "idle"}:
             status = "warming_up"
@@ -396,7 +1035,7 @@ class BackgroundRemovalPipeline:
         return {
             "status": status,
             "models": {
-                "fast": {"model": self.fast_model_name},
+                "fast": self._fast_snapshot(),
                 "pro": {
                     "model": self.pro_label,
                     "slug": self.pro_canonical_name,
@@ -406,11 +1045,38 @@ class BackgroundRemovalPipeline:
                     "message": self.pro_status.message,
                     "path": self.pro_status.path,
                     "device": self.pro_status.device,
+                    "load_ms": self.pro_status.load_ms,
+                    "batching": self._batching_snapshot(),
                 },
             },
+            "warmup": {
+                "state": self.warmup_state,
+                "runs": self.warmup_runs,
+                "stages_ms": self.warmup_ms,
+            },
+            "registry": self.registry.snapshot(),
+            "model_host": self.model_host.snapshot() if self.model_host else None,
             "model_dir": str(MODEL_DIR.resolve()),
+            "cache": self.result_cache.snapshot(),
+            "masks": self.mask_store.snapshot(),
         }
 
+    def _fast_snapshot(self) -> dict:
+        snapshot: Dict[str, object] = {"model": self.fast_model_name, "engine": self.fast_engine}
+        if self.fast_model is not None:
+            status = self.fast_model.status
+            snapshot.update(
+                state=status.state,
+                ready=status.ready,
+                message=status.message,
+                load_ms=status.load_ms,
+            )
+        return snapshot
+
+    def _batching_snapshot(self) -> Optional[dict]:
+        batcher = getattr(self.pro_model, "batcher", None)
+        return batcher.snapshot() if batcher is not None else None
+
     def health(self) -> dict:
         return self.status_snapshot()
 
@@ -426,56 +1092,529 @@ class BackgroundRemovalPipeline:
         image_bytes: bytes,
         quality: str = "pro",
     ) -> Tuple[bytes, bool]:
-        quality = (quality or "pro").lower()
-        if quality not in SUPPORTED_QUALITY:
-            quality = "pro"
+        result = self.process(image_bytes, RemovalOptions(quality=quality))
+        return result.data, result.used_fallback
 
-        if quality == "fast":
-            return self._remove_fast(image_bytes), False
+    def process(
+        self,
+        image_bytes: bytes,
+        options: Optional[RemovalOptions] = None,
+    ) -> RemovalResult:
+        options = self._resolve_options(options)
+        timings = StageTimings()
+        model_slug = self.fast_model_name if options.model is None else options.model
+        key = content_key(image_bytes, model_slug, options.cache_token())
+        if self.result_cache.enabled:
+            with timings.stage("cache"):
+                cached = self.result_cache.get(key)
+            # A cached preview is only useful while its mask can be rendered.
+            if cached is not None and options.preview and not self._has_mask(image_bytes, model_slug):
+                cached = None
+            if cached is not None:
+                image_id = self._remember_mask(
+                    image_bytes, model_slug, cached, None, coarse=options.preview
+                )
+                return RemovalResult(
+                    cached,
+                    cache_status="hit",
+                    etag=key,
+                    image_id=image_id,
+                    timings=timings.as_dict(),
+                    media_type=options.output_spec.media_type,
+                    preview=options.preview,
+                )
 
+        data, used_fallback, mask = self._remove(image_bytes, options, timings)
+        if used_fallback:
+            # The fast fallback must not be served later as a pro result.
+            image_id = self._remember_mask(
+                image_bytes, self.fast_model_name, data, mask, coarse=options.preview
+            )
+            return RemovalResult(
+                data,
+                used_fallback=True,
+                cache_status="bypass",
+                image_id=image_id,
+                timings=timings.as_dict(),
+                media_type=options.output_spec.media_type,
+                preview=options.preview,
+            )
+        image_id = self._remember_mask(
+            image_bytes, model_slug, data, mask, coarse=options.preview
+        )
+        cache_status = "bypass"
+        if self.result_cache.enabled:
+            self.result_cache.put(key, data)
+            cache_status = "miss"
+        return RemovalResult(
+            data,
+            cache_status=cache_status,
+            etag=key,
+            image_id=image_id,
+            timings=timings.as_dict(),
+            media_type=options.output_spec.media_type,
+            preview=options.preview,
+        )
+
+    def process_profiled(
+        self,
+        image_bytes: bytes,
+        options: Optional[RemovalOptions],
+        mode: str,
+        directory: Path,
+    ) -> Tuple[RemovalResult, str]:
+        """Process one image outside the cache while capturing a trace.
+
+        ``cpu`` wraps the whole removal in cProfile; ``ort`` runs the pro model
+        on a private session with ORT profiling enabled. Returns the result and
+        the trace file name in ``directory``.
+        """
+        options = self._resolve_options(options)
+        timings = StageTimings()
+        stem = profile_stem()
+        used_fallback = False
+        if mode == "ort":
+            if options.model is None:
+                raise ProfilingUnavailableError("Le profilage ORT demande quality=pro.")
+            self._ensure_pro_ready(options.model)
+            model = self.registry.model(options.model)
+            if not isinstance(model, OnnxMaskModel):
+                raise ProfilingUnavailableError("Profilage ORT indisponible pour ce modele.")
+            directory.mkdir(parents=True, exist_ok=True)
+            profiled = model.profiled_copy(str(directory / stem))
+            try:
+                data, _ = self._run_model(profiled, image_bytes, options, timings)
+            finally:
+                trace = Path(profiled.session.end_profiling())
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                data, used_fallback, _ = self._remove(image_bytes, options, timings)
+            finally:
+                profiler.disable()
+            trace = write_cpu_profile(profiler, directory, stem)
+        result = RemovalResult(
+            data,
+            used_fallback=used_fallback,
+            cache_status="bypass",
+            timings=timings.as_dict(),
+            media_type=options.output_spec.media_type,
+            preview=options.preview,
+        )
+        return result, trace.name
+
+    def process_animation(
+        self,
+        sequence: FrameSequence,
+        options: Optional[RemovalOptions] = None,
+        directory: Optional[Path] = None,
+    ) -> AnimationResult:
+        """Cut out every frame of ``sequence`` into an animated PNG or WebP file.
+
+        Only keyframes run the model; see ``render_animation``. The output is
+        written to a temporary file in ``directory`` as it is encoded.
+        """
+        options = replace(self._resolve_options(options), crop=False, preview=False)
+        timings = StageTimings()
+        info = sequence.probe(self.animation_max_frames)
+        used_fallback = False
+        if options.quality == "pro":
+            try:
+                self._ensure_pro_ready(options.model)
+            except (WarmupPendingError, ModelsUnavailableError) as exc:
+                if not self.auto_fallback:
+                    raise
+                LOGGER.warning("Modele pro indisponible pour l'animation: %s. Fallback fast.", exc)
+                options = replace(options, quality="fast", model=None)
+                used_fallback = True
+        if options.quality == "fast":
+            if self.fast_model is None:
+                raise ModelsUnavailableError(
+                    "Les animations demandent le moteur fast natif (FAST_ENGINE=native)."
+                )
+            model_context = nullcontext(self._ensure_fast_ready())
+            refiner = self.fast_edge_refiner
+        else:
+            model_context = self.registry.use(options.model)
+            refiner = self.edge_refiner
+
+        writer = writer_for(options.output_spec)
+        handle, name = tempfile.mkstemp(
+            prefix="wizpix-anim-", suffix=f".{writer.extension}", dir=directory
+        )
+        path = Path(name)
         try:
-            self._ensure_pro_ready()
+            with os.fdopen(handle, "w+b") as sink, model_context as model:
+                stats = render_animation(
+                    sequence,
+                    info,
+                    sink,
+                    options.output_spec,
+                    predict=lambda images: model.predict_masks(images, timings=timings),
+                    refine=lambda rgb, mask: refine_mask(rgb, mask, options.refine, refiner),
+                    tracker=KeyframeTracker.from_env(),
+                    window=self.animation_window,
+                    timings=timings,
+                )
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        LOGGER.info(
+            f"{options.quality}.animation",
+            extra={
+                "model": self._model_name(options),
+                "frames": stats.frames,
+                "keyframes": stats.keyframes,
+                "warped": stats.warped,
+                "timings": timings.as_dict(),
+            },
+        )
+        return AnimationResult(
+            path,
+            media_type=writer.media_type,
+            frames=stats.frames,
+            keyframes=stats.keyframes,
+            warped=stats.warped,
+            used_fallback=used_fallback,
+            timings=timings.as_dict(),
+        )
+
+    def render(self, image_id: str, options: Optional[RemovalOptions] = None) -> RemovalResult:
+        """Full-resolution result for a stored mask (e.g. after a preview), without inference."""
+        options = replace((options or RemovalOptions()).normalized(), preview=False, crop=False)
+        timings = StageTimings()
+        stored = self.mask_store.get(image_id)
+        key = content_key(stored.image_bytes, image_id, "render", options.cache_token())
+        if self.result_cache.enabled:
+            with timings.stage("cache"):
+                cached = self.result_cache.get(key)
+            if cached is not None:
+                return RemovalResult(
+                    cached,
+                    cache_status="hit",
+                    etag=key,
+                    image_id=image_id,
+                    timings=timings.as_dict(),
+                    media_type=options.output_spec.media_type,
+                )
+
+        with timings.stage("decode"):
+            rgb = decode_rgb(stored.image_bytes)
+        mask = self._stored_mask_at(stored, rgb, options.refine, timings)
+        with timings.stage("encode"):
+            data = composite_straight_alpha(rgb, mask, options.output_spec)
+        cache_status = "bypass"
+        if self.result_cache.enabled:
+            self.result_cache.put(key, data)
+            cache_status = "miss"
+        return RemovalResult(
+            data,
+            cache_status=cache_status,
+            etag=key,
+            image_id=image_id,
+            timings=timings.as_dict(),
+            media_type=options.output_spec.media_type,
+        )
+
+    def recomposite(self, image_id: str, background: BackgroundSpec) -> bytes:
+        """Re-render a stored cut-out over a new background, without inference."""
+        background.validate()
+        stored = self.mask_store.get(image_id)
+        rgb = decode_rgb(stored.image_bytes)
+        mask = self._stored_mask_at(stored, rgb, DEFAULT_REFINE, StageTimings())
+        return composite_over_background(rgb, alpha_to_uint8(mask), background)
+
+    def _stored_mask_at(
+        self,
+        stored: StoredMask,
+        rgb: np.ndarray,
+        refine: str,
+        timings: StageTimings,
+    ) -> np.ndarray:
+        """Float mask of ``stored`` at ``rgb``'s size; coarse masks get upscaled and refined."""
+        mask = stored.decode_mask()
+        height, width = rgb.shape[:2]
+        if not stored.coarse:
+            if mask.shape[:2] != (height, width):
+                mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)
+            return mask.astype(np.float32) / 255.0
+        with timings.stage("upscale"):
+            mask = cv2.resize(
+                mask.astype(np.float32) / 255.0,
+                (width, height),
+                interpolation=cv2.INTER_CUBIC,
+            )
+            np.clip(mask, 0.0, 1.0, out=mask)
+        with timings.stage("refine"):
+            return refine_mask(rgb, mask, refine, self.edge_refiner)
+
+    def _resolve_options(self, options: Optional[RemovalOptions]) -> RemovalOptions:
+        options = (options or RemovalOptions()).normalized()
+        if options.quality == "fast":
+            return replace(options, model=None)
+        return replace(options, model=self.registry.resolve(options.model))
+
+    def _has_mask(self, image_bytes: bytes, model_slug: str) -> bool:
+        return not self.mask_store.enabled or content_key(image_bytes, model_slug) in self.mask_store
+
+    def _remember_mask(
+        self,
+        image_bytes: bytes,
+        model_slug: str,
+        output: bytes,
+        mask: Optional[np.ndarray],
+        coarse: bool = False,
+    ) -> Optional[str]:
+        if not self.mask_store.enabled:
+            return None
+        image_id = content_key(image_bytes, model_slug)
+        existing = self.mask_store.peek(image_id)
+        # A full-resolution mask replaces a preview one, never the reverse.
+        if existing is not None and (coarse or not existing.coarse):
+            return image_id
+        if mask is None:
+            mask = _alpha_from_output(output)
+            if mask is None:
+                return None
+        self.mask_store.put(image_id, image_bytes, mask, coarse=coarse)
+        return image_id
+
+    def _remove(
+        self,
+        image_bytes: bytes,
+        options: RemovalOptions,
+        timings: Optional[StageTimings] = None,
+    ) -> Tuple[bytes, bool, Optional[np.ndarray]]:
+        timings = timings or StageTimings()
+        if options.quality == "fast":
+            data, mask = self._run_fast(image_bytes, options, timings)
+            return data, False, mask
+
+        try:
+            self._ensure_pro_ready(options.model)
         except WarmupPendingError as exc:
             if self.auto_fallback:
                 LOGGER.warning("Modele pro en warmup: fallback fast.")
-                return self._remove_fast(image_bytes), True
+                return self._fallback_fast(image_bytes, options, timings)
             raise
         except ModelsUnavailableError as exc:
             if self.auto_fallback:
                 LOGGER.warning("Modele pro indisponible: %s. Fallback fast.", exc)
-                return self._remove_fast(image_bytes), True
+                return self._fallback_fast(image_bytes, options, timings)
             raise
 
         try:
-            return self._remove_pro(image_bytes), False
+            data, mask = self._remove_pro(image_bytes, options, timings)
+            return data, False, mask
         except ModelsUnavailableError:
             raise
         except Exception:  # noqa: BLE001
             LOGGER.exception("Echec pipeline pro; fallback fast.")
             if self.auto_fallback:
-                return self._remove_fast(image_bytes), True
+                return self._fallback_fast(image_bytes, options, timings)
             raise
 
+    def _fallback_fast(
+        self,
+        image_bytes: bytes,
+        options: RemovalOptions,
+        timings: StageTimings,
+    ) -> Tuple[bytes, bool, Optional[np.ndarray]]:
+        data, mask = self._run_fast(image_bytes, options, timings)
+        return data, True, mask
+
+    def _run_fast(
+        self,
+        image_bytes: bytes,
+        options: RemovalOptions,
+        timings: StageTimings,
+    ) -> Tuple[bytes, Optional[np.ndarray]]:
+        options = replace(options, quality="fast", model=None, crop=False)
+        if self.fast_model is not None:
+            model = self._ensure_fast_ready()
+            return self._run_model(model, image_bytes, options, timings)
+
+        with timings.stage("fast"):
+            data = self._remove_fast(image_bytes)
+        if options.output != "png" or options.preview:
+            with timings.stage("encode"):
+                max_side = self.preview_max_side if options.preview else None
+                data = _reencode_cutout(data, options.output_spec, max_side)
+        return data, None
+
     def _remove_fast(self, image_bytes: bytes) -> bytes:
-        return rembg_remove(image_bytes, session=self.rembg_fast_session)
+        """rembg backend (FAST_ENGINE=rembg): decode, u2net and PNG encode in one call."""
+        return rembg_remove(image_bytes, session=self._rembg_session())
 
-    def _remove_pro(self, image_bytes: bytes) -> bytes:
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        rgb = np.array(image, dtype=np.uint8)
+    def _rembg_session(self) -> Any:
+        with self._fast_lock:
+            if self.rembg_fast_session is None:
+                self.rembg_fast_session = new_session(self.fast_model_name)
+            return self.rembg_fast_session
 
-        start = time.perf_counter()
-        mask = self.pro_model.predict_mask(image)
-        duration = (time.perf_counter() - start) * 1000
+    def _remove_pro(
+        self,
+        image_bytes: bytes,
+        options: RemovalOptions = RemovalOptions(),
+        timings: Optional[StageTimings] = None,
+    ) -> Tuple[bytes, np.ndarray]:
+        timings = timings or StageTimings()
+        with self.registry.use(options.model) as model:
+            return self._run_model(model, image_bytes, options, timings)
+
+    def _run_model(
+        self,
+        model: "MaskModel",
+        image_bytes: bytes,
+        options: RemovalOptions,
+        timings: StageTimings,
+    ) -> Tuple[bytes, np.ndarray]:
+        with timings.stage("decode"):
+            header = read_header(image_bytes)
+        full_size = (header.width, header.height)
+        if options.preview:
+            return self._preview_model(model, image_bytes, full_size, options, timings)
+        crop = self._plan_crop(model, image_bytes, full_size, timings) if options.crop else None
+        if crop is None:
+            mask, rgb = self._predict_frame(model, image_bytes, full_size, timings)
+        else:
+            mask, rgb = self._predict_crop(model, image_bytes, crop, timings)
+
+        with timings.stage("refine"):
+            refiner = self.fast_edge_refiner if options.quality == "fast" else self.edge_refiner
+            mask = refine_mask(rgb, mask, options.refine, refiner)
+        with timings.stage("encode"):
+            data = composite_straight_alpha(rgb, mask, options.output_spec)
         LOGGER.info(
-            "pro.inference",
+            f"{options.quality}.inference",
             extra={
-                "model": self.pro_canonical_name,
-                "duration_ms": round(duration, 2),
-                "size": [image.width, image.height],
+                "model": self._model_name(options),
+                "output": options.output,
+                "effort": options.effort,
+                "duration_ms": round(timings.get("inference"), 2),
+                "size": list(full_size),
+                "crop": crop.as_list() if crop is not None else None,
+                "timings": timings.as_dict(),
             },
         )
-        mask = cv2.GaussianBlur(mask, (3, 3), 0.5)
-        return composite_straight_alpha(rgb, mask)
+        return data, mask
+
+    def _model_name(self, options: RemovalOptions) -> str:
+        if options.quality == "fast":
+            return self.fast_model_name
+        return options.model or self.pro_canonical_name
+
+    def _preview_model(
+        self,
+        model: "MaskModel",
+        image_bytes: bytes,
+        full_size: Tuple[int, int],
+        options: RemovalOptions,
+        timings: StageTimings,
+    ) -> Tuple[bytes, np.ndarray]:
+        """Small composite as soon as the mask exists.
+
+        The returned mask stays at the decoded model-input size; upscaling,
+        refinement and the full-resolution encode are left to render().
+        """
+        with timings.stage("decode"):
+            model_rgb = decode_rgb(image_bytes, draft_size=model.draft_size(full_size))
+        decoded_size = (model_rgb.shape[1], model_rgb.shape[0])
+        with timings.stage("inference"):
+            mask = model.predict_mask(model_rgb, output_size=decoded_size, timings=timings)
+        with timings.stage("preview"):
+            size = preview_size(full_size, self.preview_max_side)
+            interpolation = resize_interpolation(decoded_size, size)
+            small_rgb = cv2.resize(model_rgb, size, interpolation=interpolation)
+            small_mask = cv2.resize(mask, size, interpolation=interpolation)
+        with timings.stage("encode"):
+            data = composite_straight_alpha(small_rgb, small_mask, options.output_spec)
+        LOGGER.info(
+            f"{options.quality}.preview",
+            extra={
+                "model": self._model_name(options),
+                "size": list(full_size),
+                "preview": list(size),
+                "timings": timings.as_dict(),
+            },
+        )
+        return data, mask
+
+    def _predict_frame(
+        self,
+        model: "MaskModel",
+        image_bytes: bytes,
+        full_size: Tuple[int, int],
+        timings: StageTimings,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # The model only sees ~1024 px, so JPEGs are DCT-downscaled while
+        # decoding; the full-resolution decode is deferred until compositing.
+        with timings.stage("decode"):
+            model_rgb = decode_rgb(image_bytes, draft_size=model.draft_size(full_size))
+        with timings.stage("inference"):
+            mask = model.predict_mask(model_rgb, output_size=full_size, timings=timings)
+        if model_rgb.shape[:2] == (full_size[1], full_size[0]):
+            return mask, model_rgb
+        del model_rgb
+        with timings.stage("decode"):
+            rgb = decode_rgb(image_bytes)
+        return mask, rgb
+
+    def _plan_crop(
+        self,
+        model: "MaskModel",
+        image_bytes: bytes,
+        full_size: Tuple[int, int],
+        timings: StageTimings,
+    ) -> Optional[CropBox]:
+        """First pass: locate the subject on a thumbnail, return the crop."""
+        side = self.crop_policy.thumbnail
+        with timings.stage("locate"):
+            thumb = decode_rgb(image_bytes, draft_size=(side, side))
+            scale = side / float(max(thumb.shape[:2]))
+            if scale < 1.0:
+                thumb = cv2.resize(
+                    thumb,
+                    (max(1, round(thumb.shape[1] * scale)), max(1, round(thumb.shape[0] * scale))),
+                    interpolation=cv2.INTER_AREA,
+                )
+            thumb_mask = None
+            if self.crop_policy.localizer == "fast":
+                thumb_mask = self._locate_fast(thumb, timings)
+            if thumb_mask is None:
+                thumb_mask = model.predict_mask(thumb, timings=timings)
+        return self.crop_policy.plan(thumb_mask, full_size)
+
+    def _locate_fast(self, thumb: np.ndarray, timings: StageTimings) -> Optional[np.ndarray]:
+        """Subject mask of a thumbnail from the fast tier, None if it is unavailable."""
+        if self.fast_model is not None:
+            try:
+                return self._ensure_fast_ready().predict_mask(thumb, timings=timings)
+            except ModelsUnavailableError:
+                return None
+        predict = getattr(self._rembg_session(), "predict", None)
+        if not callable(predict):
+            return None
+        located = predict(Image.fromarray(thumb))[0]
+        return np.asarray(located.convert("L"), dtype=np.float32) / 255.0
+
+    def _predict_crop(
+        self,
+        model: "MaskModel",
+        image_bytes: bytes,
+        crop: CropBox,
+        timings: StageTimings,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Second pass: run the pro model on the subject crop only."""
+        with timings.stage("decode"):
+            rgb = decode_rgb(image_bytes)
+        rows, cols = crop.slices
+        with timings.stage("inference"):
+            crop_mask = model.predict_mask(rgb[rows, cols], timings=timings)
+        mask = np.zeros(rgb.shape[:2], dtype=np.float32)
+        mask[rows, cols] = crop_mask
+        return mask, rgb
 
 
 if _env_bool("WIZPIX_SKIP_PIPELINE_INIT", False):
@@ -485,8 +1624,18 @@ else:
 
 __all__ = [
     "BackgroundRemovalPipeline",
+    "OnnxMaskModel",
+    "PRO_MODEL_SPECS",
+    "resolve_spec",
+    "RemovalOptions",
+    "RemovalResult",
+    "AnimationResult",
+    "UnknownModelError",
     "WarmupPendingError",
     "ModelsUnavailableError",
+    "MaskNotFoundError",
     "pipeline",
+    "composite_over_background",
     "composite_straight_alpha",
+    "preview_size",
 ]
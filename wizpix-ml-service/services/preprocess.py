@@ -0,0 +1,113 @@
+import threading
+from typing import Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ImageLike = Union[Image.Image, np.ndarray]
+
+
+def resize_interpolation(src_size: Tuple[int, int], dst_size: Tuple[int, int]) -> int:
+    """INTER_AREA when shrinking (alias-free), INTER_CUBIC otherwise."""
+    if dst_size[0] <= src_size[0] and dst_size[1] <= src_size[1]:
+        return cv2.INTER_AREA
+    return cv2.INTER_CUBIC
+
+
+def as_rgb_array(image: ImageLike) -> np.ndarray:
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # A read-only view over tobytes() skips the extra copy of np.asarray().
+    return np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(
+        image.height, image.width, 3
+    )
+
+
+class Preprocessor:
+    """Builds a model's ``1x3xHxW`` float32 input into per-thread buffers.
+
+    Each worker thread owns one uint8 resize buffer and one NCHW tensor that
+    are reused across calls. Large downscales first take OpenCV's fast
+    integer-factor INTER_AREA path into a grow-only scratch buffer, then a
+    bilinear step to the model size. Scaling by the image's peak value, mean
+    and std is folded into a single per-channel ``x * a + b``. The returned
+    tensor is only valid until the same thread calls the preprocessor again.
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int],
+        mean: Sequence[float] = (0.5, 0.5, 0.5),
+        std: Sequence[float] = (1.0, 1.0, 1.0),
+    ) -> None:
+        self.width, self.height = int(size[0]), int(size[1])
+        self._mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1)
+        self._inv_std = (1.0 / np.asarray(std, dtype=np.float32)).reshape(3, 1, 1)
+        self._local = threading.local()
+
+    def _buffers(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = (
+                np.empty((self.height, self.width, 3), dtype=np.uint8),
+                np.empty((1, 3, self.height, self.width), dtype=np.float32),
+                np.empty((3, 1, 1), dtype=np.float32),
+                np.empty((3, 1, 1), dtype=np.float32),
+            )
+            self._local.buffers = buffers
+        return buffers
+
+    def _scratch(self, shape: Tuple[int, int, int]) -> np.ndarray:
+        needed = shape[0] * shape[1] * shape[2]
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch.size < needed:
+            scratch = np.empty(needed, dtype=np.uint8)
+            self._local.scratch = scratch
+        return scratch[:needed].reshape(shape)
+
+    def resize_into(self, rgb: np.ndarray, dst: np.ndarray) -> None:
+        src_h, src_w = rgb.shape[:2]
+        dst_h, dst_w = dst.shape[:2]
+        if (src_w, src_h) == (dst_w, dst_h):
+            np.copyto(dst, rgb)
+            return
+        factor = min(src_w // dst_w, src_h // dst_h)
+        if factor >= 2:
+            reduced = self._scratch((src_h // factor, src_w // factor, 3))
+            cv2.resize(
+                rgb[: reduced.shape[0] * factor, : reduced.shape[1] * factor],
+                (reduced.shape[1], reduced.shape[0]),
+                dst=reduced,
+                interpolation=cv2.INTER_AREA,
+            )
+            cv2.resize(reduced, (dst_w, dst_h), dst=dst, interpolation=cv2.INTER_LINEAR)
+            return
+        cv2.resize(
+            rgb,
+            (dst_w, dst_h),
+            dst=dst,
+            interpolation=resize_interpolation((src_w, src_h), (dst_w, dst_h)),
+        )
+
+    def __call__(self, image: ImageLike, peak: Optional[int] = None) -> np.ndarray:
+        """Build the tensor; ``peak`` overrides the image's own maximum value."""
+        rgb = as_rgb_array(image)
+        resized, tensor, scale, offset = self._buffers()
+        self.resize_into(rgb, resized)
+
+        # (x / peak - mean) / std  ==  x * (1 / (peak * std)) - mean / std
+        peak = max(int(resized.max()) if peak is None else int(peak), 1)
+        np.multiply(self._inv_std, 1.0 / peak, out=scale)
+        np.multiply(self._mean, self._inv_std, out=offset)
+        np.negative(offset, out=offset)
+
+        planes = tensor[0]
+        np.multiply(resized.transpose(2, 0, 1), scale, out=planes)
+        np.add(planes, offset, out=planes)
+        return tensor
+
+
+__all__ = ["Preprocessor", "as_rgb_array", "resize_interpolation"]
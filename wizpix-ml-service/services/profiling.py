@@ -0,0 +1,76 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .settings import CACHE_DIR
+
+PROFILE_MODES = {"cpu", "ort"}
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+class ProfilingUnavailableError(ValueError):
+    """Raised when the requested trace cannot be captured for this request."""
+
+
+@dataclass(frozen=True)
+class ProfileSettings:
+    """Opt-in per-request profiling; disabled while no secret is configured."""
+
+    secret: Optional[str] = None
+    directory: Path = CACHE_DIR / "profiles"
+
+    @classmethod
+    def from_env(cls) -> "ProfileSettings":
+        return cls(
+            secret=os.getenv("PROFILE_SECRET") or None,
+            directory=Path(os.getenv("PROFILE_DIR") or CACHE_DIR / "profiles"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret)
+
+    def authorized(self, token: Optional[str]) -> bool:
+        if not self.secret or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.secret.encode("utf-8"))
+
+    def path_for(self, name: str) -> Optional[Path]:
+        """Stored trace called ``name``, or None if it is not a plain file name."""
+        if not _SAFE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+def profile_stem() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def write_cpu_profile(profiler: cProfile.Profile, directory: Path, stem: str) -> Path:
+    """Dump ``profiler`` as ``<stem>.prof`` plus a readable ``<stem>.txt`` summary."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{stem}.prof"
+    profiler.dump_stats(str(path))
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+    (directory / f"{stem}.txt").write_text(summary.getvalue(), encoding="utf-8")
+    return path
+
+
+__all__ = [
+    "PROFILE_MODES",
+    "ProfileSettings",
+    "ProfilingUnavailableError",
+    "profile_stem",
+    "write_cpu_profile",
+]
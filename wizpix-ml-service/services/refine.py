@@ -0,0 +1,160 @@
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .settings import env_float, env_int
+
+REFINE_MODES = {"none", "blur", "guided"}
+DEFAULT_REFINE = "blur"
+
+# A mask value in (low, 1 - low) is "uncertain" and belongs to the edge band.
+BAND_THRESHOLD = 0.02
+
+
+def guided_filter(guide: np.ndarray, src: np.ndarray, radius: int, eps: float) -> np.ndarray:
+    """Colour guided filter (He et al.) of ``src`` steered by an RGB ``guide``.
+
+    ``guide`` is ``HxWx3`` float32 in [0, 1] and ``src`` ``HxW`` float32. The
+    per-pixel 3x3 covariance is inverted in closed form with cofactors.
+    """
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    def box(values: np.ndarray) -> np.ndarray:
+        return cv2.boxFilter(values, cv2.CV_32F, ksize, borderType=cv2.BORDER_REFLECT)
+
+    r, g, b = guide[..., 0], guide[..., 1], guide[..., 2]
+    mean_r, mean_g, mean_b = box(r), box(g), box(b)
+    mean_p = box(src)
+    cov_rp = box(r * src) - mean_r * mean_p
+    cov_gp = box(g * src) - mean_g * mean_p
+    cov_bp = box(b * src) - mean_b * mean_p
+
+    var_rr = box(r * r) - mean_r * mean_r + eps
+    var_rg = box(r * g) - mean_r * mean_g
+    var_rb = box(r * b) - mean_r * mean_b
+    var_gg = box(g * g) - mean_g * mean_g + eps
+    var_gb = box(g * b) - mean_g * mean_b
+    var_bb = box(b * b) - mean_b * mean_b + eps
+
+    inv_rr = var_gg * var_bb - var_gb * var_gb
+    inv_rg = var_gb * var_rb - var_rg * var_bb
+    inv_rb = var_rg * var_gb - var_gg * var_rb
+    inv_gg = var_rr * var_bb - var_rb * var_rb
+    inv_gb = var_rb * var_rg - var_rr * var_gb
+    inv_bb = var_rr * var_gg - var_rg * var_rg
+    det = var_rr * inv_rr + var_rg * inv_rg + var_rb * inv_rb
+
+    a_r = (inv_rr * cov_rp + inv_rg * cov_gp + inv_rb * cov_bp) / det
+    a_g = (inv_rg * cov_rp + inv_gg * cov_gp + inv_gb * cov_bp) / det
+    a_b = (inv_rb * cov_rp + inv_gb * cov_gp + inv_bb * cov_bp) / det
+    offset = mean_p - a_r * mean_r - a_g * mean_g - a_b * mean_b
+
+    return box(a_r) * r + box(a_g) * g + box(a_b) * b + box(offset)
+
+
+def _band_runs(active: np.ndarray) -> Iterator[Tuple[int, int, int]]:
+    """Yield ``(row, first_col, end_col)`` runs of active tiles per tile row."""
+    for row in range(active.shape[0]):
+        cols = np.flatnonzero(active[row])
+        if cols.size == 0:
+            continue
+        breaks = np.flatnonzero(np.diff(cols) > 1)
+        starts = np.concatenate(([cols[0]], cols[breaks + 1]))
+        ends = np.concatenate((cols[breaks], [cols[-1]])) + 1
+        for start, end in zip(starts, ends):
+            yield row, int(start), int(end)
+
+
+class EdgeRefiner:
+    """Refines an upscaled mask only inside its uncertain boundary band.
+
+    The band (``BAND_THRESHOLD < mask < 1 - BAND_THRESHOLD``) is covered with
+    ``tile`` px tiles; contiguous active tiles of a row are guided-filtered
+    together against the full-resolution RGB, with a ``radius`` halo of
+    context. Only band pixels are written back, so confident interior and
+    exterior values are untouched and the cost follows edge length.
+    """
+
+    def __init__(
+        self,
+        radius: Optional[int] = None,
+        eps: float = 1e-4,
+        tile: int = 64,
+        model_side: int = 1024,
+    ) -> None:
+        self.radius = radius
+        self.eps = eps
+        self.tile = max(8, tile)
+        self.model_side = model_side
+
+    @classmethod
+    def from_env(cls) -> "EdgeRefiner":
+        return cls(
+            radius=env_int("REFINE_RADIUS", None),
+            eps=env_float("REFINE_EPS", 1e-4),
+            tile=env_int("REFINE_TILE", 64) or 64,
+        )
+
+    def radius_for(self, shape: Tuple[int, int]) -> int:
+        if self.radius:
+            return self.radius
+        # Scale with the upsampling factor of the model's mask.
+        upscale = max(shape) / float(self.model_side)
+        return int(np.clip(round(4 * upscale), 4, 32))
+
+    def band(self, mask: np.ndarray) -> np.ndarray:
+        return (mask > BAND_THRESHOLD) & (mask < 1.0 - BAND_THRESHOLD)
+
+    def __call__(self, rgb: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        height, width = mask.shape[:2]
+        radius = self.radius_for((height, width))
+        band = self.band(mask)
+        if not band.any():
+            return mask
+
+        tile = self.tile
+        rows = -(-height // tile)
+        cols = -(-width // tile)
+        padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+        padded[:height, :width] = band
+        active = padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+        refined = mask.copy()
+        inv_255 = np.float32(1.0 / 255.0)
+        for row, first, end in _band_runs(active):
+            y0, y1 = row * tile, min((row + 1) * tile, height)
+            x0, x1 = first * tile, min(end * tile, width)
+            hy0, hy1 = max(0, y0 - radius), min(height, y1 + radius)
+            hx0, hx1 = max(0, x0 - radius), min(width, x1 + radius)
+
+            guide = rgb[hy0:hy1, hx0:hx1].astype(np.float32) * inv_255
+            filtered = guided_filter(guide, mask[hy0:hy1, hx0:hx1], radius, self.eps)
+
+            inner = (slice(y0 - hy0, y1 - hy0), slice(x0 - hx0, x1 - hx0))
+            region = band[y0:y1, x0:x1]
+            refined[y0:y1, x0:x1][region] = filtered[inner][region]
+        return np.clip(refined, 0.0, 1.0, out=refined)
+
+
+def refine_mask(
+    rgb: np.ndarray,
+    mask: np.ndarray,
+    mode: str = DEFAULT_REFINE,
+    refiner: Optional[EdgeRefiner] = None,
+) -> np.ndarray:
+    """Apply the ``mode`` refinement to a float mask at ``rgb``'s resolution."""
+    if mode == "none":
+        return mask
+    if mode == "guided":
+        return (refiner or EdgeRefiner())(rgb, mask)
+    return cv2.GaussianBlur(mask, (3, 3), 0.5)
+
+
+__all__ = [
+    "DEFAULT_REFINE",
+    "EdgeRefiner",
+    "REFINE_MODES",
+    "guided_filter",
+    "refine_mask",
+]
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+from .cache import MB
+
+LOGGER = logging.getLogger(__name__)
+
+# Resident size of an ORT session relative to its .onnx file (weights plus
+# arena and pre-packed kernels), unless the spec declares "ram_mb".
+DEFAULT_RAM_FACTOR = 2.0
+
+
+class UnknownModelError(ValueError):
+    """Raised when a request names a model that is not served."""
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    loads: int = 0
+    evictions: int = 0
+    load_ms: Optional[float] = None
+    size_bytes: int = 0
+
+
+def estimate_model_bytes(model: Any, ram_factor: float = DEFAULT_RAM_FACTOR) -> int:
+    """Expected RAM of a loaded model, known before loading it."""
+    spec = getattr(model, "spec", None) or {}
+    declared = spec.get("ram_mb")
+    if isinstance(declared, (int, float)):
+        return int(declared * MB)
+    path = getattr(model, "model_path", None)
+    try:
+        return int(path.stat().st_size * ram_factor) if path is not None else 0
+    except OSError:
+        return 0
+
+
+class ModelRegistry:
+    """Pro models by canonical name, built and loaded on first use.
+
+    Loaded sessions are kept in LRU order. Before a load would exceed
+    ``budget_bytes``, the least recently used sessions that are neither
+    pinned nor running are unloaded. A budget of 0 disables eviction.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], str],
+        factory: Callable[[str], Any],
+        default: str,
+        allowed: Optional[Set[str]] = None,
+        budget_bytes: int = 0,
+        ram_factor: float = DEFAULT_RAM_FACTOR,
+        pinned: Optional[Set[str]] = None,
+    ) -> None:
+        self._resolve = resolve
+        self._factory = factory
+        self.default = default
+        self.allowed = allowed
+        self.budget_bytes = max(0, budget_bytes)
+        self.ram_factor = ram_factor
+        self.pinned = set(pinned or ())
+
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._models: Dict[str, Any] = {}
+        self._resident: "OrderedDict[str, int]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._stats: Dict[str, ModelStats] = {}
+
+    def resolve(self, name: Optional[str]) -> str:
+        """Canonical name for a request; None or "" selects the default."""
+        if not name:
+            return self.default
+        try:
+            canonical = self._resolve(name)
+        except Exception as exc:  # noqa: BLE001
+            raise UnknownModelError(f"Modele inconnu: {name}") from exc
+        if canonical != self.default and self.allowed is not None and canonical not in self.allowed:
+            raise UnknownModelError(f"Modele non disponible: {name}")
+        return canonical
+
+    def model(self, name: Optional[str] = None) -> Any:
+        """The model object for ``name``; its session may not be loaded yet."""
+        canonical = self.resolve(name)
+        with self._lock:
+            model = self._models.get(canonical)
+            if model is None:
+                model = self._factory(canonical)
+                self._models[canonical] = model
+                self._stats[canonical] = ModelStats()
+                self._load_locks[canonical] = threading.Lock()
+            return model
+
+    def register(self, name: str, model: Any) -> None:
+        """Add an already built model, e.g. the default one."""
+        with self._lock:
+            self._models[name] = model
+            self._stats.setdefault(name, ModelStats())
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def load(self, name: Optional[str] = None) -> Any:
+        """Load ``name``'s session if needed, evicting others to fit the budget."""
+        canonical = self.resolve(name)
+        model = self.model(canonical)
+        with self._lock:
+            if canonical in self._resident:
+                self._resident.move_to_end(canonical)
+                return model
+            load_lock = self._load_locks[canonical]
+        with load_lock:
+            with self._lock:
+                if canonical in self._resident:
+                    return model
+                needed = estimate_model_bytes(model, self.ram_factor)
+                self._evict_for(needed, keep=canonical)
+            start = time.perf_counter()
+            model.ensure_loaded()
+            load_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                stats = self._stats[canonical]
+                stats.loads += 1
+                stats.load_ms = round(load_ms, 1)
+                stats.size_bytes = needed
+                self._resident[canonical] = needed
+            LOGGER.info(
+                "Modele %s charge (%.0f ms, ~%.0f MB)",
+                canonical,
+                load_ms,
+                needed / MB,
+                extra={"model": canonical, "event": "load", "load_ms": round(load_ms, 1)},
+            )
+        return model
+
+    @contextmanager
+    def use(self, name: Optional[str] = None) -> Iterator[Any]:
+        """Loaded model for one request; it cannot be evicted meanwhile."""
+        canonical = self.resolve(name)
+        self.model(canonical)
+        with self._lock:
+            self._in_use[canonical] = self._in_use.get(canonical, 0) + 1
+            self._stats[canonical].requests += 1
+        try:
+            yield self.load(canonical)
+        finally:
+            with self._lock:
+                self._in_use[canonical] -= 1
+
+    def is_resident(self, name: Optional[str] = None) -> bool:
+        with self._lock:
+            return self.resolve(name) in self._resident
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._resident.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "default": self.default,
+                "budget_mb": round(self.budget_bytes / MB, 1),
+                "resident_mb": round(sum(self._resident.values()) / MB, 1),
+                "resident": list(self._resident),
+                "models": {
+                    name: {
+                        "resident": name in self._resident,
+                        "in_use": self._in_use.get(name, 0),
+                        "requests": stats.requests,
+                        "loads": stats.loads,
+                        "evictions": stats.evictions,
+                        "load_ms": stats.load_ms,
+                        "size_mb": round(stats.size_bytes / MB, 1),
+                    }
+                    for name, stats in self._stats.items()
+                },
+            }
+
+    def _evict_for(self, needed: int, keep: str) -> None:
+        # Called with self._lock held.
+        if not self.budget_bytes:
+            return
+        total = sum(self._resident.values())
+        for name in list(self._resident):
+            if total + needed <= self.budget_bytes:
+                return
+            if name == keep or name in self.pinned or self._in_use.get(name, 0):
+                continue
+            size = self._resident.pop(name)
+            total -= size
+            self._models[name].unload()
+            self._stats[name].evictions += 1
+            LOGGER.info(
+                "Modele %s decharge (LRU, ~%.0f MB liberes)",
+                name,
+                size / MB,
+                extra={"model": name, "event": "evict"},
+            )
+        if total + needed > self.budget_bytes:
+            LOGGER.warning(
+                "Budget memoire des modeles depasse (%.0f MB > %.0f MB): modeles en cours d'utilisation.",
+                (total + needed) / MB,
+                self.budget_bytes / MB,
+            )
+
+
+__all__ = [
+    "DEFAULT_RAM_FACTOR",
+    "ModelRegistry",
+    "ModelStats",
+    "UnknownModelError",
+    "estimate_model_bytes",
+]
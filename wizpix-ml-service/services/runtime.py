@@ -0,0 +1,150 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+import onnxruntime as ort
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+T = TypeVar("T")
+
+
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_count(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name) or default))
+    except ValueError:
+        return default
+
+
+def _default_intra_op_threads() -> int:
+    # Split the cores between the session.run calls that can overlap instead
+    # of letting each of them spin up one ORT thread per core. In a thread
+    # pool, MaskBatcher merges the workers' inputs and one leader runs each
+    # batch: about WORKER_POOL_SIZE / BATCH_MAX_SIZE batches run at once. A
+    # process pool runs one session per worker.
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    processes = _env_count("WEB_CONCURRENCY", 1)
+    workers = _env_count("WORKER_POOL_SIZE", cpus)
+    if os.getenv("WORKER_POOL_KIND", "thread").strip().lower() != "process":
+        batch_size = _env_count("BATCH_MAX_SIZE", 4)
+        workers = -(-workers // batch_size)
+    return max(1, cpus // (processes * workers))
+
+
+@dataclass(frozen=True)
+class SessionTuning:
+    """ONNX Runtime session settings for one model.
+
+    Resolution order for each field: ``<MODEL>_ORT_<FIELD>`` env var,
+    ``ORT_<FIELD>`` env var, the ``session`` entry of the model spec, default.
+    """
+
+    intra_op_threads: int = 0
+    inter_op_threads: int = 1
+    graph_optimization: str = "all"
+    execution_mode: str = "sequential"
+    cpu_mem_arena: bool = True
+    persist_optimized: bool = True
+
+    @classmethod
+    def resolve(cls, model_name: str, spec: Dict[str, object]) -> "SessionTuning":
+        raw_spec = spec.get("session")
+        base: Dict[str, object] = raw_spec if isinstance(raw_spec, dict) else {}
+        prefix = model_name.replace("-", "_").upper()
+
+        def pick(field: str, parse: Callable[[str], T], default: T) -> T:
+            for env_name in (f"{prefix}_ORT_{field.upper()}", f"ORT_{field.upper()}"):
+                value = os.getenv(env_name)
+                if value is not None and value.strip():
+                    return parse(value.strip())
+            if field in base:
+                return base[field]  # type: ignore[return-value]
+            return default
+
+        tuning = cls(
+            intra_op_threads=pick("intra_op_threads", int, _default_intra_op_threads()),
+            inter_op_threads=pick("inter_op_threads", int, cls.inter_op_threads),
+            graph_optimization=pick("graph_optimization", str.lower, cls.graph_optimization),
+            execution_mode=pick("execution_mode", str.lower, cls.execution_mode),
+            cpu_mem_arena=pick("cpu_mem_arena", _parse_bool, cls.cpu_mem_arena),
+            persist_optimized=pick("persist_optimized", _parse_bool, cls.persist_optimized),
+        )
+        if tuning.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"ORT_GRAPH_OPTIMIZATION invalide pour {model_name}: {tuning.graph_optimization}"
+            )
+        if tuning.execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"ORT_EXECUTION_MODE invalide pour {model_name}: {tuning.execution_mode}"
+            )
+        return tuning
+
+    @property
+    def persisted_level(self) -> str:
+        """Optimisation level of the persisted graph.
+
+        "all" adds layout transforms specific to the CPU that ran them; the
+        file keeps the portable "extended" graph and they run at load time.
+        """
+        return "extended" if self.graph_optimization == "all" else self.graph_optimization
+
+    def build_options(
+        self, optimize: bool = True, level: Optional[str] = None
+    ) -> ort.SessionOptions:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(0, self.intra_op_threads)
+        options.inter_op_num_threads = max(0, self.inter_op_threads)
+        options.execution_mode = EXECUTION_MODES[self.execution_mode]
+        options.enable_cpu_mem_arena = self.cpu_mem_arena
+        options.graph_optimization_level = (
+            GRAPH_OPTIMIZATION_LEVELS[level or self.graph_optimization]
+            if optimize
+            else ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        )
+        return options
+
+    def optimized_path(
+        self, model_path: Path, provider: str = "CPUExecutionProvider"
+    ) -> Optional[Path]:
+        """Where the optimised graph of ``model_path`` is persisted, if enabled.
+
+        The name carries the ORT version and the provider: a graph optimised
+        by another build or for another device is never reused.
+        """
+        if not self.persist_optimized or self.graph_optimization == "disable":
+            return None
+        device = provider.replace("ExecutionProvider", "").lower() or "cpu"
+        return model_path.with_name(
+            f"{model_path.stem}.opt-{self.persisted_level}.ort{ort.__version__}.{device}"
+            f"{model_path.suffix}"
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "graph_optimization": self.graph_optimization,
+            "execution_mode": self.execution_mode,
+            "cpu_mem_arena": self.cpu_mem_arena,
+            "persist_optimized": self.persist_optimized,
+        }
+
+
+__all__ = ["SessionTuning", "GRAPH_OPTIMIZATION_LEVELS", "EXECUTION_MODES"]
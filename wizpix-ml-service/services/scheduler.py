@@ -0,0 +1,453 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from .settings import env_float, env_int
+
+LOGGER = logging.getLogger(__name__)
+
+SUPPORTED_POOL_KINDS = {"thread", "process"}
+
+# Highest priority first. A lane only reaches this share of the waiting
+# slots, so low-priority bursts always leave room for the lanes above.
+LANES = ("high", "normal", "low")
+DEFAULT_LANE = "normal"
+LANE_QUEUE_SHARE = {"high": 1.0, "normal": 0.85, "low": 0.6}
+DEFAULT_PLAN_LANES = "pro=high,business=high,hobby=normal,free=low"
+
+# Weight of the latest run in the per-tag run time estimates.
+RUN_EWMA_ALPHA = 0.2
+
+
+def available_cpus() -> int:
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+def parse_plan_lanes(spec: str) -> Dict[str, str]:
+    """``"pro=high,free=low"`` -> ``{"pro": "high", "free": "low"}``."""
+    mapping: Dict[str, str] = {}
+    for part in spec.split(","):
+        plan, _, lane = part.partition("=")
+        plan, lane = plan.strip().lower(), lane.strip().lower()
+        if plan and lane in LANES:
+            mapping[plan] = lane
+    return mapping
+
+
+PLAN_LANES = parse_plan_lanes(os.getenv("PLAN_LANES", DEFAULT_PLAN_LANES))
+
+
+def lane_for(plan: Optional[str] = None, priority: Optional[str] = None) -> str:
+    """Lane of a request from an explicit priority or a subscription plan name."""
+    if priority and priority.strip().lower() in LANES:
+        return priority.strip().lower()
+    if plan:
+        return PLAN_LANES.get(plan.strip().lower(), DEFAULT_LANE)
+    return DEFAULT_LANE
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the inference queue is saturated and the request is refused."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Job:
+    method: str
+    args: tuple
+    kwargs: Dict[str, Any]
+    future: Future
+    lane: str = DEFAULT_LANE
+    tag: str = ""
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class _LaneStats:
+    submitted: int = 0
+    rejected: int = 0
+    started: int = 0
+    wait_total_ms: float = 0.0
+    wait_max_ms: float = 0.0
+    wait_last_ms: float = 0.0
+
+    def record_wait(self, wait_ms: float) -> None:
+        self.started += 1
+        self.wait_last_ms = wait_ms
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def wait_snapshot(self) -> Dict[str, float]:
+        return {
+            "last": round(self.wait_last_ms, 2),
+            "avg": round(self.wait_total_ms / self.started, 2) if self.started else 0.0,
+            "max": round(self.wait_max_ms, 2),
+        }
+
+
+_WORKER_PIPELINE: Any = None
+_WORKER_REPORTS: Any = None
+
+
+def _init_process_worker(reports: Any = None) -> None:
+    global _WORKER_PIPELINE, _WORKER_REPORTS
+    from . import pipeline as pipeline_module
+
+    _WORKER_REPORTS = reports
+    _WORKER_PIPELINE = pipeline_module.pipeline
+    if _WORKER_PIPELINE is None:
+        _WORKER_PIPELINE = pipeline_module.BackgroundRemovalPipeline()
+    _report_status()
+    _WORKER_PIPELINE.start_warmup(blocking=True)
+    _report_status()
+
+
+def _report_status() -> None:
+    """Send this worker's pipeline state to the parent (health, readiness, metrics)."""
+    if _WORKER_REPORTS is None or _WORKER_PIPELINE is None:
+        return
+    try:
+        _WORKER_REPORTS.put((os.getpid(), _WORKER_PIPELINE.status_snapshot()))
+    except Exception:  # noqa: BLE001
+        LOGGER.warning("Etat du worker non transmis", exc_info=True)
+
+
+def _invoke_in_process(method: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+    try:
+        return getattr(_WORKER_PIPELINE, method)(*args, **kwargs)
+    finally:
+        _report_status()
+
+
+class InferenceScheduler:
+    """Runs pipeline calls on a bounded worker pool, off the asyncio event loop.
+
+    Jobs wait in one FIFO per priority lane, ``max_queue`` entries in total,
+    in front of ``workers`` dispatcher threads. Dispatchers serve the highest
+    non-empty lane, unless a lower lane's oldest job has waited more than
+    ``starvation_ms``. In ``process`` mode each dispatcher forwards its job to
+    a process pool where every worker owns its own pipeline instance; the
+    workers report their pipeline state back (see ``worker_snapshots``).
+    """
+
+    def __init__(
+        self,
+        pipeline: Any,
+        kind: str = "thread",
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        retry_after: int = 2,
+        starvation_ms: float = 5000.0,
+    ) -> None:
+        kind = (kind or "thread").lower()
+        if kind not in SUPPORTED_POOL_KINDS:
+            raise ValueError(
+                f"Type de pool inconnu: {kind} (options: thread, process)"
+            )
+        self.pipeline = pipeline
+        self.kind = kind
+        self.workers = max(1, workers or available_cpus())
+        self.max_queue = max(0, self.workers * 4 if max_queue is None else max_queue)
+        self.retry_after = max(1, retry_after)
+        self.starvation_ms = max(0.0, starvation_ms)
+
+        self._lanes: Dict[str, Deque[_Job]] = {lane: deque() for lane in LANES}
+        self._lane_stats: Dict[str, _LaneStats] = {lane: _LaneStats() for lane in LANES}
+        self._run_ewma_ms: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._reports: Any = None
+        self._worker_status: Dict[int, dict] = {}
+        self._closed = False
+
+        self._in_flight = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._wait_last_ms = 0.0
+        # Completed model runs only (no failures, no cache hits), as for the EWMA.
+        self._model_runs = 0
+        self._run_total_ms = 0.0
+
+    @classmethod
+    def from_env(cls, pipeline: Any) -> "InferenceScheduler":
+        return cls(
+            pipeline,
+            kind=os.getenv("WORKER_POOL_KIND", "thread"),
+            workers=env_int("WORKER_POOL_SIZE", None),
+            max_queue=env_int("WORKER_QUEUE_SIZE", None),
+            retry_after=int(env_float("QUEUE_RETRY_AFTER", 2)),
+            starvation_ms=env_float("LANE_STARVATION_MS", 5000.0),
+        )
+
+    def submit(
+        self,
+        method: str,
+        *args: Any,
+        lane: str = DEFAULT_LANE,
+        tag: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Future:
+        """Queue ``pipeline.<method>(*args, **kwargs)`` and return its future.
+
+        ``tag`` names the kind of work for the run time estimates
+        (defaults to ``method``).
+        """
+        lane = lane if lane in self._lanes else DEFAULT_LANE
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler arrete.")
+            if self._queued() + self._in_flight >= self._capacity(lane):
+                self._rejected += 1
+                self._lane_stats[lane].rejected += 1
+                raise QueueFullError(
+                    "Service sature, reessayez plus tard.",
+                    retry_after=self._estimate_retry_after(),
+                )
+            self._ensure_started()
+            self._lanes[lane].append(_Job(method, args, kwargs, future, lane, tag or method))
+            self._submitted += 1
+            self._lane_stats[lane].submitted += 1
+            self._cond.notify()
+        return future
+
+    async def run(
+        self,
+        method: str,
+        *args: Any,
+        lane: str = DEFAULT_LANE,
+        tag: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Any:
+        future = self.submit(method, *args, lane=lane, tag=tag, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def start(self) -> None:
+        """Start the pool now; in ``process`` mode every worker loads its models."""
+        with self._cond:
+            if not self._closed:
+                self._ensure_started()
+
+    def worker_snapshots(self) -> List[dict]:
+        """Latest pipeline state reported by each process worker (by pid).
+
+        Empty in ``thread`` mode: the pipeline of this process is the one used.
+        """
+        with self._cond:
+            while self._reports is not None:
+                try:
+                    pid, snapshot = self._reports.get_nowait()
+                except (queue.Empty, OSError, ValueError):
+                    break
+                self._worker_status[pid] = snapshot
+            items = sorted(self._worker_status.items())
+        return [dict(snapshot, pid=pid) for pid, snapshot in items]
+
+    def estimate_ms(self, lane: str, tag: str) -> Optional[float]:
+        """Expected time until a new ``tag`` job in ``lane`` completes.
+
+        None until a ``tag`` job has run once. Jobs already running and jobs
+        waiting in the same or higher lanes are served first.
+        """
+        with self._cond:
+            run_ms = self._run_ewma_ms.get(tag)
+            if run_ms is None:
+                return None
+            runs = self._model_runs
+            avg_run_ms = self._run_total_ms / runs if runs else run_ms
+            rank = LANES.index(lane) if lane in LANES else LANES.index(DEFAULT_LANE)
+            ahead = self._in_flight + sum(len(self._lanes[name]) for name in LANES[: rank + 1])
+            # Nothing waits while a worker is idle.
+            waves = max(0, ahead - self.workers + 1) / self.workers
+            return waves * avg_run_ms + run_ms
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            started = self._completed + self._failed + self._in_flight
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "queue_depth": self._queued(),
+                "queue_capacity": self.max_queue,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_ms": {
+                    "last": round(self._wait_last_ms, 2),
+                    "avg": round(self._wait_total_ms / started, 2) if started else 0.0,
+                    "max": round(self._wait_max_ms, 2),
+                },
+                "lanes": {
+                    lane: {
+                        "queue_depth": len(self._lanes[lane]),
+                        "capacity": self._capacity(lane),
+                        "submitted": stats.submitted,
+                        "rejected": stats.rejected,
+                        "wait_ms": stats.wait_snapshot(),
+                    }
+                    for lane, stats in self._lane_stats.items()
+                },
+                "run_ms": {tag: round(value, 2) for tag, value in self._run_ewma_ms.items()},
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._closed = True
+            pending = [job for lane in self._lanes.values() for job in lane]
+            for lane in self._lanes.values():
+                lane.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.future.cancel()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _queued(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def _capacity(self, lane: str) -> int:
+        return self.workers + math.ceil(self.max_queue * LANE_QUEUE_SHARE[lane])
+
+    def _next_job(self) -> _Job:
+        now = time.perf_counter()
+        starving = [
+            queue[0]
+            for queue in self._lanes.values()
+            if queue and (now - queue[0].enqueued_at) * 1000 >= self.starvation_ms
+        ]
+        if starving:
+            job = min(starving, key=lambda candidate: candidate.enqueued_at)
+            return self._lanes[job.lane].popleft()
+        for lane in LANES:
+            if self._lanes[lane]:
+                return self._lanes[lane].popleft()
+        raise IndexError("file vide")
+
+    def _estimate_retry_after(self) -> int:
+        if not self._model_runs:
+            return self.retry_after
+        avg_run_s = self._run_total_ms / self._model_runs / 1000.0
+        backlog = self._queued() + self._in_flight
+        estimate = int(avg_run_s * backlog / self.workers + 0.999)
+        return max(self.retry_after, estimate)
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        if self.kind == "process":
+            context = multiprocessing.get_context("spawn")
+            self._reports = context.Queue()
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_process_worker,
+                initargs=(self._reports,),
+            )
+            # Workers are spawned on demand: one call each starts (and warms) them all.
+            for _ in range(self.workers):
+                self._process_pool.submit(_report_status)
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"wizpix-worker-{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        LOGGER.info(
+            "Pool d'inference demarre (%s, %d workers, file %d)",
+            self.kind,
+            self.workers,
+            self.max_queue,
+        )
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queued() and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                job = self._next_job()
+                wait_ms = (time.perf_counter() - job.enqueued_at) * 1000
+                self._in_flight += 1
+                self._lane_stats[job.lane].record_wait(wait_ms)
+                self._wait_last_ms = wait_ms
+                self._wait_total_ms += wait_ms
+                self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+
+            if not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._in_flight -= 1
+                continue
+
+            start = time.perf_counter()
+            error: Optional[BaseException] = None
+            result: Any = None
+            try:
+                result = self._execute(job)
+            except BaseException as exc:  # noqa: BLE001
+                error = exc
+            run_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self._in_flight -= 1
+                if error is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                # A failure or a result cache hit says nothing about the cost of the work.
+                if error is None and getattr(result, "cache_status", None) != "hit":
+                    self._model_runs += 1
+                    self._run_total_ms += run_ms
+                    previous = self._run_ewma_ms.get(job.tag)
+                    self._run_ewma_ms[job.tag] = (
+                        run_ms
+                        if previous is None
+                        else previous + RUN_EWMA_ALPHA * (run_ms - previous)
+                    )
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def _execute(self, job: _Job) -> Any:
+        if self._process_pool is not None:
+            return self._process_pool.submit(
+                _invoke_in_process, job.method, job.args, job.kwargs
+            ).result()
+        return getattr(self.pipeline, job.method)(*job.args, **job.kwargs)
+
+
+__all__ = [
+    "DEFAULT_LANE",
+    "InferenceScheduler",
+    "LANES",
+    "QueueFullError",
+    "lane_for",
+    "parse_plan_lanes",
+]
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Optional
 
 DEFAULT_MODEL_DIR = Path(__file__).resolve().parent.parent / "models"
 MODEL_DIR = Path(
@@ -10,4 +11,44 @@ MODEL_DIR = Path(
 
 MODEL_DIR.mkdir(parents=True, exist_ok=True)
 
-__all__ = ["MODEL_DIR", "DEFAULT_MODEL_DIR"]
+# Sibling of MODEL_DIR; only created by the components that write to it.
+CACHE_DIR = Path(os.getenv("CACHE_DIR") or MODEL_DIR.parent / "cache")
+JOBS_DIR = Path(os.getenv("JOBS_DIR") or MODEL_DIR.parent / "jobs")
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+__all__ = [
+    "MODEL_DIR",
+    "DEFAULT_MODEL_DIR",
+    "CACHE_DIR",
+    "JOBS_DIR",
+    "env_bool",
+    "env_int",
+    "env_float",
+]
@@ -0,0 +1,124 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .settings import env_float, env_int
+
+TILE_MODES = {"off", "auto", "always"}
+
+
+def _tile_offsets(length: int, tile: int, stride: float) -> List[int]:
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - tile) / stride) + 1
+    step = (length - tile) / (count - 1)
+    return [round(index * step) for index in range(count)]
+
+
+@dataclass(frozen=True)
+class TileGrid:
+    """Square model-sized tiles over the image resized by ``scale``."""
+
+    scale: float
+    work_size: Tuple[int, int]
+    tile: int
+    xs: Tuple[int, ...]
+    ys: Tuple[int, ...]
+
+    @property
+    def count(self) -> int:
+        return len(self.xs) * len(self.ys)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        # Row-major order: neighbouring tiles are processed together.
+        for y in self.ys:
+            for x in self.xs:
+                yield x, y
+
+
+def feather_weights(tile: int, ramp: int) -> np.ndarray:
+    """``tile x tile`` weights rising linearly over ``ramp`` px at each border."""
+    position = np.arange(tile, dtype=np.float32) + 0.5
+    ramp = max(1, ramp)
+    profile = np.minimum(1.0, np.minimum(position, tile - position) / ramp)
+    profile = np.maximum(profile, 1e-3)
+    return np.outer(profile, profile)
+
+
+@dataclass(frozen=True)
+class TilePolicy:
+    """Decides when to replace the single squashing resize by tiles.
+
+    ``auto`` tiles images whose aspect ratio reaches ``min_aspect`` (a single
+    resize would distort them) or whose short side is at least
+    ``min_detail`` model sides (a single resize would lose detail).
+    ``always`` tiles anything larger than one tile. The image is scaled so
+    the short side is at least one tile, as close to native resolution as
+    ``max_tiles`` allows; if even that needs too many tiles, tiling is
+    skipped.
+    """
+
+    mode: str = "off"
+    max_tiles: int = 8
+    overlap: float = 0.25
+    min_aspect: float = 1.5
+    min_detail: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "TilePolicy":
+        mode = os.getenv("TILE_MODE", "off").strip().lower()
+        return cls(
+            mode=mode if mode in TILE_MODES else "off",
+            max_tiles=max(1, env_int("TILE_MAX_COUNT", 8) or 1),
+            overlap=min(0.9, max(0.0, env_float("TILE_OVERLAP", 0.25))),
+            min_aspect=env_float("TILE_MIN_ASPECT", 1.5),
+            min_detail=env_float("TILE_MIN_DETAIL", 2.0),
+        )
+
+    def grid(self, size: Tuple[int, int], tile: int, scale: float) -> TileGrid:
+        width = max(tile, round(size[0] * scale))
+        height = max(tile, round(size[1] * scale))
+        stride = tile * (1.0 - self.overlap)
+        return TileGrid(
+            scale=scale,
+            work_size=(width, height),
+            tile=tile,
+            xs=tuple(_tile_offsets(width, tile, stride)),
+            ys=tuple(_tile_offsets(height, tile, stride)),
+        )
+
+    def wants_tiles(self, size: Tuple[int, int], tile: int) -> bool:
+        if self.mode == "always":
+            return True
+        if self.mode != "auto":
+            return False
+        short, long = sorted(size)
+        return long / float(short) >= self.min_aspect or short >= self.min_detail * tile
+
+    def plan(self, size: Tuple[int, int], tile: int) -> Optional[TileGrid]:
+        """Tile grid for an image of ``size`` (w, h), or None for one resize."""
+        if min(size) <= 0 or not self.wants_tiles(size, tile):
+            return None
+        low = tile / float(min(size))
+        best = self.grid(size, tile, low)
+        if best.count > self.max_tiles:
+            return None
+        high = max(low, 1.0)
+        if self.grid(size, tile, high).count <= self.max_tiles:
+            best = self.grid(size, tile, high)
+        else:
+            # The tile count only grows with the scale: bisect the largest fit.
+            for _ in range(12):
+                middle = (low + high) / 2
+                candidate = self.grid(size, tile, middle)
+                if candidate.count <= self.max_tiles:
+                    low, best = middle, candidate
+                else:
+                    high = middle
+        return best if best.count > 1 else None
+
+
+__all__ = ["TILE_MODES", "TileGrid", "TilePolicy", "feather_weights"]
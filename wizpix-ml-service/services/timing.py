@@ -0,0 +1,49 @@
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class StageTimings:
+    """Wall-clock duration of each named stage of one request, in ms.
+
+    Stages keep their first-seen order; timing the same name twice adds up.
+    """
+
+    def __init__(self) -> None:
+        self._stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, duration_ms: float) -> None:
+        self._stages[name] = self._stages.get(name, 0.0) + duration_ms
+
+    def get(self, name: str) -> float:
+        return self._stages.get(name, 0.0)
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(value, 2) for name, value in self._stages.items()}
+
+
+def server_timing(stages: Dict[str, float], total_ms: Optional[float] = None) -> str:
+    """``Server-Timing`` header value, e.g. ``decode;dur=12.4, encode;dur=3.1``."""
+    entries = [
+        f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)};dur={value:.1f}" for name, value in stages.items()
+    ]
+    if total_ms is not None:
+        entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+__all__ = ["StageTimings", "server_timing"]
@@ -0,0 +1,188 @@
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from PIL import Image, UnidentifiedImageError
+
+from .decode import ImageHeader, ImageSource, read_header
+from .settings import env_float, env_int
+
+MB = 1024 * 1024
+
+# Formats accepted by the API, as reported by Pillow (MPO: JPEG from phones).
+ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP"}
+DEFAULT_PLAN_MEGAPIXELS = "free=16,hobby=25,pro=50,business=80"
+UPLOAD_CHUNK_BYTES = max(4096, env_int("UPLOAD_CHUNK_KB", 256) or 256) * 1024
+# Multipart boundaries, part headers and the other form fields.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Raised when an upload is rejected; ``status_code`` is the HTTP answer."""
+
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def too_large_message(max_bytes: int) -> str:
+    return f"Fichier trop volumineux ({max_bytes / MB:g} MB max)."
+
+
+def parse_plan_megapixels(spec: str) -> Dict[str, float]:
+    """``"free=16,pro=50"`` -> ``{"free": 16.0, "pro": 50.0}``."""
+    mapping: Dict[str, float] = {}
+    for part in spec.split(","):
+        plan, _, value = part.partition("=")
+        plan = plan.strip().lower()
+        try:
+            megapixels = float(value)
+        except ValueError:
+            continue
+        if plan and megapixels > 0:
+            mapping[plan] = megapixels
+    return mapping
+
+
+PLAN_MEGAPIXELS = parse_plan_megapixels(
+    os.getenv("PLAN_MAX_MEGAPIXELS", DEFAULT_PLAN_MEGAPIXELS)
+)
+
+
+def max_pixels_for(plan: Optional[str] = None) -> int:
+    """Pixel budget of a request; unknown or missing plans get MAX_IMAGE_MEGAPIXELS."""
+    megapixels = PLAN_MEGAPIXELS.get((plan or "").strip().lower())
+    if megapixels is None:
+        megapixels = env_float("MAX_IMAGE_MEGAPIXELS", 25.0)
+    return int(megapixels * 1_000_000)
+
+
+async def read_upload(upload, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_BYTES) -> bytes:
+    """Read ``upload`` chunk by chunk, stopping as soon as it exceeds ``max_bytes``."""
+    chunks: List[bytes] = []
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadError(too_large_message(max_bytes), status_code=413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def check_image(
+    source: ImageSource, max_pixels: int, formats: Set[str] = ALLOWED_FORMATS
+) -> ImageHeader:
+    """Validate format and pixel count from the image header, before any decode."""
+    try:
+        header = read_header(source)
+    except Image.DecompressionBombError as exc:
+        raise UploadError("Image trop grande.", status_code=413) from exc
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as exc:
+        raise UploadError("Image illisible ou corrompue.") from exc
+    if header.format not in formats:
+        raise UploadError(
+            f"Format non supporte (autorise: {', '.join(sorted(formats - {'MPO'}))}).",
+            status_code=415,
+        )
+    pixels = header.width * header.height
+    if pixels > max_pixels:
+        raise UploadError(
+            f"Image trop grande ({header.width}x{header.height}, "
+            f"{pixels / 1e6:.1f} MP > {max_pixels / 1e6:g} MP max).",
+            status_code=413,
+        )
+    return header
+
+
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware rejecting request bodies above a per-route byte limit.
+
+    ``limit_for(path)`` returns the limit or None. A larger Content-Length is
+    refused before anything is read; otherwise the body is counted as it
+    arrives and reading stops at the limit, so chunked uploads cannot get
+    spooled past it either.
+    """
+
+    def __init__(self, app, limit_for: Callable[[str], Optional[int]]) -> None:
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope: dict, receive: Receive, send: Send) -> None:
+        limit = self.limit_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope.get("headers") or []).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await _reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive() -> dict:
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: dict) -> None:
+            nonlocal started
+            if exceeded and not started:
+                # Whatever the app answered to the cut body, the client gets a 413.
+                started = True
+                await _reject(send)
+                return
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+async def _reject(send: Send) -> None:
+    body = json.dumps({"detail": "Requete trop volumineuse."}).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+__all__ = [
+    "ALLOWED_FORMATS",
+    "BodySizeLimitMiddleware",
+    "DEFAULT_PLAN_MEGAPIXELS",
+    "MULTIPART_OVERHEAD",
+    "PLAN_MEGAPIXELS",
+    "UPLOAD_CHUNK_BYTES",
+    "UploadError",
+    "check_image",
+    "max_pixels_for",
+    "parse_plan_megapixels",
+    "read_upload",
+    "too_large_message",
+]
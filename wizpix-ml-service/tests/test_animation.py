@@ -0,0 +1,161 @@
+import io
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.animation import (
+    AnimationError,
+    FrameSequence,
+    PLAY_ONCE,
+    KeyframeTracker,
+    render_animation,
+)
+from services.encoding import OutputSpec
+from services.pipeline import BackgroundRemovalPipeline, OnnxMaskModel, RemovalOptions
+
+
+def _frame(offset=0, flash=False):
+    rgb = np.full((120, 160, 3), 200 if flash else 30, dtype=np.uint8)
+    rgb[30:80, 20 + offset : 70 + offset] = 220
+    return rgb
+
+
+def _gif(frames, duration=60, **loop):
+    images = [Image.fromarray(rgb) for rgb in frames]
+    buffer = io.BytesIO()
+    images[0].save(
+        buffer,
+        format="GIF",
+        save_all=True,
+        append_images=images[1:],
+        duration=duration,
+        **(loop or {"loop": 0}),
+    )
+    return buffer.getvalue()
+
+
+def _bright_mask(rgb):
+    return (rgb[..., 0] > 128).astype(np.float32)
+
+
+def test_tracker_reuses_warps_and_refreshes_keyframes():
+    tracker = KeyframeTracker(threshold=2.0, max_reuse=3)
+
+    assert tracker.plan(_frame()) is None
+    assert tracker.plan(_frame()) == (0.0, 0.0)
+    dx, dy = tracker.plan(_frame(offset=6))
+    assert dx == pytest.approx(6, abs=1) and dy == pytest.approx(0, abs=1)
+    assert tracker.plan(_frame(flash=True)) is None
+    for _ in range(3):
+        assert tracker.plan(_frame(flash=True)) is not None
+    assert tracker.plan(_frame(flash=True)) is None
+
+
+@pytest.mark.parametrize("output", ["png", "webp", "webp-lossy"])
+def test_render_animation_batches_keyframes_and_follows_motion(output):
+    frames = [_frame(offset=2 * index) for index in range(10)]
+    frames[6] = _frame(offset=12, flash=True)
+    sequence = FrameSequence((_gif(frames),))
+    info = sequence.probe(max_frames=50)
+    calls = []
+
+    def predict(images):
+        calls.append(len(images))
+        return [_bright_mask(rgb) for rgb in images]
+
+    sink = io.BytesIO()
+    stats = render_animation(
+        sequence, info, sink, OutputSpec(output), predict, lambda rgb, mask: mask, window=5
+    )
+
+    assert (stats.frames, stats.keyframes) == (10, 3)
+    assert calls == [1, 2]
+    with Image.open(io.BytesIO(sink.getvalue())) as image:
+        assert image.format == ("PNG" if output == "png" else "WEBP")
+        assert image.n_frames == 10 and image.size == (160, 120)
+        image.seek(4)
+        alpha = np.asarray(image.convert("RGBA"))[..., 3]
+        assert image.info["duration"] == 60
+    # The subject moved 8 px since the keyframe; the warped mask follows it.
+    assert alpha[55, 29] > 200 and alpha[55, 25] < 50
+
+
+def test_frame_sequences_are_checked_before_processing():
+    still = io.BytesIO()
+    Image.fromarray(_frame()).save(still, format="PNG")
+    other = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(other, format="PNG")
+
+    with pytest.raises(AnimationError):
+        FrameSequence((still.getvalue(), other.getvalue())).probe(max_frames=10)
+    with pytest.raises(AnimationError):
+        FrameSequence((_gif([_frame(offset=i) for i in range(5)]),)).probe(max_frames=4)
+    info = FrameSequence((still.getvalue(),) * 3, frame_ms=40).probe(max_frames=10)
+    assert info.frame_count == 3 and info.size == (160, 120)
+
+
+@pytest.mark.parametrize("output", ["png", "webp"])
+def test_gif_without_loop_extension_plays_once(output):
+    frames = [_frame(offset=2 * index) for index in range(3)]
+    looping = FrameSequence((_gif(frames),)).probe(max_frames=10)
+    once = FrameSequence((_gif(frames, loop=None),))
+    info = once.probe(max_frames=10)
+    assert (looping.loop, info.loop) == (0, PLAY_ONCE)
+
+    sink = io.BytesIO()
+    render_animation(
+        once,
+        info,
+        sink,
+        OutputSpec(output),
+        lambda images: [_bright_mask(rgb) for rgb in images],
+        lambda rgb, mask: mask,
+    )
+    with Image.open(io.BytesIO(sink.getvalue())) as image:
+        assert image.info["loop"] == PLAY_ONCE
+
+
+def test_onnx_model_runs_frames_in_batches():
+    batches = []
+
+    def run(_outputs, feed):
+        tensor = next(iter(feed.values()))
+        batches.append(tensor.shape[0])
+        return [tensor[:, :1]]
+
+    model = OnnxMaskModel(
+        "frames",
+        {"filename": "missing.onnx", "size": (32, 32), "tiling": False},
+        device_request="cpu",
+        allow_download=False,
+    )
+    model.session = SimpleNamespace(get_inputs=lambda: [SimpleNamespace(name="input")], run=run)
+    model.batcher.max_batch_size = 4
+
+    masks = model.predict_masks([_frame(offset=index) for index in range(6)])
+
+    assert batches == [4, 2]
+    assert len(masks) == 6 and all(mask.shape == (120, 160) for mask in masks)
+
+
+def test_pipeline_writes_the_animation_to_a_temporary_file(monkeypatch, tmp_path):
+    monkeypatch.setenv("PRO_MODEL_NAME", "mock")
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+    pipeline = BackgroundRemovalPipeline()
+
+    result = pipeline.process_animation(
+        FrameSequence((_gif([_frame(offset=index) for index in range(4)]),)),
+        RemovalOptions(quality="pro", output="webp"),
+        directory=tmp_path,
+    )
+
+    assert result.path.parent == tmp_path and result.media_type == "image/webp"
+    assert (result.frames, result.keyframes) == (4, 1)
+    assert {"decode", "keyframes", "encode"} <= set(result.timings)
+    with Image.open(result.path) as image:
+        assert image.n_frames == 4
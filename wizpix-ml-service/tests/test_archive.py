@@ -0,0 +1,76 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.archive import (
+    ArchiveError,
+    ZipStreamWriter,
+    is_zip_upload,
+    output_name,
+    read_zip_items,
+)
+
+
+def _zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_zip_items_skip_metadata_and_flag_bad_entries():
+    data = _zip(
+        {
+            "shoots/a.jpg": b"a" * 10,
+            "notes.txt": b"hello",
+            "big.png": b"b" * 100,
+            "__MACOSX/._a.jpg": b"x",
+            ".DS_Store": b"x",
+        }
+    )
+    items = read_zip_items(data, max_files=10, max_file_bytes=50, max_total_bytes=1000)
+
+    assert [item.name for item in items] == ["shoots/a.jpg", "notes.txt", "big.png"]
+    assert items[0].data == b"a" * 10 and items[0].error is None
+    assert items[1].error and items[1].data is None
+    assert items[2].error and items[2].data is None
+
+
+def test_zip_limits_are_checked_before_inflating():
+    bomb = _zip({"a.png": b"\0" * 10_000, "b.png": b"\0" * 10_000})
+    with pytest.raises(ArchiveError):
+        read_zip_items(bomb, max_files=10, max_file_bytes=20_000, max_total_bytes=15_000)
+    with pytest.raises(ArchiveError):
+        read_zip_items(bomb, max_files=1, max_file_bytes=20_000, max_total_bytes=50_000)
+    with pytest.raises(ArchiveError):
+        read_zip_items(b"not a zip", 10, 10, 10)
+
+
+def test_stream_writer_produces_a_valid_zip_incrementally():
+    writer = ZipStreamWriter()
+    chunks = []
+    first = writer.add(output_name("photo 1.jpg", "png"), b"\x89PNG" + b"1" * 64)
+    chunks.append(writer.drain())
+    second = writer.add(output_name("photo 1.jpg", "png"), b"\x89PNG" + b"2" * 64)
+    chunks.append(writer.drain())
+    writer.add("manifest.json", json.dumps({"count": 2}).encode(), compress=True)
+    chunks.append(writer.close())
+
+    assert all(chunks)
+    assert (first, second) == ("photo-1-bg-removed.png", "photo-1-bg-removed-2.png")
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.read(second).endswith(b"2" * 64)
+    assert json.loads(archive.read("manifest.json")) == {"count": 2}
+
+
+def test_zip_upload_detection():
+    assert is_zip_upload("batch.ZIP", "application/octet-stream")
+    assert is_zip_upload(None, "application/zip")
+    assert not is_zip_upload("photo.jpg", "image/jpeg")
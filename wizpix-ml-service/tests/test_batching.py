@@ -0,0 +1,57 @@
+import os
+import threading
+
+import numpy as np
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.batching import MaskBatcher
+
+
+def _run_concurrently(batcher, count):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def _call(index):
+        with batcher.reserve():
+            barrier.wait()
+            tensor = np.full((1, 3, 4, 4), index, dtype=np.float32)
+            results[index] = batcher.run(tensor)
+
+    threads = [threading.Thread(target=_call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_batcher_groups_concurrent_inputs():
+    seen_sizes = []
+
+    def run_batch(inputs):
+        seen_sizes.append(inputs.shape[0])
+        return inputs[:, 0, :, :] * 2
+
+    batcher = MaskBatcher(run_batch, max_batch_size=4, max_wait_ms=500)
+    results = _run_concurrently(batcher, 4)
+
+    assert seen_sizes == [4]
+    for index, values in enumerate(results):
+        assert values.shape == (1, 4, 4)
+        assert np.all(values == index * 2)
+    assert batcher.snapshot()["histogram"] == {"4": 1}
+
+
+def test_batcher_falls_back_to_single_runs_for_static_models():
+    def run_batch(inputs):
+        if inputs.shape[0] != 1:
+            raise ValueError("static batch")
+        return inputs[:, 0, :, :]
+
+    batcher = MaskBatcher(run_batch, max_batch_size=3, max_wait_ms=500)
+    results = _run_concurrently(batcher, 3)
+
+    assert batcher.static is True
+    assert sorted(int(values[0, 0, 0]) for values in results) == [0, 1, 2]
+    assert batcher.snapshot()["histogram"] == {"1": 3}
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.cache import ByteLRU, DiskCache, ResultCache, content_key
+
+
+def test_content_key_depends_on_options():
+    assert content_key(b"img", "mock", "quality=pro") == content_key(b"img", "mock", "quality=pro")
+    assert content_key(b"img", "mock", "quality=pro") != content_key(b"img", "mock", "quality=fast")
+    assert content_key(b"img", "mock", "quality=pro") != content_key(b"img2", "mock", "quality=pro")
+
+
+def test_byte_lru_evicts_least_recently_used():
+    lru = ByteLRU(max_bytes=10)
+    lru.put("a", b"1234")
+    lru.put("b", b"1234")
+    assert lru.get("a") == b"1234"
+    lru.put("c", b"1234")
+
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1234"
+    assert lru.evictions == 1
+    assert lru.size_bytes == 8
+
+
+def test_result_cache_disk_tier_survives_memory_eviction(tmp_path):
+    k1, k2 = content_key(b"1"), content_key(b"2")
+    cache = ResultCache(max_bytes=4, disk_dir=tmp_path, disk_max_bytes=1024)
+    cache.put(k1, b"abcd")
+    cache.put(k2, b"efgh")
+
+    assert cache.get(k1) == b"abcd"
+    fresh = ResultCache(max_bytes=4, disk_dir=tmp_path, disk_max_bytes=1024)
+    assert fresh.get(k2) == b"efgh"
+    snapshot = cache.snapshot()
+    assert snapshot["hits"] == 1
+    assert snapshot["memory"]["evictions"] >= 1
+
+
+def test_disk_cache_only_accepts_hex_keys(tmp_path):
+    outside = tmp_path / "secret.bin"
+    outside.write_bytes(b"secret")
+    cache = DiskCache(tmp_path / "cache", max_bytes=1024)
+
+    assert cache.get("../../secret") is None
+    assert cache.get("ab/../../secret") is None
+    with pytest.raises(ValueError):
+        cache.put("../escape", b"data")
+    assert not (tmp_path / "escape.bin").exists()
+
+
+def test_disk_cache_cap_holds_across_processes(tmp_path):
+    # Two workers sharing the directory, each writing half of the entries.
+    caches = [DiskCache(tmp_path, max_bytes=1000) for _ in range(2)]
+    for index in range(40):
+        caches[index % 2].put(content_key(str(index).encode()), b"x" * 100)
+
+    on_disk = sum(path.stat().st_size for path in tmp_path.glob("*/*.bin"))
+    assert 900 <= on_disk <= 1000
+    assert caches[1].get(content_key(b"39")) == b"x" * 100
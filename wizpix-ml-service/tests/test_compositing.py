@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.compositing import BackgroundSpec, blend_over, parse_hex_color, render_background
+from services.masks import MaskStore
+
+
+def test_parse_hex_color():
+    assert parse_hex_color("#ff8000") == (255, 128, 0)
+    assert parse_hex_color("fff") == (255, 255, 255)
+    with pytest.raises(ValueError):
+        parse_hex_color("#12")
+
+
+def test_blend_over_uses_uint8_mask():
+    rgb = np.full((2, 2, 3), 200, dtype=np.uint8)
+    background = np.zeros((2, 2, 3), dtype=np.uint8)
+    alpha = np.array([[255, 0], [128, 255]], dtype=np.uint8)
+
+    blended = blend_over(rgb, alpha, background)
+
+    assert blended[0, 0].tolist() == [200, 200, 200]
+    assert blended[0, 1].tolist() == [0, 0, 0]
+    assert abs(int(blended[1, 0, 0]) - 100) <= 1
+
+
+def test_render_gradient_spans_both_colors():
+    rgb = np.zeros((10, 40, 3), dtype=np.uint8)
+    spec = BackgroundSpec(kind="gradient", color=(0, 0, 0), color_end=(255, 255, 255), angle=90)
+
+    gradient = render_background(spec, rgb)
+
+    assert gradient.shape == (10, 40, 3)
+    assert gradient[5, 0, 0] < 10
+    assert gradient[5, -1, 0] > 245
+
+
+def test_mask_store_round_trip():
+    store = MaskStore(max_bytes=1024 * 1024)
+    buffer = BytesIO()
+    Image.new("RGB", (4, 3)).save(buffer, format="PNG")
+    mask = np.linspace(0.0, 1.0, 12, dtype=np.float32).reshape(3, 4)
+
+    store.put("abc", buffer.getvalue(), mask)
+
+    decoded = store.get("abc").decode_mask()
+    assert decoded.shape == (3, 4)
+    assert decoded[0, 0] == 0 and decoded[-1, -1] == 255
+
+
+def test_mask_store_disk_tier_is_shared_between_processes(tmp_path):
+    buffer = BytesIO()
+    Image.new("RGB", (4, 3)).save(buffer, format="PNG")
+    mask = np.linspace(0.0, 1.0, 12, dtype=np.float32).reshape(3, 4)
+    writer = MaskStore(max_bytes=1024 * 1024, disk_dir=tmp_path, disk_max_bytes=1024 * 1024)
+    writer.put("a" * 64, buffer.getvalue(), mask, coarse=True)
+
+    # Another worker: nothing in memory, the disk tier answers.
+    reader = MaskStore(max_bytes=1024 * 1024, disk_dir=tmp_path, disk_max_bytes=1024 * 1024)
+    stored = reader.get("a" * 64)
+    assert stored.image_bytes == buffer.getvalue() and stored.coarse
+    assert (stored.width, stored.height) == (4, 3)
+    assert stored.decode_mask()[-1, -1] == 255
+    assert "b" * 64 not in reader
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.crop import CropBox, CropPolicy, subject_bbox
+
+
+def test_subject_bbox():
+    mask = np.zeros((20, 30), dtype=np.float32)
+    mask[5:9, 10:16] = 0.8
+    assert subject_bbox(mask, 0.5) == CropBox(10, 5, 16, 9)
+    assert subject_bbox(mask, 0.9) is None
+
+
+def test_plan_pads_and_scales_to_full_resolution():
+    thumb = np.zeros((100, 100), dtype=np.float32)
+    thumb[40:60, 30:50] = 1.0
+    policy = CropPolicy(padding=0.25)
+
+    assert policy.plan(thumb, (1000, 2000)) == CropBox(250, 700, 550, 1300)
+
+
+def test_plan_skips_subjects_filling_the_frame():
+    thumb = np.ones((50, 50), dtype=np.float32)
+    assert CropPolicy(max_area=0.6).plan(thumb, (500, 500)) is None
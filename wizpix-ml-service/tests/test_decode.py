@@ -0,0 +1,41 @@
+import mmap
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.decode import decode_rgb, read_header
+
+
+def _encode(width, height, fmt):
+    xs = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    arr = np.stack([xs + ys * 0, ys + xs * 0, (xs + ys) / 2], axis=-1).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(arr, mode="RGB").save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_jpeg_is_draft_decoded_but_covers_the_target():
+    data = _encode(1600, 1200, "JPEG")
+    header = read_header(data)
+    reduced = decode_rgb(data, draft_size=(256, 256))
+
+    assert (header.format, header.width, header.height) == ("JPEG", 1600, 1200)
+    assert reduced.shape == (300, 400, 3)
+    assert decode_rgb(data).shape == (1200, 1600, 3)
+
+
+def test_png_ignores_draft_and_mmap_matches_bytes(tmp_path):
+    data = _encode(120, 80, "PNG")
+    path = tmp_path / "image.png"
+    path.write_bytes(data)
+
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        from_mmap = decode_rgb(mapped, draft_size=(32, 32))
+        assert read_header(mapped).width == 120
+
+    np.testing.assert_array_equal(from_mmap, decode_rgb(data))
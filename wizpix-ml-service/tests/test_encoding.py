@@ -0,0 +1,65 @@
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services import encoding
+from services.encoding import OutputSpec, encode_cutout
+
+
+def _cutout():
+    rng = np.random.default_rng(3)
+    rgb = rng.integers(0, 256, (24, 40, 3), dtype=np.uint8)
+    alpha = np.zeros((24, 40), dtype=np.float32)
+    alpha[4:20, 6:30] = 1.0
+    alpha[10, 6:30] = 0.5
+    return rgb, alpha
+
+
+def _decode(data):
+    with Image.open(BytesIO(data)) as image:
+        return image.format, np.array(image)
+
+
+def test_lossless_formats_round_trip_at_every_effort():
+    rgb, alpha = _cutout()
+    expected_alpha = (alpha * 255).astype(np.uint8)
+    for name, fmt in (("png", "PNG"), ("webp", "WEBP")):
+        for effort in (0, 1, 9):
+            kind, rgba = _decode(encode_cutout(rgb, alpha, OutputSpec(name, effort)))
+            assert kind == fmt
+            np.testing.assert_array_equal(rgba[..., 3], expected_alpha)
+            visible = expected_alpha > 0
+            np.testing.assert_array_equal(rgba[..., :3][visible], rgb[visible])
+
+
+def test_lossy_webp_and_mask_outputs():
+    rgb, alpha = _cutout()
+    kind, rgba = _decode(encode_cutout(rgb, alpha, OutputSpec("webp-lossy", 4)))
+    assert kind == "WEBP" and rgba.shape == (24, 40, 4)
+
+    kind, mask = _decode(encode_cutout(rgb, alpha, OutputSpec("mask")))
+    assert kind == "PNG" and mask.shape == (24, 40)
+    np.testing.assert_array_equal(mask, (alpha * 255).astype(np.uint8))
+
+
+def test_output_spec_normalisation():
+    assert OutputSpec("WEBP", 42).normalized() == OutputSpec("webp", 9)
+    assert OutputSpec("tiff").normalized().format == "png"
+    assert OutputSpec("webp-lossy").media_type == "image/webp"
+
+
+def test_oversized_images_do_not_grow_the_kept_buffer(monkeypatch):
+    rgb, alpha = _cutout()
+    monkeypatch.setattr(encoding, "RETAINED_BUFFER_BYTES", 24 * 40 * 4 - 1)
+    monkeypatch.setattr(encoding, "_local", type(encoding._local)())
+
+    kind, rgba = _decode(encode_cutout(rgb, alpha, OutputSpec("png", 1)))
+
+    assert kind == "PNG" and rgba.shape == (24, 40, 4)
+    assert getattr(encoding._local, "rgba", None) is None
+    encode_cutout(rgb[:10], alpha[:10], OutputSpec("png", 1))
+    assert encoding._local.rgba.size == 10 * 40 * 4
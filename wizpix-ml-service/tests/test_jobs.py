@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.archive import BatchItem
+from services.jobs import JobNotFoundError, JobQueueFullError, JobRunner, JobStore
+
+
+def _items():
+    return [BatchItem("a.jpg", data=b"aaa"), BatchItem("b.gif", error="Format non supporte.")]
+
+
+def test_queued_and_interrupted_jobs_survive_a_restart(tmp_path):
+    store = JobStore(tmp_path)
+    first = store.submit(_items(), {"quality": "pro"}, "batch")
+    second = store.submit(_items(), {"quality": "fast"}, "batch")
+    assert store.claim().id == first.id
+    store.progress(first.id, done=1, failed=0)
+    store.close()
+
+    reopened = JobStore(tmp_path)
+    # The first process still holds the lease until it expires.
+    assert reopened.requeue_interrupted() == 0
+    assert reopened.requeue_interrupted(now=time.time() + store.lease_s + 1) == 1
+    job = reopened.get(first.id)
+    assert (job.status, job.done) == ("queued", 0)
+    assert job.options == {"quality": "pro"}
+
+    items = reopened.load_items(reopened.claim())
+    assert items[0].data == b"aaa" and items[1].error
+    assert reopened.claim().id == second.id
+    assert reopened.claim() is None
+
+
+def test_claims_are_atomic_and_live_leases_are_kept(tmp_path):
+    stores = [JobStore(tmp_path, lease_s=30) for _ in range(4)]
+    submitted = {stores[0].submit(_items(), {}, "batch").id for _ in range(20)}
+    claimed = []
+
+    def claim_all(store):
+        while True:
+            job = store.claim()
+            if job is None:
+                return
+            claimed.append((job.id, store.owner))
+
+    threads = [threading.Thread(target=claim_all, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(job_id for job_id, _ in claimed) == sorted(submitted)
+    # A sibling starting up leaves running jobs alone while their owner renews them.
+    assert JobStore(tmp_path).requeue_interrupted() == 0
+    renewed_until = time.time() + 30
+    assert stores[1].renew_leases() == sum(owner == stores[1].owner for _, owner in claimed)
+    assert stores[0].requeue_interrupted(now=renewed_until - 1) == 0
+    assert stores[0].requeue_interrupted(now=renewed_until + 1) == len(submitted)
+
+
+def test_finished_jobs_expire_and_are_collected(tmp_path):
+    store = JobStore(tmp_path, ttl_s=10)
+    store.submit(_items(), {}, "single")
+    job = store.claim()
+    store.result_path(job).write_bytes(b"result")
+    store.finish(job, "a-bg-removed.png", "image/png")
+
+    done = store.get(job.id)
+    assert done.status == "done" and done.result_name == "a-bg-removed.png"
+    assert not store.input_path(job, 0).exists()
+
+    assert store.collect_garbage(now=done.expires_at - 1) == 0
+    assert store.collect_garbage(now=done.expires_at + 1) == 1
+    assert not store.job_dir(job.id).exists()
+    with pytest.raises(JobNotFoundError):
+        store.get(job.id)
+
+
+def test_higher_lanes_are_claimed_first(tmp_path):
+    store = JobStore(tmp_path)
+    low = store.submit(_items(), {}, "batch", lane="low")
+    high = store.submit(_items(), {}, "batch", lane="high")
+    assert [store.claim().id, store.claim().id] == [high.id, low.id]
+    assert store.get(high.id).lane == "high"
+
+
+def test_queue_limit(tmp_path):
+    store = JobStore(tmp_path, max_queued=1)
+    store.submit(_items(), {}, "batch")
+    with pytest.raises(JobQueueFullError):
+        store.submit(_items(), {}, "batch")
+
+
+def test_runner_processes_jobs_and_records_failures(tmp_path):
+    store = JobStore(tmp_path)
+    good = store.submit(_items(), {"ok": True}, "single")
+    bad = store.submit(_items(), {"ok": False}, "single")
+
+    async def handler(job):
+        if not job.options["ok"]:
+            raise RuntimeError("boom")
+        store.result_path(job).write_bytes(b"png")
+        store.finish(job, "out.png", "image/png")
+
+    async def scenario():
+        runner = JobRunner(store, handler, concurrency=2, gc_interval_s=0.05)
+        runner.start()
+        for _ in range(100):
+            if store.count("queued") == 0 and store.count("running") == 0:
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(scenario())
+    assert store.get(good.id).status == "done"
+    failed = store.get(bad.id)
+    assert failed.status == "failed" and failed.error == "boom"
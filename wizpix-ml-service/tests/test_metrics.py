@@ -0,0 +1,36 @@
+import os
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.metrics import MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Stage time.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="ort")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE stage_seconds histogram" in lines
+    assert 'stage_seconds_bucket{stage="ort",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="ort",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="ort",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="ort"} 4' in lines
+    assert 'stage_seconds_sum{stage="ort"} 3.65' in lines
+    assert histogram.count(stage="ort") == 4
+
+
+def test_counters_gauges_and_label_escaping():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("route",))
+    counter.inc(route='/a"b')
+    counter.inc(2, route='/a"b')
+    gauge = registry.gauge("queue_depth", "Queue.")
+    gauge.set(3)
+    gauge.set(1)
+
+    text = registry.render()
+    assert 'requests_total{route="/a\\"b"} 3' in text
+    assert "queue_depth 1\n" in text
+    assert registry.counter("requests_total", "Requests.", ("route",)) is counter
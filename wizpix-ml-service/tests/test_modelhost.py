@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.batching import MaskBatcher
+from services.modelhost import ModelHost, ModelHostClient, ModelHostError
+from services.pipeline import OnnxMaskModel
+from services.profiling import ProfilingUnavailableError
+from services.registry import ModelRegistry
+
+
+class _DoublingModel:
+    """Returns twice the first input channel, like an NxHxW mask model."""
+
+    def __init__(self, max_batch_size=4):
+        self.session = None
+        self.status = SimpleNamespace(device="CPUExecutionProvider", load_ms={"total": 0.0})
+        self.batcher = MaskBatcher(self.run_batch, max_batch_size=max_batch_size)
+        self.batches = []
+
+    def ensure_loaded(self):
+        self.session = SimpleNamespace(
+            get_inputs=lambda: [SimpleNamespace(name="input", shape=["N", 3, 8, 8])]
+        )
+
+    def unload(self):
+        self.session = None
+
+    def run_batch(self, inputs):
+        self.batches.append(inputs.shape[0])
+        time.sleep(0.05)
+        if inputs.shape[1] == 1:
+            return np.repeat(inputs, 4, axis=1)  # larger than the input
+        return inputs[:, 0] * 2
+
+
+@pytest.fixture()
+def host(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_HOST_AUTHKEY", "test-secret")
+    model = _DoublingModel()
+
+    def factory(name):
+        if name != "echo":
+            raise ValueError(f"unknown model {name}")
+        return model
+
+    registry = ModelRegistry(resolve=lambda name: name, factory=factory, default="echo")
+    address = str(tmp_path / "host.sock")
+    server = ModelHost(registry, address)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ModelHostClient(address, timeout_s=5.0)
+    for _ in range(100):
+        try:
+            client.ping()
+            break
+        except ModelHostError:
+            time.sleep(0.02)
+    yield client, model
+    client.close()
+
+
+def test_clients_need_the_host_key(host, monkeypatch):
+    client, _model = host
+    other = ModelHostClient(client.address, timeout_s=5.0)
+    try:
+        monkeypatch.delenv("MODEL_HOST_AUTHKEY")
+        with pytest.raises(ModelHostError):
+            other.ping()
+        monkeypatch.setenv("MODEL_HOST_AUTHKEY", "guessed")
+        with pytest.raises(ModelHostError):
+            other.ping()
+    finally:
+        other.close()
+
+
+def test_tensors_round_trip_through_shared_memory(host):
+    client, _model = host
+    tensor = np.random.default_rng(0).random((2, 3, 8, 8), dtype=np.float32)
+
+    values = client.run("echo", tensor)
+
+    np.testing.assert_allclose(values, tensor[:, 0] * 2)
+    assert client.snapshot()["shared_mb"] == 1.0
+    # Outputs larger than the shared block come back through the socket.
+    wide = client.run("echo", np.ones((1, 1, 512, 512), dtype=np.float32))
+    assert wide.shape == (1, 4, 512, 512)
+
+
+def test_host_batches_single_images_from_several_clients(host):
+    client, model = host
+    ready = threading.Barrier(4)
+    results = {}
+
+    def send(index):
+        ready.wait()
+        tensor = np.full((1, 3, 8, 8), index, dtype=np.float32)
+        results[index] = client.run("echo", tensor)
+
+    threads = [threading.Thread(target=send, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert all(float(results[index][0, 0, 0]) == index * 2 for index in range(4))
+    assert sum(model.batches) == 4 and len(model.batches) < 4
+
+
+def test_worker_model_uses_a_remote_session(host, monkeypatch):
+    client, _model = host
+    model = OnnxMaskModel(
+        "echo",
+        {"filename": "missing.onnx", "size": (8, 8)},
+        device_request="cpu",
+        allow_download=False,
+        host=client,
+    )
+    model.ensure_loaded()
+
+    mask = model.predict_mask(np.full((16, 16, 3), 200, dtype=np.uint8))
+
+    assert model.status.ready and model.status.device == "model-host:CPUExecutionProvider"
+    assert not model.batcher.enabled
+    assert mask.shape == (16, 16)
+    with pytest.raises(ModelHostError):
+        client.load("missing")
+    # Sessions live in the host: no local session to profile.
+    with pytest.raises(ProfilingUnavailableError):
+        model.profiled_copy("/tmp/never-written")
@@ -1,12 +1,20 @@
 import os
+import threading
 from io import BytesIO
+from types import SimpleNamespace
 
 import numpy as np
 from PIL import Image
 
 os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
 
-from services.pipeline import BackgroundRemovalPipeline
+from services.pipeline import (
+    BackgroundRemovalPipeline,
+    OnnxMaskModel,
+    RemovalOptions,
+    resolve_spec,
+)
+from services.timing import StageTimings
 
 
 def _solid_image_bytes(color=(128, 64, 32), size=(16, 16)) -> bytes:
@@ -16,42 +24,215 @@ def _solid_image_bytes(color=(128, 64, 32), size=(16, 16)) -> bytes:
     return buffer.getvalue()
 
 
-def _coarse_rgba_bytes(size=(16, 16)) -> bytes:
-    arr = np.zeros((size[1], size[0], 4), dtype=np.uint8)
-    arr[..., :3] = 255
-    arr[3:-3, 3:-3, 3] = 255
-    image = Image.fromarray(arr, mode="RGBA")
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    return buffer.getvalue()
+def test_remove_background_pro_returns_png_rgba(monkeypatch):
+    os.environ["PRO_MODEL_NAME"] = "mock"
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
 
+    pipeline = BackgroundRemovalPipeline()
 
-def test_remove_background_pro_returns_png_rgba(monkeypatch):
+    result, used_fallback = pipeline.remove_background(
+        _solid_image_bytes(),
+        quality="pro",
+    )
+
+    assert used_fallback is False
+    with Image.open(BytesIO(result)) as img:
+        assert img.mode == "RGBA"
+        assert img.size == (16, 16)
+
+
+def test_remove_background_serves_repeated_uploads_from_cache(monkeypatch):
     os.environ["PRO_MODEL_NAME"] = "mock"
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
 
+    pipeline = BackgroundRemovalPipeline()
+    calls = []
+    original = pipeline._remove_pro
     monkeypatch.setattr(
-        "services.pipeline.new_session",
-        lambda *_args, **_kwargs: object(),
+        pipeline,
+        "_remove_pro",
+        lambda data, *args: calls.append(data) or original(data, *args),
     )
+
+    first = pipeline.process(_solid_image_bytes(), RemovalOptions(quality="pro"))
+    second = pipeline.process(_solid_image_bytes(), RemovalOptions(quality="pro"))
+
+    assert len(calls) == 1
+    assert first.cache_status == "miss"
+    assert second.cache_status == "hit"
+    assert second.etag == first.etag
+    assert second.data == first.data
+
+
+def test_two_pass_crop_runs_the_pro_model_on_the_subject_only(monkeypatch):
+    os.environ["PRO_MODEL_NAME"] = "mock"
+    monkeypatch.setenv("CROP_LOCALIZER", "pro")
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+
+    pipeline = BackgroundRemovalPipeline()
+    seen = []
+    original = pipeline.pro_model.predict_mask
     monkeypatch.setattr(
-        "services.pipeline.rembg_remove",
-        lambda data, session=None: data,
+        pipeline.pro_model,
+        "predict_mask",
+        lambda image, output_size=None, timings=None: seen.append(image.shape[:2])
+        or original(image, output_size),
     )
 
-    pipeline = BackgroundRemovalPipeline()
+    result = pipeline.process(
+        _solid_image_bytes(size=(400, 300)), RemovalOptions(quality="pro", crop=True)
+    )
+
+    # Thumbnail localisation, then the padded centre crop of the mock mask.
+    assert seen == [(240, 320), (196, 260)]
+    assert {"decode", "locate", "inference", "refine", "encode"} <= set(result.timings)
+    with Image.open(BytesIO(result.data)) as img:
+        assert img.size == (400, 300)
+        alpha = np.asarray(img)[..., 3]
+    assert alpha[0, 0] == 0 and alpha[150, 200] == 255
 
+
+def test_preview_then_render_reuses_the_stored_mask(monkeypatch):
+    os.environ["PRO_MODEL_NAME"] = "mock"
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+
+    pipeline = BackgroundRemovalPipeline()
+    pipeline.preview_max_side = 100
+    calls = []
+    original = pipeline.pro_model.predict_mask
     monkeypatch.setattr(
-        pipeline,
-        "_remove_fast",
-        lambda _: _coarse_rgba_bytes(),
+        pipeline.pro_model,
+        "predict_mask",
+        lambda image, output_size=None, timings=None: calls.append(1)
+        or original(image, output_size),
     )
 
-    result, used_fallback = pipeline.remove_background(
-        _solid_image_bytes(),
-        quality="pro",
+    preview = pipeline.process(
+        _solid_image_bytes(size=(400, 300)), RemovalOptions(quality="pro", preview=True)
     )
+    full = pipeline.render(preview.image_id, RemovalOptions(output="webp"))
 
-    assert used_fallback is False
-    with Image.open(BytesIO(result)) as img:
-        assert img.mode == "RGBA"
-        assert img.size == (16, 16)
+    assert len(calls) == 1
+    assert preview.preview and full.media_type == "image/webp"
+    with Image.open(BytesIO(preview.data)) as img:
+        assert img.size == (100, 75)
+    with Image.open(BytesIO(full.data)) as img:
+        assert img.size == (400, 300)
+        alpha = np.asarray(img.convert("RGBA"))[..., 3]
+    assert alpha[0, 0] == 0 and alpha[150, 200] == 255
+
+
+def _mock_pipeline(monkeypatch):
+    monkeypatch.setenv("PRO_MODEL_NAME", "mock")
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+    return BackgroundRemovalPipeline()
+
+
+def test_readiness_waits_for_the_warmup_inferences(monkeypatch):
+    pipeline = _mock_pipeline(monkeypatch)
+    release = threading.Event()
+    original = pipeline._warm_up
+
+    def slow_warm_up(timings):
+        release.wait(timeout=5)
+        original(timings)
+
+    monkeypatch.setattr(pipeline, "_warm_up", slow_warm_up)
+    pipeline.start_warmup()
+    assert pipeline.status_snapshot()["status"] == "warming_up"
+
+    release.set()
+    pipeline._warmup_thread.join(timeout=5)
+    snapshot = pipeline.status_snapshot()
+    assert snapshot["status"] == "ok"
+    assert snapshot["warmup"]["state"] == "done"
+    stages = snapshot["warmup"]["stages_ms"]
+    assert {"load", "fast", "decode", "encode_png", "encode_webp"} <= set(stages)
+
+
+def test_onnx_warmup_runs_every_batch_size(monkeypatch):
+    monkeypatch.setenv("BATCH_MAX_SIZE", "3")
+    model = OnnxMaskModel(
+        name="echo",
+        spec={"filename": "echo.onnx", "size": (32, 32)},
+        device_request="cpu",
+        allow_download=False,
+    )
+
+    class _Session:
+        batches = []
+
+        def get_inputs(self):
+            return [SimpleNamespace(name="input", shape=["batch", 3, 32, 32])]
+
+        def run(self, _outputs, feeds):
+            self.batches.append(feeds["input"].shape[0])
+            return [feeds["input"][:, :1]]
+
+    model.session = _Session()
+    timings = StageTimings()
+    model.warmup(2, timings)
+
+    assert model.session.batches == [3, 3, 2, 2, 1, 1, 1]
+    assert {"pro_batch_3", "pro_batch_2", "pro_batch_1", "pro_predict"} <= set(timings.as_dict())
+
+
+def test_fast_tier_runs_the_shared_mask_stages(monkeypatch):
+    pipeline = _mock_pipeline(monkeypatch)
+
+    result = pipeline.process(
+        _solid_image_bytes(size=(40, 30)), RemovalOptions(quality="fast", output="webp")
+    )
+
+    assert {"decode", "inference", "refine", "encode"} <= set(result.timings)
+    assert "fast" not in result.timings
+    assert result.media_type == "image/webp" and result.image_id
+    with Image.open(BytesIO(result.data)) as img:
+        alpha = np.asarray(img.convert("RGBA"))[..., 3]
+    assert alpha.shape == (30, 40) and alpha[0, 0] == 0 and alpha[15, 20] == 255
+
+
+def test_pro_failure_falls_back_to_the_native_fast_tier(monkeypatch):
+    pipeline = _mock_pipeline(monkeypatch)
+
+    def broken(*_args, **_kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(pipeline.pro_model, "predict_mask", broken)
+    result = pipeline.process(_solid_image_bytes(), RemovalOptions(quality="pro"))
+
+    assert result.used_fallback and result.cache_status == "bypass"
+    assert "inference" in result.timings
+
+
+def test_preview_fallback_mask_is_refined_on_render(monkeypatch):
+    pipeline = _mock_pipeline(monkeypatch)
+    pipeline.preview_max_side = 100
+
+    def broken(*_args, **_kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(pipeline.pro_model, "predict_mask", broken)
+    preview = pipeline.process(
+        _solid_image_bytes(size=(400, 300)), RemovalOptions(quality="pro", preview=True)
+    )
+
+    assert preview.used_fallback and preview.preview
+    assert pipeline.mask_store.get(preview.image_id).coarse
+    full = pipeline.render(preview.image_id, RemovalOptions())
+    with Image.open(BytesIO(full.data)) as img:
+        assert img.size == (400, 300)
+        alpha = np.asarray(img.convert("RGBA"))[..., 3]
+    assert alpha[0, 0] == 0 and alpha[150, 200] == 255
+
+
+def test_fast_specs_are_untiled_and_not_served_as_pro(monkeypatch):
+    monkeypatch.setenv("TILE_MODE", "always")
+    spec = resolve_spec("u2netp")
+    model = OnnxMaskModel("u2netp", spec, device_request="cpu", allow_download=False)
+
+    assert model.input_size == (320, 320)
+    assert model.model_path.name == "u2netp.onnx"
+    assert model.tile_plan((4000, 1000)) is None
+    allowed = _mock_pipeline(monkeypatch).registry.allowed
+    assert "inspyrenet" in allowed and not {"u2net", "u2netp", "silueta"} & allowed
@@ -6,7 +6,7 @@ from PIL import Image
 
 os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
 
-from services.pipeline import composite_straight_alpha
+from services.pipeline import composite_straight_alpha, resolve_spec
 
 
 def test_composite_straight_alpha():
@@ -31,3 +31,13 @@ def test_composite_straight_alpha():
     np.testing.assert_array_equal(arr[..., :3], rgb)
     expected_alpha = (alpha * 255).astype(np.uint8)
     np.testing.assert_array_equal(arr[..., 3], expected_alpha)
+
+
+def test_int8_variant_inherits_base_preprocessing():
+    base = resolve_spec("birefnet-portrait")
+    variant = resolve_spec("birefnet-portrait-int8")
+
+    assert variant["mean"] == base["mean"]
+    assert variant["activation"] == "sigmoid"
+    assert variant["filename"] != base["filename"]
+    assert "url" not in variant
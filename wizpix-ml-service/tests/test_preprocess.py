@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.preprocess import Preprocessor
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def _legacy_prepare(image, size, mean, std):
+    pil = image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+    arr = np.asarray(pil).astype(np.float32)
+    arr = arr / max(float(np.max(arr)), 1e-6)
+    tmp = np.zeros_like(arr, dtype=np.float32)
+    for ch in range(3):
+        tmp[:, :, ch] = (arr[:, :, ch] - mean[ch]) / std[ch]
+    return np.expand_dims(tmp.transpose(2, 0, 1), 0).astype(np.float32)
+
+
+def _smooth_image(width, height):
+    xs = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    arr = np.stack([xs * 200 + ys * 0, ys * 180 + xs * 20, (xs + ys) * 100], axis=-1)
+    return Image.fromarray(arr.astype(np.uint8), mode="RGB")
+
+
+def test_preprocessor_matches_legacy_without_resize():
+    image = Image.fromarray(
+        np.random.default_rng(0).integers(0, 200, (32, 48, 3), dtype=np.uint8), mode="RGB"
+    )
+    tensor = Preprocessor((48, 32), MEAN, STD)(image)
+
+    np.testing.assert_allclose(tensor, _legacy_prepare(image, (48, 32), MEAN, STD), atol=1e-5)
+
+
+def test_preprocessor_matches_legacy_within_tolerance_when_resizing():
+    image = _smooth_image(300, 200)
+    tensor = Preprocessor((64, 64), MEAN, STD)(image)
+    legacy = _legacy_prepare(image, (64, 64), MEAN, STD)
+
+    assert tensor.shape == legacy.shape == (1, 3, 64, 64)
+    assert tensor.dtype == np.float32
+    assert float(np.max(np.abs(tensor - legacy))) < 0.1
+
+
+def test_preprocessor_reuses_its_buffer():
+    preprocessor = Preprocessor((16, 16))
+    first = preprocessor(_smooth_image(40, 30))
+    second = preprocessor(_smooth_image(20, 50))
+    assert first is second
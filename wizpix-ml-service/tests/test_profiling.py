@@ -0,0 +1,55 @@
+import cProfile
+import os
+from io import BytesIO
+
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.pipeline import BackgroundRemovalPipeline, RemovalOptions
+from services.profiling import ProfileSettings, write_cpu_profile
+from services.timing import server_timing
+
+
+def test_server_timing_lists_stages_then_total():
+    value = server_timing({"decode": 12.44, "pro inference": 3.0}, total_ms=20)
+    assert value == "decode;dur=12.4, pro_inference;dur=3.0, total;dur=20.0"
+
+
+def test_profiling_requires_the_configured_secret(tmp_path):
+    assert not ProfileSettings(secret=None).authorized("anything")
+    settings = ProfileSettings(secret="s3cret", directory=tmp_path)
+    assert settings.authorized("s3cret")
+    assert not settings.authorized("wrong") and not settings.authorized(None)
+
+
+def test_path_for_only_serves_plain_names_from_the_directory(tmp_path):
+    settings = ProfileSettings(secret="s3cret", directory=tmp_path / "profiles")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    sum(range(100))
+    profiler.disable()
+    trace = write_cpu_profile(profiler, settings.directory, "run")
+
+    assert settings.path_for("run.prof") == trace
+    assert settings.path_for("run.txt").read_text(encoding="utf-8")
+    assert settings.path_for("../run.prof") is None
+    assert settings.path_for("missing.prof") is None
+
+
+def test_process_profiled_bypasses_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("PRO_MODEL_NAME", "mock")
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+    pipeline = BackgroundRemovalPipeline()
+    buffer = BytesIO()
+    Image.new("RGB", (16, 16), (128, 64, 32)).save(buffer, format="PNG")
+
+    result, name = pipeline.process_profiled(
+        buffer.getvalue(), RemovalOptions(quality="pro"), "cpu", tmp_path
+    )
+
+    assert result.cache_status == "bypass"
+    assert "encode" in result.timings
+    assert (tmp_path / name).is_file() and name.endswith(".prof")
+    again = pipeline.process(buffer.getvalue(), RemovalOptions(quality="pro"))
+    assert again.cache_status == "miss"
@@ -0,0 +1,38 @@
+import os
+
+import cv2
+import numpy as np
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.refine import EdgeRefiner, refine_mask
+
+
+def _step_scene(width=400, height=300, edge=230):
+    rgb = np.full((height, width, 3), (30, 90, 200), dtype=np.uint8)
+    rgb[:, :edge] = (220, 180, 140)
+    truth = np.zeros((height, width), dtype=np.float32)
+    truth[:, :edge] = 1.0
+    # What a low-resolution model mask looks like once upscaled.
+    small = cv2.resize(truth, (width // 8, height // 8), interpolation=cv2.INTER_AREA)
+    coarse = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return rgb, np.clip(coarse, 0.0, 1.0), truth
+
+
+def test_guided_refinement_sharpens_the_edge_band_only():
+    rgb, coarse, truth = _step_scene()
+    refiner = EdgeRefiner(radius=24, tile=32)
+    refined = refiner(rgb, coarse)
+
+    band = refiner.band(coarse)
+    assert band.any() and not band.all()
+    np.testing.assert_array_equal(refined[~band], coarse[~band])
+    assert np.abs(refined - truth).mean() < 0.5 * np.abs(coarse - truth).mean()
+
+
+def test_refine_modes():
+    rgb, coarse, _ = _step_scene()
+    assert refine_mask(rgb, coarse, "none") is coarse
+    assert refine_mask(rgb, coarse, "blur").shape == coarse.shape
+    solid = np.ones_like(coarse)
+    assert refine_mask(rgb, solid, "guided") is solid
@@ -0,0 +1,115 @@
+import os
+import threading
+
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.cache import MB
+from services.registry import ModelRegistry, UnknownModelError
+
+
+class _FakeModel:
+    def __init__(self, name, ram_mb):
+        self.name = name
+        self.spec = {"ram_mb": ram_mb}
+        self.session = None
+        self.loads = 0
+
+    def ensure_loaded(self):
+        if self.session is None:
+            self.session = object()
+            self.loads += 1
+
+    def unload(self):
+        self.session = None
+
+
+SIZES = {"default": 100, "isnet": 300, "birefnet": 400, "tiny": 50}
+
+
+def _registry(budget_mb=0, allowed=None):
+    built = []
+
+    def factory(name):
+        built.append(name)
+        return _FakeModel(name, SIZES[name])
+
+    def resolve(name):
+        name = {"portrait": "birefnet"}.get(name, name)
+        if name not in SIZES:
+            raise KeyError(name)
+        return name
+
+    registry = ModelRegistry(
+        resolve=resolve,
+        factory=factory,
+        default="default",
+        allowed=allowed,
+        budget_bytes=budget_mb * MB,
+        pinned={"default"},
+    )
+    return registry, built
+
+
+def test_models_are_built_and_loaded_on_first_use():
+    registry, built = _registry()
+    assert registry.resolve(None) == "default"
+    assert registry.resolve("portrait") == "birefnet"
+    assert built == []
+
+    with registry.use("portrait") as model:
+        assert model.session is not None
+    with registry.use("birefnet") as again:
+        assert again is model
+    assert built == ["birefnet"] and model.loads == 1
+    stats = registry.snapshot()["models"]["birefnet"]
+    assert (stats["requests"], stats["loads"], stats["resident"]) == (2, 1, True)
+
+
+def test_unknown_and_disallowed_models_are_rejected():
+    registry, _ = _registry(allowed={"isnet"})
+    with pytest.raises(UnknownModelError):
+        registry.resolve("nope")
+    with pytest.raises(UnknownModelError):
+        registry.resolve("birefnet")
+    assert registry.resolve("default") == "default"
+
+
+def test_least_recently_used_sessions_are_evicted_under_the_budget():
+    registry, _ = _registry(budget_mb=800)
+    for name in ("default", "isnet", "tiny"):
+        registry.load(name)
+    registry.load("isnet")  # isnet is now more recent than tiny
+
+    registry.load("birefnet")  # 100 + 300 + 50 + 400 > 800: tiny goes first
+    assert registry.snapshot()["resident"] == ["default", "isnet", "birefnet"]
+
+    registry.load("tiny")  # 850 > 800: isnet is the oldest evictable one
+    snapshot = registry.snapshot()
+    assert snapshot["resident"] == ["default", "birefnet", "tiny"]
+    assert snapshot["models"]["isnet"]["evictions"] == 1
+    assert snapshot["models"]["default"]["evictions"] == 0
+    assert registry.model("isnet").session is None
+
+
+def test_models_in_use_are_not_evicted():
+    registry, _ = _registry(budget_mb=500)
+    release = threading.Event()
+    entered = threading.Event()
+
+    def hold():
+        with registry.use("isnet"):
+            entered.set()
+            release.wait(timeout=5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    entered.wait(timeout=5)
+    registry.load("birefnet")  # over budget, but isnet is running
+    assert registry.model("isnet").session is not None
+    release.set()
+    thread.join(timeout=5)
+
+    registry.load("tiny")
+    assert not registry.is_resident("isnet")
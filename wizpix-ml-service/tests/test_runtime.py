@@ -0,0 +1,74 @@
+import os
+from pathlib import Path
+
+import onnxruntime as ort
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.batching import MaskBatcher
+from services.runtime import SessionTuning
+
+
+def test_session_tuning_precedence(monkeypatch):
+    spec = {"session": {"intra_op_threads": 3, "execution_mode": "parallel"}}
+    monkeypatch.setenv("ORT_INTRA_OP_THREADS", "5")
+    monkeypatch.setenv("BIREFNET_PORTRAIT_ORT_INTRA_OP_THREADS", "2")
+
+    tuning = SessionTuning.resolve("birefnet-portrait", spec)
+    assert tuning.intra_op_threads == 2
+    assert tuning.execution_mode == "parallel"
+
+    other = SessionTuning.resolve("inspyrenet", spec)
+    assert other.intra_op_threads == 5
+
+    options = tuning.build_options()
+    assert options.intra_op_num_threads == 2
+    assert options.execution_mode == ort.ExecutionMode.ORT_PARALLEL
+
+
+def test_session_tuning_optimized_path(monkeypatch):
+    monkeypatch.delenv("ORT_GRAPH_OPTIMIZATION", raising=False)
+    tuning = SessionTuning.resolve("inspyrenet", {})
+    # "all" is CPU-specific: the persisted file stops at "extended".
+    assert tuning.persisted_level == "extended"
+    assert tuning.optimized_path(Path("/m/isnet.onnx")) == Path(
+        f"/m/isnet.opt-extended.ort{ort.__version__}.cpu.onnx"
+    )
+    assert tuning.optimized_path(
+        Path("/m/isnet.onnx"), "CUDAExecutionProvider"
+    ).name.endswith(".cuda.onnx")
+
+    monkeypatch.setenv("ORT_PERSIST_OPTIMIZED", "false")
+    assert SessionTuning.resolve("inspyrenet", {}).optimized_path(Path("/m/a.onnx")) is None
+
+    monkeypatch.setenv("ORT_GRAPH_OPTIMIZATION", "turbo")
+    with pytest.raises(ValueError):
+        SessionTuning.resolve("inspyrenet", {})
+
+
+def test_default_intra_op_threads_follow_concurrent_batches(monkeypatch):
+    for name in ("ORT_INTRA_OP_THREADS", "INSPYRENET_ORT_INTRA_OP_THREADS", "WORKER_POOL_KIND"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(os, "sched_getaffinity", lambda _pid: set(range(16)), raising=False)
+    monkeypatch.delenv("WORKER_POOL_SIZE", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    monkeypatch.setenv("BATCH_MAX_SIZE", "4")
+
+    # 16 scheduler threads share 4-image batches: 4 runs at once, 4 cores each.
+    batcher = MaskBatcher.from_env(lambda tensor: tensor)
+    assert batcher.enabled and batcher.max_batch_size == 4
+    assert SessionTuning.resolve("inspyrenet", {}).intra_op_threads == 4
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    assert SessionTuning.resolve("inspyrenet", {}).intra_op_threads == 2
+
+    monkeypatch.setenv("BATCH_MAX_SIZE", "1")
+    monkeypatch.setenv("WORKER_POOL_SIZE", "4")
+    assert SessionTuning.resolve("inspyrenet", {}).intra_op_threads == 2
+
+    # One session per pool process: no batching across them.
+    monkeypatch.setenv("WORKER_POOL_KIND", "process")
+    monkeypatch.setenv("BATCH_MAX_SIZE", "4")
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert SessionTuning.resolve("inspyrenet", {}).intra_op_threads == 4
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.scheduler import (
+    DEFAULT_LANE,
+    InferenceScheduler,
+    QueueFullError,
+    lane_for,
+    parse_plan_lanes,
+)
+
+
+class _BlockingPipeline:
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.threads = set()
+
+    def remove_background(self, data, quality="pro"):
+        self.threads.add(threading.current_thread().name)
+        self.release.wait(timeout=5)
+        return data, False
+
+
+def test_scheduler_rejects_when_queue_is_full():
+    pipeline = _BlockingPipeline()
+    scheduler = InferenceScheduler(pipeline, workers=1, max_queue=1, retry_after=3)
+    try:
+        running = scheduler.submit("remove_background", b"a")
+        queued = scheduler.submit("remove_background", b"b")
+        with pytest.raises(QueueFullError) as excinfo:
+            scheduler.submit("remove_background", b"c")
+        assert excinfo.value.retry_after == 3
+
+        snapshot = scheduler.snapshot()
+        assert snapshot["rejected"] == 1
+        assert snapshot["queue_depth"] + snapshot["in_flight"] == 2
+
+        pipeline.release.set()
+        assert running.result(timeout=5) == (b"a", False)
+        assert queued.result(timeout=5) == (b"b", False)
+    finally:
+        pipeline.release.set()
+        scheduler.shutdown()
+
+
+def test_scheduler_runs_off_the_event_loop():
+    pipeline = _BlockingPipeline()
+    scheduler = InferenceScheduler(pipeline, workers=2, max_queue=0)
+
+    async def _scenario():
+        task = asyncio.ensure_future(scheduler.run("remove_background", b"x"))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        pipeline.release.set()
+        return await task
+
+    try:
+        assert asyncio.run(_scenario()) == (b"x", False)
+        assert all(name.startswith("wizpix-worker") for name in pipeline.threads)
+        assert scheduler.snapshot()["completed"] == 1
+    finally:
+        scheduler.shutdown()
+
+
+class _RecordingPipeline(_BlockingPipeline):
+    def __init__(self) -> None:
+        super().__init__()
+        self.order = []
+
+    def remove_background(self, data, quality="pro"):
+        self.order.append(data)
+        return super().remove_background(data, quality)
+
+
+def test_higher_lanes_are_dispatched_first():
+    pipeline = _RecordingPipeline()
+    scheduler = InferenceScheduler(pipeline, workers=1, max_queue=8)
+    try:
+        running = scheduler.submit("remove_background", b"first", lane="low")
+        for _ in range(500):
+            if pipeline.order:
+                break
+            time.sleep(0.001)
+        futures = [
+            scheduler.submit("remove_background", b"low", lane="low"),
+            scheduler.submit("remove_background", b"normal", lane="normal"),
+            scheduler.submit("remove_background", b"high", lane="high"),
+        ]
+        pipeline.release.set()
+        for future in [running, *futures]:
+            future.result(timeout=5)
+        assert pipeline.order == [b"first", b"high", b"normal", b"low"]
+        lanes = scheduler.snapshot()["lanes"]
+        assert lanes["low"]["submitted"] == 2 and lanes["high"]["submitted"] == 1
+    finally:
+        pipeline.release.set()
+        scheduler.shutdown()
+
+
+def test_low_lane_cannot_fill_the_whole_queue():
+    pipeline = _BlockingPipeline()
+    scheduler = InferenceScheduler(pipeline, workers=1, max_queue=5)
+    try:
+        for _ in range(4):  # 1 running + ceil(5 * 0.6) waiting
+            scheduler.submit("remove_background", b"x", lane="low")
+        with pytest.raises(QueueFullError):
+            scheduler.submit("remove_background", b"x", lane="low")
+        scheduler.submit("remove_background", b"x", lane="high")
+        assert scheduler.snapshot()["lanes"]["low"]["rejected"] == 1
+    finally:
+        pipeline.release.set()
+        scheduler.shutdown()
+
+
+def test_estimate_counts_the_work_ahead_of_a_lane():
+    pipeline = _BlockingPipeline()
+    pipeline.release.set()
+    scheduler = InferenceScheduler(pipeline, workers=1, max_queue=8)
+    try:
+        assert scheduler.estimate_ms("high", "pro") is None
+        scheduler.submit("remove_background", b"x", tag="pro").result(timeout=5)
+        idle = scheduler.estimate_ms("low", "pro")
+        assert idle is not None and idle >= 0
+
+        pipeline.release.clear()
+        scheduler.submit("remove_background", b"x", lane="low", tag="pro")
+        scheduler.submit("remove_background", b"x", lane="low", tag="pro")
+        assert scheduler.estimate_ms("low", "pro") > scheduler.estimate_ms("high", "pro")
+    finally:
+        pipeline.release.set()
+        scheduler.shutdown()
+
+
+def test_cache_hits_do_not_lower_the_run_estimate():
+    class _CachingPipeline:
+        def process(self, cached):
+            if not cached:
+                time.sleep(0.05)
+            return SimpleNamespace(cache_status="hit" if cached else "miss")
+
+    scheduler = InferenceScheduler(_CachingPipeline(), workers=1)
+    try:
+        scheduler.submit("process", False, tag="pro").result(timeout=5)
+        measured = scheduler.estimate_ms("high", "pro")
+        for _ in range(5):
+            scheduler.submit("process", True, tag="pro").result(timeout=5)
+        assert measured >= 50 and scheduler.estimate_ms("high", "pro") == measured
+        # Nor do they pull down the average behind the queue estimates.
+        assert scheduler._model_runs == 1
+        assert scheduler._run_total_ms == pytest.approx(measured)
+    finally:
+        scheduler.shutdown()
+
+
+def test_process_workers_report_their_pipeline_state(monkeypatch, tmp_path):
+    monkeypatch.setenv("PRO_MODEL_NAME", "mock")
+    monkeypatch.setenv("FAST_MODEL_NAME", "mock")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    scheduler = InferenceScheduler(None, kind="process", workers=1)
+    try:
+        assert scheduler.worker_snapshots() == []
+        scheduler.start()
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            workers = scheduler.worker_snapshots()
+            if workers and workers[0]["warmup"]["state"] == "done":
+                break
+            time.sleep(0.05)
+        assert [worker["status"] for worker in workers] == ["ok"]
+        assert workers[0]["pid"] != os.getpid()
+        assert workers[0]["registry"]["models"]["mock"]["resident"]
+    finally:
+        scheduler.shutdown()
+
+
+def test_lane_for_plans_and_explicit_priorities():
+    assert lane_for(plan="Pro") == "high"
+    assert lane_for(plan="free") == "low"
+    assert lane_for(plan="unknown") == DEFAULT_LANE
+    assert lane_for(plan="free", priority="high") == "high"
+    assert lane_for() == DEFAULT_LANE
+    assert parse_plan_lanes("team=high, x=bogus") == {"team": "high"}
@@ -0,0 +1,67 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services.pipeline import OnnxMaskModel
+from services.tiling import TilePolicy, feather_weights
+
+
+class _EchoSession:
+    """Stands in for ORT: the 'mask' is the first input channel."""
+
+    def __init__(self, tile):
+        self.tile = tile
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input", shape=["batch", 3, self.tile, self.tile])]
+
+    def run(self, _outputs, feeds):
+        tensor = feeds["input"]
+        self.batches.append(tensor.shape[0])
+        return [tensor[:, :1].copy()]
+
+
+def test_policy_modes_and_tile_cap():
+    square = (2000, 2000)
+    panorama = (6000, 1500)
+    assert TilePolicy(mode="off").plan(panorama, 1024) is None
+    assert TilePolicy(mode="auto", min_detail=4.0).plan(square, 1024) is None
+
+    grid = TilePolicy(mode="auto", max_tiles=5, overlap=0.25).plan(panorama, 1024)
+    assert grid is not None and grid.count <= 5
+    assert grid.work_size[1] == 1024
+    assert grid.xs[0] == 0 and grid.xs[-1] + 1024 == grid.work_size[0]
+
+    roomy = TilePolicy(mode="auto", max_tiles=32).plan(panorama, 1024)
+    assert roomy is not None and roomy.scale == 1.0
+    assert TilePolicy(mode="auto", max_tiles=2).plan((20000, 1000), 1024) is None
+
+
+def test_feather_weights_fade_towards_the_borders():
+    weights = feather_weights(16, 4)
+    assert weights[8, 8] == 1.0
+    assert 0 < weights[0, 8] < weights[2, 8] < 1.0
+
+
+def test_tiled_prediction_blends_into_a_seamless_mask(monkeypatch):
+    monkeypatch.setenv("TILE_MODE", "always")
+    monkeypatch.setenv("BATCH_MAX_SIZE", "2")
+    model = OnnxMaskModel(
+        name="echo",
+        spec={"filename": "echo.onnx", "size": (64, 64)},
+        device_request="cpu",
+        allow_download=False,
+    )
+    model.session = _EchoSession(64)
+
+    ramp = np.tile(np.linspace(0, 250, 200, dtype=np.float32)[None, :, None], (64, 1, 3))
+    mask = model.predict_mask(ramp.astype(np.uint8), output_size=(100, 32))
+
+    assert model.session.batches == [2, 2]
+    assert mask.shape == (32, 100)
+    expected = np.linspace(0.0, 1.0, 100, dtype=np.float32)
+    np.testing.assert_allclose(mask[16], expected, atol=0.02)
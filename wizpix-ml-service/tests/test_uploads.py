@@ -0,0 +1,126 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+os.environ["WIZPIX_SKIP_PIPELINE_INIT"] = "1"
+
+from services import uploads
+from services.uploads import (
+    BodySizeLimitMiddleware,
+    UploadError,
+    check_image,
+    max_pixels_for,
+    parse_plan_megapixels,
+    read_upload,
+)
+
+
+def _encoded(size, fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.new("L", size).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class _Upload:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+        self.reads = 0
+
+    async def read(self, size=-1):
+        self.reads += 1
+        return self.stream.read(size)
+
+
+def test_plan_megapixels_and_default(monkeypatch):
+    assert parse_plan_megapixels("Free=12, pro=50,broken=x,zero=0") == {"free": 12.0, "pro": 50.0}
+    monkeypatch.setattr(uploads, "PLAN_MEGAPIXELS", {"pro": 50.0})
+    monkeypatch.setenv("MAX_IMAGE_MEGAPIXELS", "8")
+    assert max_pixels_for("PRO") == 50_000_000
+    assert max_pixels_for("enterprise") == 8_000_000
+    assert max_pixels_for(None) == 8_000_000
+
+
+def test_read_upload_stops_at_the_first_chunk_over_the_limit():
+    upload = _Upload(b"x" * 100)
+    assert asyncio.run(read_upload(upload, max_bytes=100, chunk_size=30)) == b"x" * 100
+
+    upload = _Upload(b"x" * 1000)
+    with pytest.raises(UploadError) as error:
+        asyncio.run(read_upload(upload, max_bytes=100, chunk_size=30))
+    assert error.value.status_code == 413
+    assert upload.reads == 4
+
+
+def test_check_image_reads_only_the_header():
+    header = check_image(_encoded((300, 200)), max_pixels=60_000)
+    assert (header.format, header.width, header.height) == ("PNG", 300, 200)
+
+    # 64 MP of zeros compresses to a few KB: rejected before any decode.
+    bomb = _encoded((8_000, 8_000))
+    assert len(bomb) < 200_000
+    with pytest.raises(UploadError) as error:
+        check_image(bomb, max_pixels=50_000_000)
+    assert error.value.status_code == 413
+
+    with pytest.raises(UploadError) as error:
+        check_image(_encoded((10, 10), "GIF"), max_pixels=1_000)
+    assert error.value.status_code == 415
+    with pytest.raises(UploadError) as error:
+        check_image(b"not an image", max_pixels=1_000)
+    assert error.value.status_code == 400
+
+
+async def _call(middleware, headers, chunks):
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/upload", "headers": headers}
+    await middleware(scope, receive, send)
+    return sent, messages
+
+
+def _echo_app():
+    async def app(scope, receive, send):
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                status = 400
+                break
+            size += len(message.get("body", b""))
+            if not message.get("more_body"):
+                status = 200
+                break
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": str(size).encode()})
+
+    return app
+
+
+def test_middleware_rejects_on_content_length_and_running_count():
+    middleware = BodySizeLimitMiddleware(
+        _echo_app(), lambda path: 100 if path == "/upload" else None
+    )
+
+    sent, pending = asyncio.run(_call(middleware, [(b"content-length", b"500")], [b"x" * 500]))
+    assert sent[0]["status"] == 413
+    assert pending, "the body must not be read"
+
+    sent, pending = asyncio.run(_call(middleware, [], [b"x" * 60] * 5))
+    assert [message.get("status") for message in sent if "status" in message] == [413]
+    assert len(pending) == 3
+
+    sent, _ = asyncio.run(_call(middleware, [], [b"x" * 60]))
+    assert sent[0]["status"] == 200 and sent[1]["body"] == b"60"